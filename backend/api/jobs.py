@@ -0,0 +1,78 @@
+from fastapi import APIRouter, HTTPException, Query, Header
+from fastapi.responses import Response
+import time
+import asyncio
+import logging
+from typing import Optional
+
+import orjson
+
+from models.recipe import RecipeGenerationRequest
+from services import job_queue, user_profile
+from services.idempotency import run_idempotent
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# How often a waiting GET /jobs/{id} re-reads the job
+JOB_STATUS_POLL_SECONDS = 0.25
+
+FINISHED = (job_queue.SUCCEEDED, job_queue.FAILED)
+
+def _require_jobs():
+    if not job_queue.JOBS_ENABLED or not user_profile.redis_client:
+        raise HTTPException(status_code=503, detail="Job mode is not enabled")
+
+@router.post("/jobs/generate-recipe", status_code=202)
+async def enqueue_generate_recipe(request: RecipeGenerationRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Queue a recipe generation for the worker processes and return its job ID.
+    Poll GET /api/jobs/{job_id}, optionally with wait, for the result.
+    """
+    _require_jobs()
+
+    async def _enqueue() -> bytes:
+        job_id = await job_queue.enqueue_job(job_queue.GENERATE_RECIPE, request.dict())
+        logger.info(f"Queued recipe generation job {job_id} for user: {request.user_id}")
+        return orjson.dumps({'job_id': job_id, 'status': job_queue.QUEUED, 'status_url': f"/api/jobs/{job_id}"})
+
+    try:
+        body, replayed = await run_idempotent(idempotency_key, f"jobs:{request.user_id or 'anonymous'}", request.dict(), _enqueue)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error queuing recipe generation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue recipe generation: {str(e)}")
+
+    headers = {'Location': orjson.loads(body)['status_url']}
+    if replayed:
+        headers['Idempotent-Replayed'] = 'true'
+    return Response(content=body, status_code=202, media_type="application/json", headers=headers)
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the job to finish")):
+    """
+    Job status, with the RecipeGenerationResponse once it succeeded. With
+    wait, the request is held until the job finishes or the wait runs out.
+    """
+    _require_jobs()
+
+    deadline = time.monotonic() + wait
+    job = await job_queue.get_job(job_id)
+    while job is not None and job['status'] not in FINISHED and time.monotonic() < deadline:
+        await asyncio.sleep(JOB_STATUS_POLL_SECONDS)
+        job = await job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    status = orjson.dumps({
+        'job_id': job_id,
+        'status': job['status'],
+        'attempts': int(job.get('attempts', 0)),
+        'created_at': float(job['created_at']),
+        'updated_at': float(job['updated_at']),
+        'error': job.get('error') if job['status'] != job_queue.SUCCEEDED else None
+    })
+    # The stored response is spliced in as is rather than decoded and re-encoded
+    body = status[:-1] + b',"result":' + job.get('result', b'null') + b'}'
+    return Response(content=body, media_type="application/json")
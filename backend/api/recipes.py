@@ -1,9 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Header
+from fastapi.responses import JSONResponse, Response
+import os
+import time
+import asyncio
 import logging
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
+
+import orjson
 
 from models.recipe import (
     RecipeGenerationRequest, 
@@ -12,25 +17,77 @@ from models.recipe import (
     RecipeIngredient,
     RecipeInstruction
 )
-from services.database import store_generated_recipe, get_base_recipes
-from services.user_profile import get_user_profile, update_user_profile
+from azure.cosmos.exceptions import CosmosHttpResponseError
+
+from services.database import store_generated_recipe, get_user_recipes as fetch_user_recipes, BASE_RECIPE_ID_PREFIX
+from services.user_profile import get_user_profile, record_recipe_history
+from services.recipe_history import COOKED, SAVED, HISTORY_CACHE_LIMIT, get_history
 from services.ai_integrations import (
     call_azure_ai_language,
     call_azure_openai_generative_ai,
-    call_azure_openai_dalle
+    call_azure_openai_dalle,
+    FALLBACK_RECIPE_TEXT,
+    FALLBACK_IMAGE_URL
+)
+from services.recommendation import convert_to_generated_recipe, extract_spice_level, stored_derivation
+from services.catalog import get_catalog
+from services.collaborative import personalized_boosts
+from services import similar_recipes, ai_usage
+from services.recipe_reuse import find_reusable_recipe, index_for_reuse
+from services.pregeneration import take_pregenerated
+from services.model_routing import route_generation
+from services.idempotency import run_idempotent
+from services.metrics import stage_timer
+from services.recipe_cache import get_cached_recipe, encode_recipe, cache_encoded_recipe
+from services.generation_cache import (
+    generation_cache_key,
+    take_cached_generation,
+    start_generation,
+    cache_when_done
 )
-from services.recommendation import get_recommended_recipes
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# End-to-end latency budget for recipe generation
+LATENCY_BUDGET_SECONDS = float(os.getenv('RECIPE_LATENCY_BUDGET_MS', '8000')) / 1000
+
+# Browser cache lifetimes for GET /recipes/{id}
+GENERATED_RECIPE_MAX_AGE_SECONDS = int(os.getenv('GENERATED_RECIPE_MAX_AGE_SECONDS', '86400'))
+BASE_RECIPE_MAX_AGE_SECONDS = int(os.getenv('BASE_RECIPE_MAX_AGE_SECONDS', '300'))
+
 @router.post("/generate-recipe", response_model=RecipeGenerationResponse)
-async def generate_recipe(request: RecipeGenerationRequest):
+async def generate_recipe(request: RecipeGenerationRequest, idempotency_key: Optional[str] = Header(None)):
     """
     Generate a personalized recipe based on user preferences and available ingredients.
+
+    The response is assembled from pre-encoded JSON rather than through
+    response_model: catalog recommendations are encoded once per catalog
+    version, and the recipe is encoded once for the response and the cache.
+
+    Retries that send the same Idempotency-Key attach to the first attempt
+    while it runs and get its stored response afterwards.
+    """
+    body, replayed = await run_idempotent(
+        idempotency_key, request.user_id or 'anonymous', request.dict(), lambda: build_generation_response(request)
+    )
+    headers = {'Idempotent-Replayed': 'true'} if replayed else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def build_generation_response(
+    request: RecipeGenerationRequest,
+    latency_budget: Optional[float] = LATENCY_BUDGET_SECONDS
+) -> bytes:
+    """
+    Run the generation pipeline and return the encoded RecipeGenerationResponse.
+    latency_budget bounds the wait for the LLM before degrading; None waits
+    for it, as job workers do.
     """
     try:
+        request_start = time.monotonic()
         logger.info(f"Received recipe generation request for user: {request.user_id}")
+        # AI usage from here on, including background generation started below, is charged to this user
+        ai_usage.current_user.set(request.user_id)
         
         # Step 1: Get user profile for personalization
         user_profile = None
@@ -48,73 +105,140 @@ async def generate_recipe(request: RecipeGenerationRequest):
         Available Ingredients: {', '.join(request.preferences.available_ingredients)}
         """
         
-        nlp_insights = await call_azure_ai_language(user_input_text)
+        with stage_timer('nlp'):
+            nlp_insights = await call_azure_ai_language(user_input_text)
         logger.info("NLP processing completed")
         
         # Step 3: Get base recipes for recommendations
-        base_recipes = await get_base_recipes()
+        catalog = await get_catalog()
         
-        # Step 4: Get recipe recommendations
-        recommendations = await get_recommended_recipes(
+        # Step 4: Get recipe recommendations, boosted towards recipes like the ones the user cooked or saved
+        top_recipes = catalog.select(
             user_preferences=request.preferences,
             dietary_restrictions=request.preferences.dietary_restrictions,
             available_ingredients=request.preferences.available_ingredients,
             user_profile=user_profile,
-            all_base_recipes=base_recipes
+            boosts=await personalized_boosts(user_profile)
         )
-        logger.info(f"Generated {len(recommendations)} recommendations")
-        
-        # Step 5: Generate recipe with AI
-        recipe_prompt = construct_recipe_prompt(request.preferences, nlp_insights, user_profile)
-        generated_recipe_text = await call_azure_openai_generative_ai(recipe_prompt)
-        
-        # Step 6: Parse the generated recipe
-        parsed_recipe = parse_generated_recipe(generated_recipe_text)
+        recommendation_fragments = catalog.recommendation_fragments(top_recipes)
         
-        # Step 7: Generate recipe image
-        image_prompt = f"Delicious {parsed_recipe['title']} with Yippee noodles, professional food photography, appetizing presentation"
-        image_url = await call_azure_openai_dalle(image_prompt)
-        
-        # Step 8: Create final recipe object
+        # Step 5: Take a recipe pre-generated off-peak, reuse a stored recipe generated for a
+        # near-identical request, or generate one with AI within the latency budget
+        degraded = False
         recipe_id = str(uuid.uuid4())
-        final_recipe = GeneratedRecipe(
-            id=recipe_id,
-            title=parsed_recipe['title'],
-            description=parsed_recipe.get('description'),
-            ingredients=parsed_recipe['ingredients'],
-            instructions=parsed_recipe['instructions'],
-            cooking_time=parsed_recipe['cooking_time'],
-            difficulty=parsed_recipe.get('difficulty', 'Medium'),
-            cuisine=request.preferences.cuisine.value,
-            spice_level=request.preferences.spice_level.value,
-            image_url=image_url,
-            tags=parsed_recipe.get('tags', []),
-            created_at=datetime.utcnow().isoformat(),
-            user_id=request.user_id
-        )
+        image_url = None
+        reusable_recipe = None
+        # The prompt includes the user's profile, so a generation written for it stays with that user
+        cache_key = generation_cache_key(request.preferences, request.user_id if user_profile else None)
+        generated_recipe_text = None
+        disliked_ingredients = (user_profile or {}).get('disliked_ingredients')
+        pregenerated = await take_pregenerated(request.preferences, disliked_ingredients)
+        if pregenerated is not None:
+            generated_recipe_text, image_url = pregenerated['recipe_text'], pregenerated['image_url']
+        else:
+            reusable_recipe = await find_reusable_recipe(request.preferences, request.user_id, disliked_ingredients)
+        if reusable_recipe is None and generated_recipe_text is None:
+            generated_recipe_text = await take_cached_generation(cache_key)
+        over_budget = False
+        if reusable_recipe is None and generated_recipe_text is None:
+            # Over a token budget, serve the degraded catalog recipe without calling the LLM or DALL-E
+            over_budget = await ai_usage.enforce_budget(request.user_id)
+            degraded = over_budget
+        if reusable_recipe is None and generated_recipe_text is None and not over_budget:
+            recipe_prompt = construct_recipe_prompt(request.preferences, nlp_insights, user_profile)
+            routing = await route_generation(request.preferences, user_profile)
+            generation = start_generation(cache_key, call_azure_openai_generative_ai(recipe_prompt, routing))
+            remaining_budget = None if latency_budget is None else max(latency_budget - (time.monotonic() - request_start), 0)
+            try:
+                generated_recipe_text = await asyncio.wait_for(asyncio.shield(generation), timeout=remaining_budget)
+            except asyncio.TimeoutError:
+                # Let the LLM finish in the background for the next matching request
+                logger.warning(f"Recipe generation exceeded latency budget of {latency_budget}s, serving degraded recipe")
+                cache_when_done(cache_key, generation, skip_text=FALLBACK_RECIPE_TEXT)
+                degraded = True
+            if generated_recipe_text == FALLBACK_RECIPE_TEXT:
+                # The LLM failed before the budget ran out; degrade the same way as on a timeout
+                logger.warning("Recipe generation failed, serving degraded recipe")
+                degraded = True
+        
+        if reusable_recipe is not None:
+            # Step 6-8 (reused): Copy the stored recipe for this user, skipping the LLM and DALL-E
+            final_recipe = personalize_reused_recipe(reusable_recipe, recipe_id, request)
+        elif degraded and top_recipes:
+            # Step 6-8 (degraded): Synthesize from the top-ranked catalog recipe
+            final_recipe = synthesize_recipe_from_catalog(catalog.recipe(top_recipes[0]), recipe_id, request)
+        else:
+            if degraded:
+                generated_recipe_text = FALLBACK_RECIPE_TEXT
+            
+            # Step 6: Parse the generated recipe
+            with stage_timer('parse'):
+                parsed_recipe = parse_generated_recipe(generated_recipe_text)
+            
+            # Step 7: Generate recipe image, unless it was pre-generated with the text
+            if image_url is None and degraded:
+                image_url = FALLBACK_IMAGE_URL
+            if image_url is None:
+                image_prompt = f"Delicious {parsed_recipe['title']} with Yippee noodles, professional food photography, appetizing presentation"
+                image_url = await call_azure_openai_dalle(image_prompt)
+            
+            # Step 8: Create final recipe object
+            final_recipe = GeneratedRecipe(
+                id=recipe_id,
+                title=parsed_recipe['title'],
+                description=parsed_recipe.get('description'),
+                ingredients=parsed_recipe['ingredients'],
+                instructions=parsed_recipe['instructions'],
+                cooking_time=parsed_recipe['cooking_time'],
+                difficulty=parsed_recipe.get('difficulty', 'Medium'),
+                cuisine=request.preferences.cuisine.value,
+                spice_level=request.preferences.spice_level.value,
+                image_url=image_url,
+                tags=parsed_recipe.get('tags', []),
+                created_at=datetime.utcnow().isoformat(),
+                user_id=request.user_id
+            )
         
-        # Step 9: Store the generated recipe
-        await store_generated_recipe(final_recipe.dict())
+        # Step 9: Store the generated recipe and prime the read cache for the follow-up fetch
+        recipe_document = final_recipe.dict()
+        await store_generated_recipe(recipe_document)
+        similar_recipes.index_generated_recipe(recipe_document)
+        if reusable_recipe is None and not degraded and generated_recipe_text != FALLBACK_RECIPE_TEXT:
+            await index_for_reuse(recipe_document, request.preferences)
+        with stage_timer('serialize'):
+            etag, recipe_body = encode_recipe(recipe_document)
+        await cache_encoded_recipe(recipe_id, etag, recipe_body)
         
-        # Step 10: Update user profile with new recipe
+        # Step 10: Record the recipe in the user's history and patch the profile
         if request.user_id:
-            await update_user_profile(request.user_id, {
-                'cooking_history': [recipe_id],
-                'preferences': request.preferences.dict()
-            })
+            # The top recommendation stands in for the generated recipe in collaborative filtering
+            base_recipe_id = catalog.recipe(top_recipes[0]).get('id') if top_recipes else None
+            await record_recipe_history(
+                request.user_id, COOKED, recipe_id,
+                preferences=request.preferences.dict(), base_recipe_id=base_recipe_id
+            )
         
         logger.info(f"Successfully generated recipe: {recipe_id}")
         
-        return RecipeGenerationResponse(
-            recipe=final_recipe,
-            recommendations=recommendations,
-            nlp_insights=nlp_insights
-        )
+        with stage_timer('serialize'):
+            return encode_generation_response(recipe_body, recommendation_fragments, nlp_insights, degraded)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating recipe: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate recipe: {str(e)}")
 
+def encode_generation_response(recipe_body: bytes, recommendation_fragments: List[bytes], nlp_insights, degraded: bool) -> bytes:
+    """Splice pre-encoded parts into a RecipeGenerationResponse document"""
+    return b''.join((
+        b'{"recipe":', recipe_body,
+        b',"recommendations":[', b','.join(recommendation_fragments),
+        b'],"nlp_insights":', orjson.dumps(nlp_insights, default=str),
+        b',"degraded":', b'true' if degraded else b'false',
+        b'}'
+    ))
+
 def construct_recipe_prompt(preferences, nlp_insights, user_profile):
     """
     Construct a detailed prompt for the generative AI based on user preferences and NLP insights.
@@ -135,7 +259,7 @@ def construct_recipe_prompt(preferences, nlp_insights, user_profile):
     - Key phrases: {nlp_insights.get('key_phrases', [])}
     - Sentiment: {nlp_insights.get('sentiment', 'neutral')}
     
-    USER PROFILE: {user_profile.dict() if user_profile else 'New user'}
+    USER PROFILE: {user_profile if user_profile else 'New user'}
     
     REQUIREMENTS:
     1. The recipe MUST use Yippee! noodles or pasta as the main ingredient
@@ -165,6 +289,35 @@ def construct_recipe_prompt(preferences, nlp_insights, user_profile):
     
     return prompt
 
+def synthesize_recipe_from_catalog(catalog_recipe: dict, recipe_id: str, request: RecipeGenerationRequest) -> GeneratedRecipe:
+    """
+    Build a degraded recipe from a recommended catalog recipe when the LLM fails or misses its deadline.
+    The catalog recipe keeps its own cuisine and spice level.
+    """
+    base_recipe = convert_to_generated_recipe(catalog_recipe)
+    derived = stored_derivation(catalog_recipe)
+    spice_level = derived['spice'] if derived else extract_spice_level(catalog_recipe)
+    return base_recipe.copy(update={
+        'id': recipe_id,
+        'spice_level': spice_level.title(),
+        'tags': base_recipe.tags + ['degraded'],
+        'created_at': datetime.utcnow().isoformat(),
+        'user_id': request.user_id
+    })
+
+def personalize_reused_recipe(stored_recipe: dict, recipe_id: str, request: RecipeGenerationRequest) -> GeneratedRecipe:
+    """
+    Copy a recipe generated for another user's near-identical request into a new recipe for this user.
+    """
+    recipe = {key: value for key, value in stored_recipe.items() if key in GeneratedRecipe.__fields__}
+    recipe.update({
+        'id': recipe_id,
+        'created_at': datetime.utcnow().isoformat(),
+        'user_id': request.user_id,
+        'reused_from': stored_recipe['id']
+    })
+    return GeneratedRecipe(**recipe)
+
 def parse_generated_recipe(recipe_text: str) -> dict:
     """
     Parse the generated recipe text into structured data.
@@ -245,27 +398,131 @@ def parse_generated_recipe(recipe_text: str) -> dict:
     return recipe_data
 
 @router.get("/recipes/{recipe_id}")
-async def get_recipe(recipe_id: str):
+async def get_recipe(recipe_id: str, request: Request, user_id: Optional[str] = Query(None, description="Owner of a generated recipe; enables a point read")):
     """
     Retrieve a specific recipe by ID.
+
+    Recipes are immutable once written, so responses carry a strong ETag and
+    long-lived Cache-Control; a matching If-None-Match gets a bodyless 304.
     """
     try:
-        # This would typically fetch from the database
-        # For now, return a mock response
-        raise HTTPException(status_code=404, detail="Recipe not found")
+        cached = await get_cached_recipe(recipe_id, user_id=user_id)
+        if cached is None:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+
+        etag, body = cached
+        headers = {"ETag": etag, "Cache-Control": recipe_cache_control(recipe_id)}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving recipe {recipe_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve recipe: {str(e)}")
 
+@router.get("/recipes/{recipe_id}/similar")
+async def get_similar_recipes(
+    recipe_id: str,
+    limit: int = Query(10, ge=1, le=50, description="Similar recipes to return"),
+    user_id: Optional[str] = Query(None, description="Owner of a generated recipe; enables a point read")
+):
+    """
+    Find base and generated recipes similar to a recipe, by title words,
+    cuisine, tags and ingredients. Answers 503 until this worker has built
+    its index.
+    """
+    index = similar_recipes.similar_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Similar recipes index is still building", headers={"Retry-After": "5"})
+    try:
+        with stage_timer('similar'):
+            similar = index.similar(recipe_id, limit)
+        if similar is None:
+            # Not indexed yet, e.g. stored by another worker since the last sync
+            cached = await get_cached_recipe(recipe_id, user_id=user_id)
+            if cached is None:
+                raise HTTPException(status_code=404, detail="Recipe not found")
+            with stage_timer('similar'):
+                similar = index.similar(recipe_id, limit, recipe=orjson.loads(cached[1]))
+        return {"recipe_id": recipe_id, "similar": similar}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error finding recipes similar to {recipe_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to find similar recipes: {str(e)}")
+
+def recipe_cache_control(recipe_id: str) -> str:
+    """Generated recipes never change; catalog recipes can be edited, so they revalidate sooner"""
+    if recipe_id.startswith(BASE_RECIPE_ID_PREFIX):
+        return f"public, max-age={BASE_RECIPE_MAX_AGE_SECONDS}"
+    return f"private, max-age={GENERATED_RECIPE_MAX_AGE_SECONDS}, immutable"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
+
 @router.get("/user/{user_id}/recipes")
-async def get_user_recipes(user_id: str, limit: int = 10):
+async def get_user_recipes(
+    user_id: str,
+    page_size: Optional[int] = Query(None, ge=1, description="Recipes per page"),
+    continuation_token: Optional[str] = Query(None, description="Token from the previous page")
+):
     """
-    Retrieve recipes generated by a specific user.
+    Retrieve recipes generated by a specific user, newest first.
+
+    Pass the returned continuation_token to fetch the next page; it is null on
+    the last page.
     """
     try:
-        # This would typically fetch from the database
-        # For now, return a mock response
-        return {"recipes": [], "user_id": user_id}
+        page = await fetch_user_recipes(user_id, page_size=page_size, continuation_token=continuation_token)
+        return {
+            "recipes": page["items"],
+            "user_id": user_id,
+            "continuation_token": page["continuation_token"]
+        }
+    except CosmosHttpResponseError as e:
+        if e.status_code == 400 and continuation_token:
+            raise HTTPException(status_code=400, detail="Invalid continuation token")
+        logger.error(f"Error retrieving recipes for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve user recipes: {str(e)}")
     except Exception as e:
         logger.error(f"Error retrieving recipes for user {user_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to retrieve user recipes: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve user recipes: {str(e)}")
+
+@router.get("/user/{user_id}/history")
+async def get_user_history(
+    user_id: str,
+    kind: str = Query(COOKED, pattern=f"^({COOKED}|{SAVED})$", description="cooked or saved"),
+    limit: int = Query(50, ge=1, le=HISTORY_CACHE_LIMIT, description="Most recent entries to return")
+):
+    """
+    IDs of the recipes a user most recently cooked (generated) or saved,
+    newest first, served from the Redis history cache.
+    """
+    try:
+        return {
+            "user_id": user_id,
+            "kind": kind,
+            "recipe_ids": await get_history(user_id, kind, limit)
+        }
+    except Exception as e:
+        logger.error(f"Error retrieving {kind} history for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve recipe history: {str(e)}")
+
+@router.get("/user/{user_id}/usage")
+async def get_user_usage(user_id: str):
+    """
+    Today's AI usage for a user (calls, tokens, images, Language documents
+    and priced cost) with the remaining daily token budget, if one is set.
+    """
+    try:
+        return await ai_usage.usage_report(user_id)
+    except Exception as e:
+        logger.error(f"Error retrieving AI usage for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve AI usage: {str(e)}")
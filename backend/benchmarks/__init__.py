@@ -0,0 +1 @@
+# Benchmarks for ITC Yippee Recipe Generator 
\ No newline at end of file
@@ -0,0 +1 @@
+# Catalog snapshot cold-start and memory benchmark 
\ No newline at end of file
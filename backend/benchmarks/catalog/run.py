@@ -0,0 +1,174 @@
+"""
+Cold-start and memory benchmark for the catalog snapshot format.
+
+For each catalog size, fresh processes load the same seeded synthetic catalog
+in two forms and record how long until the first recommendation is ready and
+how much memory the catalog holds:
+
+- dicts: parse the catalog from JSON into a list of recipe dicts, which is
+  what get_base_recipes hands back (Cosmos DB network time excluded), and
+  score it with select_recommendations
+- snapshot: memory-map the exported snapshot file and score it with
+  select_from_catalog
+
+Both forms must pick the same recipes; a mismatch fails the run.
+
+    python -m benchmarks.catalog.run --sizes 10000,100000 --output catalog.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, Any, List
+
+import orjson
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FORMS = ('dicts', 'snapshot')
+
+def memory_usage() -> Dict[str, int]:
+    """Resident bytes, and the anonymous part of them that no other worker can share"""
+    usage = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('Rss', 'Anonymous'):
+                usage[name.lower()] = int(value.split()[0]) * 1024
+    return usage
+
+def measure_child(form: str, path: str, profile_path: str, seed: int) -> Dict[str, Any]:
+    """Runs in a fresh process; everything except the catalog itself is imported first"""
+    from benchmarks.micro import datasets
+    from services.catalog_store import load_snapshot
+    from services.recommendation import select_recommendations, select_from_catalog
+
+    with open(profile_path) as f:
+        profile = json.load(f)
+    query = {
+        'user_preferences': datasets.synthetic_preferences(seed),
+        'dietary_restrictions': [],
+        'available_ingredients': datasets.synthetic_pantry(5, seed),
+        'user_profile': profile
+    }
+
+    before = memory_usage()
+    started = time.perf_counter()
+    if form == 'dicts':
+        with open(path, 'rb') as f:
+            recipes = orjson.loads(f.read())
+        loaded = time.perf_counter()
+        selected = [recipe['id'] for recipe in select_recommendations(all_base_recipes=recipes, **query)]
+    else:
+        columns = load_snapshot(path)
+        loaded = time.perf_counter()
+        selected = [columns.string('id', index) for index in select_from_catalog(columns, **query)]
+    first = time.perf_counter()
+    after = memory_usage()
+
+    return {
+        'load_ms': (loaded - started) * 1000,
+        'first_recommendation_ms': (first - started) * 1000,
+        'rss_mb': (after['rss'] - before['rss']) / 2**20,
+        'anonymous_mb': (after['anonymous'] - before['anonymous']) / 2**20,
+        'selected': selected
+    }
+
+def run_child(form: str, path: str, profile_path: str, seed: int) -> Dict[str, Any]:
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.catalog.run', '--child', form, path, profile_path, '--seed', str(seed)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def prepare(size: int, seed: int, directory: str) -> Dict[str, Any]:
+    """Write the catalog as JSON and as a snapshot, timing the export"""
+    from benchmarks.micro import datasets
+    from services.catalog import catalog_version
+    from services.catalog_store import build_snapshot, write_snapshot
+
+    catalog = datasets.synthetic_catalog(size, seed)
+    paths = {
+        'dicts': os.path.join(directory, f"catalog-{size}.json"),
+        'snapshot': os.path.join(directory, f"catalog-{size}.bin"),
+        'profile': os.path.join(directory, f"profile-{size}.json")
+    }
+    with open(paths['dicts'], 'wb') as f:
+        f.write(orjson.dumps(catalog))
+    with open(paths['profile'], 'w') as f:
+        json.dump(datasets.synthetic_profile(catalog, seed), f)
+
+    started = time.perf_counter()
+    write_snapshot(paths['snapshot'], build_snapshot(catalog, catalog_version(catalog)))
+    export_seconds = time.perf_counter() - started
+
+    return {
+        'paths': paths,
+        'export_seconds': round(export_seconds, 3),
+        'file_mb': {form: round(os.path.getsize(paths[form]) / 2**20, 2) for form in FORMS}
+    }
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, float]:
+    return {
+        key: round(statistics.median(run[key] for run in runs), 2)
+        for key in ('load_ms', 'first_recommendation_ms', 'rss_mb', 'anonymous_mb')
+    }
+
+def run(args) -> Dict[str, Any]:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            prepared = prepare(size, args.seed, directory)
+            forms = {}
+            selections = set()
+            for form in FORMS:
+                runs = [run_child(form, prepared['paths'][form], prepared['paths']['profile'], args.seed)
+                        for _ in range(args.runs)]
+                selections.update(tuple(run['selected']) for run in runs)
+                forms[form] = summarize(runs)
+            if len(selections) != 1:
+                raise SystemExit(f"Recommendations differ between forms at {size} recipes: {sorted(selections)}")
+
+            results[str(size)] = {
+                'export_seconds': prepared['export_seconds'],
+                'file_mb': prepared['file_mb'],
+                **forms
+            }
+            print(f"{size:>8} recipes  " + "  ".join(
+                f"{form}: first={forms[form]['first_recommendation_ms']:.1f}ms rss={forms[form]['rss_mb']:.1f}MB "
+                f"anonymous={forms[form]['anonymous_mb']:.1f}MB"
+                for form in FORMS
+            ))
+
+    return {
+        'config': {'sizes': args.sizes, 'runs': args.runs, 'seed': args.seed},
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare cold start and memory of the catalog snapshot against recipe dicts")
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')], default=[10000, 100000])
+    parser.add_argument('--runs', type=int, default=3, help="Fresh processes per form and size; medians are reported")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='catalog-results.json')
+    parser.add_argument('--child', nargs=3, metavar=('FORM', 'PATH', 'PROFILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        form, path, profile_path = args.child
+        print(json.dumps(measure_child(form, path, profile_path, args.seed)))
+        return
+
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# Load test harness with local fakes for Azure services 
\ No newline at end of file
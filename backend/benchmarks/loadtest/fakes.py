@@ -0,0 +1,1126 @@
+"""
+Local stand-ins for the Azure services the backend talks to.
+
+Each fake speaks enough of the real wire protocol for the unmodified SDKs
+(azure-cosmos, openai, azure-ai-textanalytics, redis-py) to work against it,
+with configurable latency distributions, error rates and throttling.
+
+Run standalone:
+    python -m benchmarks.loadtest.fakes --profile slow-llm.json
+"""
+import os
+import re
+import copy
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import fnmatch
+import logging
+from typing import Dict, Any, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = {
+    'seed': 42,
+    'catalog_size': 500,
+    'partition_keys': {'recipes': '/id', 'generated_recipes': '/user_id', 'user_profiles': '/user_id', 'recipe_history': '/user_id'},
+    'cosmos': {'median_ms': 6, 'p99_ms': 40, 'error_rate': 0.0, 'throttle_rate': 0.0},
+    'openai_chat': {'median_ms': 2500, 'p99_ms': 9000, 'error_rate': 0.01, 'throttle_rate': 0.02},
+    'openai_images': {'median_ms': 4000, 'p99_ms': 12000, 'error_rate': 0.01, 'throttle_rate': 0.0},
+    'text_analytics': {'median_ms': 120, 'p99_ms': 600, 'error_rate': 0.0, 'throttle_rate': 0.0},
+    'redis': {'median_ms': 0.5, 'p99_ms': 3, 'error_rate': 0.0, 'throttle_rate': 0.0}
+}
+
+class LatencyModel:
+    """Log-normal latency with fixed-rate errors and throttling"""
+
+    def __init__(self, median_ms: float, p99_ms: float, error_rate: float = 0.0, throttle_rate: float = 0.0, rng: random.Random = None):
+        self.median = median_ms / 1000
+        self.sigma = math.log(max(p99_ms, median_ms) / median_ms) / 2.326 if median_ms > 0 else 0.0
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], rng: random.Random) -> 'LatencyModel':
+        return cls(config.get('median_ms', 1), config.get('p99_ms', 1), config.get('error_rate', 0.0), config.get('throttle_rate', 0.0), rng)
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(self.rng.gauss(0, 1) * self.sigma)
+
+    def outcome(self) -> str:
+        roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return 'throttle'
+        if roll < self.throttle_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+class NormalizePaths:
+    """Collapse duplicate and trailing slashes; the SDKs emit both and the real services accept them"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            path = re.sub(r'/+', '/', scope['path'])
+            if len(path) > 1:
+                path = path.rstrip('/')
+            scope = dict(scope, path=path, raw_path=path.encode())
+        await self.app(scope, receive, send)
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+CUISINES = ["Indian", "Italian", "Asian", "Mexican", "Mediterranean", "American", "Thai", "Chinese", "Japanese", "Korean"]
+INGREDIENTS = [
+    "Yippee noodles", "onions", "tomatoes", "spices", "vegetables", "soy sauce", "ginger", "garlic",
+    "chicken", "egg", "paneer", "cheese", "butter", "peanut", "cashew", "bell peppers", "spinach",
+    "mushrooms", "corn", "chili", "basil", "coriander", "lemon", "cream", "tofu", "carrots", "peas"
+]
+TAGS = ["quick", "vegetarian", "spicy", "mild", "lunch", "dinner", "snack", "breakfast", "kids", "healthy"]
+
+def synthetic_base_recipes(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    recipes = []
+    for index in range(count):
+        cuisine = rng.choice(CUISINES)
+        recipes.append({
+            'id': f"base-{index + 1}",
+            'title': f"Yippee {cuisine} {rng.choice(['Masala', 'Stir Fry', 'Bowl', 'Delight', 'Toss'])} {index + 1}",
+            'cuisine': cuisine,
+            'difficulty': rng.choice(['Easy', 'Medium', 'Hard']),
+            'cooking_time': rng.choice([10, 15, 20, 25, 30, 45, 60]),
+            'tags': rng.sample(TAGS, rng.randint(1, 4)) + [cuisine.lower()],
+            'ingredients': ['Yippee noodles'] + rng.sample(INGREDIENTS[1:], rng.randint(3, 8)),
+            'type': 'base_recipe'
+        })
+    return recipes
+
+SYNTHETIC_RECIPE_TEXT = """
+Title: Yippee! {title}
+Description: A synthetic load-test recipe
+Cooking Time: {minutes} minutes
+Difficulty: Medium
+Tags: synthetic, {tag}
+
+Ingredients:
+- Yippee noodles: 2 packets
+- Onions: 1, sliced
+- Bell peppers: 2, sliced
+- Soy sauce: 2 tbsp
+
+Instructions:
+1. Boil Yippee noodles (Time: 5 minutes)
+2. Stir-fry the vegetables (Time: 5 minutes)
+3. Toss everything together (Time: 3 minutes)
+"""
+
+# ---------------------------------------------------------------------------
+# Cosmos DB (gateway REST protocol)
+# ---------------------------------------------------------------------------
+
+class FakeCosmos:
+    """In-memory Cosmos account: one physical partition per container, a small SQL subset"""
+
+    def __init__(self, model: LatencyModel, partition_keys: Dict[str, str] = None):
+        self.model = model
+        self.containers = {}
+        self.partition_keys = partition_keys or {}
+        self.indexing_policies = {}
+        self.etag_counter = 0
+
+    def container(self, name: str) -> Dict[str, Dict[str, Any]]:
+        return self.containers.setdefault(name, {})
+
+    def seed(self, container: str, items: List[Dict[str, Any]]):
+        store = self.container(container)
+        for item in items:
+            store[item['id']] = self._stamp(dict(item))
+
+    def _stamp(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        self.etag_counter += 1
+        item['_etag'] = f'"{self.etag_counter:08x}"'
+        item['_ts'] = int(time.time())
+        item['_rid'] = item.get('_rid') or uuid.uuid4().hex[:16]
+        item['_self'] = f"docs/{item['_rid']}/"
+        return item
+
+    def _headers(self, charge: float, started: float, extra: Dict[str, str] = None) -> Dict[str, str]:
+        headers = {
+            'x-ms-request-charge': f"{charge:.2f}",
+            'x-ms-request-duration-ms': f"{(time.perf_counter() - started) * 1000:.3f}",
+            'x-ms-session-token': '0:1#1',
+            'x-ms-activity-id': str(uuid.uuid4())
+        }
+        headers.update(extra or {})
+        return headers
+
+    async def _delay(self, started: float) -> Optional[Response]:
+        outcome = self.model.outcome()
+        await asyncio.sleep(self.model.sample())
+        if outcome == 'throttle':
+            return JSONResponse({'code': 'TooManyRequests', 'message': 'Request rate is large'}, status_code=429,
+                                headers=self._headers(0, started, {'x-ms-retry-after-ms': '50', 'x-ms-substatus': '3200'}))
+        if outcome == 'error':
+            return JSONResponse({'code': 'ServiceUnavailable', 'message': 'Injected failure'}, status_code=503,
+                                headers=self._headers(0, started))
+        return None
+
+    async def account(self, request: Request):
+        base = str(request.base_url)
+        location = {'name': 'local', 'databaseAccountEndpoint': base}
+        return JSONResponse({
+            'id': 'fake-cosmos',
+            '_rid': 'fake-cosmos.documents.azure.com',
+            'media': '//media/',
+            'addresses': '//addresses/',
+            '_dbs': '//dbs/',
+            'writableLocations': [location],
+            'readableLocations': [location],
+            'enableMultipleWriteLocations': False,
+            'userReplicationPolicy': {'asyncReplication': False, 'minReplicaSetSize': 1, 'maxReplicasetSize': 4},
+            'userConsistencyPolicy': {'defaultConsistencyLevel': 'Session'},
+            'systemReplicationPolicy': {'minReplicaSetSize': 1, 'maxReplicasetSize': 4},
+            'readPolicy': {'primaryReadCoefficient': 1, 'secondaryReadCoefficient': 1}
+        })
+
+    async def database(self, request: Request):
+        db = request.path_params['db']
+        return JSONResponse({'id': db, '_rid': 'db0001==', '_self': f"dbs/{db}/"})
+
+    def _container_properties(self, db: str, coll: str) -> Dict[str, Any]:
+        return {
+            'id': coll,
+            '_rid': 'db0001==' + coll[:4],
+            '_self': f"dbs/{db}/colls/{coll}/",
+            'partitionKey': {'paths': [self.partition_keys.get(coll, '/id')], 'kind': 'Hash', 'version': 2},
+            'indexingPolicy': self.indexing_policies.get(coll, {
+                'indexingMode': 'consistent', 'automatic': True, 'includedPaths': [{'path': '/*'}], 'excludedPaths': []
+            })
+        }
+
+    async def collections(self, request: Request):
+        db = request.path_params['db']
+        if request.method == 'POST':
+            body = await request.json()
+            coll = body['id']
+            self.partition_keys[coll] = body.get('partitionKey', {}).get('paths', ['/id'])[0]
+            if 'indexingPolicy' in body:
+                self.indexing_policies[coll] = body['indexingPolicy']
+            self.container(coll)
+            return JSONResponse(self._container_properties(db, coll), status_code=201)
+        return JSONResponse({'_rid': 'db0001==', 'DocumentCollections': [
+            self._container_properties(db, name) for name in self.containers
+        ], '_count': len(self.containers)})
+
+    async def collection(self, request: Request):
+        db, coll = request.path_params['db'], request.path_params['coll']
+        if request.method == 'DELETE':
+            self.containers.pop(coll, None)
+            return Response(status_code=204)
+        if_match = request.headers.get('if-match')
+        if request.method in ('PUT', 'PATCH') and item is not None and if_match not in (None, '*', item.get('_etag')):
+            return JSONResponse({'code': 'PreconditionFailed', 'message': 'One of the specified pre-condition is not met'},
+                                status_code=412, headers=self._headers(1.0, started))
+        if request.method == 'PUT':
+            body = await request.json()
+            if 'indexingPolicy' in body:
+                self.indexing_policies[coll] = body['indexingPolicy']
+            return JSONResponse(self._container_properties(db, coll))
+        if coll not in self.containers:
+            return JSONResponse({'code': 'NotFound', 'message': 'Container not found'}, status_code=404)
+        return JSONResponse(self._container_properties(db, coll))
+
+    async def pkranges(self, request: Request):
+        return JSONResponse({'_rid': 'db0001==', 'PartitionKeyRanges': [{
+            'id': '0', '_rid': 'pk0', 'minInclusive': '', 'maxExclusive': 'FF', 'ridPrefix': 0,
+            'throughputFraction': 1.0, 'status': 'online', 'parents': []
+        }], '_count': 1})
+
+    async def documents(self, request: Request):
+        started = time.perf_counter()
+        coll = request.path_params['coll']
+        store = self.container(coll)
+        failure = await self._delay(started)
+        if failure is not None:
+            return failure
+
+        if request.headers.get('x-ms-cosmos-is-query-plan-request', '').lower() == 'true':
+            return JSONResponse(self._query_plan())
+        if request.headers.get('x-ms-documentdb-isquery', '').lower() == 'true' or \
+                request.headers.get('content-type', '').startswith('application/query+json'):
+            body = await request.json()
+            return self._run_query(store, body, request, started)
+        if request.method == 'GET':
+            return self._run_query(store, {'query': 'SELECT * FROM c'}, request, started)
+
+        body = await request.json()
+        is_upsert = request.headers.get('x-ms-documentdb-is-upsert', '').lower() == 'true'
+        if body['id'] in store and not is_upsert:
+            return JSONResponse({'code': 'Conflict', 'message': 'Entity with the specified id already exists'},
+                                status_code=409, headers=self._headers(1.0, started))
+        item = self._stamp(body)
+        store[item['id']] = item
+        charge = 5.0 + len(json.dumps(item)) / 1024 * 2
+        return JSONResponse(item, status_code=201, headers=self._headers(charge, started))
+
+    async def document(self, request: Request):
+        started = time.perf_counter()
+        coll, doc_id = request.path_params['coll'], request.path_params['doc']
+        store = self.container(coll)
+        failure = await self._delay(started)
+        if failure is not None:
+            return failure
+
+        # Read before looking the item up, so the If-Match check and the write happen without a yield in between
+        body = await request.json() if request.method in ('PUT', 'PATCH') else None
+        item = store.get(doc_id)
+        if request.method == 'DELETE':
+            if item is None:
+                return JSONResponse({'code': 'NotFound'}, status_code=404, headers=self._headers(1.0, started))
+            del store[doc_id]
+            return Response(status_code=204, headers=self._headers(5.0, started))
+        if_match = request.headers.get('if-match')
+        if request.method in ('PUT', 'PATCH') and item is not None and if_match not in (None, '*', item.get('_etag')):
+            return JSONResponse({'code': 'PreconditionFailed', 'message': 'One of the specified pre-condition is not met'},
+                                status_code=412, headers=self._headers(1.0, started))
+        if request.method == 'PUT':
+            store[doc_id] = self._stamp(body)
+            return JSONResponse(store[doc_id], headers=self._headers(10.0, started))
+        if request.method == 'PATCH':
+            if item is None:
+                return JSONResponse({'code': 'NotFound'}, status_code=404, headers=self._headers(1.0, started))
+            for op in body.get('operations', []):
+                self._apply_patch(item, op)
+            store[doc_id] = self._stamp(item)
+            return JSONResponse(item, headers=self._headers(10.0, started))
+
+        if item is None:
+            return JSONResponse({'code': 'NotFound', 'message': 'Entity with the specified id does not exist'},
+                                status_code=404, headers=self._headers(1.0, started))
+        if request.headers.get('if-none-match') == item.get('_etag'):
+            return Response(status_code=304, headers=self._headers(1.0, started))
+        return JSONResponse(item, headers=self._headers(1.0, started, {'etag': item['_etag']}))
+
+    def _apply_patch(self, item: Dict[str, Any], op: Dict[str, Any]):
+        parts = [p for p in op['path'].split('/') if p]
+        target = item
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        key = parts[-1]
+        if op['op'] in ('set', 'add', 'replace'):
+            if op['op'] == 'add' and isinstance(target.get(key), list):
+                target[key].append(op['value'])
+            else:
+                target[key] = op['value']
+        elif op['op'] == 'incr':
+            target[key] = target.get(key, 0) + op['value']
+        elif op['op'] == 'remove':
+            target.pop(key, None)
+
+    def _query_plan(self) -> Dict[str, Any]:
+        # The fake has a single physical partition, so ORDER BY/TOP/OFFSET are
+        # evaluated server-side and the SDK is told to pass results through
+        return {
+            'partitionedQueryExecutionInfoVersion': 2,
+            'queryInfo': {
+                'distinctType': 'None', 'top': None, 'offset': None, 'limit': None,
+                'orderBy': [], 'orderByExpressions': [], 'groupByExpressions': [], 'groupByAliases': [],
+                'aggregates': [], 'groupByAliasToAggregateType': {}, 'rewrittenQuery': '',
+                'hasSelectValue': False, 'dCountInfo': None
+            },
+            'queryRanges': [{'min': '', 'max': 'FF', 'isMinInclusive': True, 'isMaxInclusive': False}]
+        }
+
+    def _run_query(self, store: Dict[str, Dict[str, Any]], body: Dict[str, Any], request: Request, started: float) -> Response:
+        params = {p['name']: p['value'] for p in body.get('parameters', [])}
+        try:
+            results = evaluate_query(body['query'], list(store.values()), params)
+        except ValueError as e:
+            return JSONResponse({'code': 'BadRequest', 'message': str(e)}, status_code=400, headers=self._headers(1.0, started))
+
+        page_size = int(request.headers.get('x-ms-max-item-count', '100') or 100)
+        if page_size <= 0:
+            page_size = 100
+        try:
+            start = int(request.headers.get('x-ms-continuation') or 0)
+        except ValueError:
+            return JSONResponse({'code': 'BadRequest', 'message': 'Invalid continuation token'}, status_code=400,
+                                headers=self._headers(1.0, started))
+        page = results[start:start + page_size]
+        extra = {'x-ms-item-count': str(len(page))}
+        if start + page_size < len(results):
+            extra['x-ms-continuation'] = str(start + page_size)
+        charge = 2.8 + 0.05 * len(store) + 0.3 * len(page)
+        return JSONResponse({'_rid': 'db0001==', 'Documents': page, '_count': len(page)},
+                            headers=self._headers(charge, started, extra))
+
+    def app(self) -> NormalizePaths:
+        return NormalizePaths(Starlette(routes=[
+            Route('/', self.account, methods=['GET']),
+            Route('/dbs/{db}', self.database, methods=['GET']),
+            Route('/dbs/{db}/colls', self.collections, methods=['GET', 'POST']),
+            Route('/dbs/{db}/colls/{coll}', self.collection, methods=['GET', 'PUT', 'DELETE']),
+            Route('/dbs/{db}/colls/{coll}/pkranges', self.pkranges, methods=['GET']),
+            Route('/dbs/{db}/colls/{coll}/docs', self.documents, methods=['GET', 'POST']),
+            Route('/dbs/{db}/colls/{coll}/docs/{doc}', self.document, methods=['GET', 'PUT', 'PATCH', 'DELETE'])
+        ]))
+
+_SELECT_RE = re.compile(
+    r"^\s*SELECT\s+(?:TOP\s+(?P<top>\d+)\s+)?(?P<fields>.+?)\s+FROM\s+c"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+OFFSET\s+(?P<offset>\S+)\s+LIMIT\s+(?P<limit>\S+))?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+
+def _resolve(item: Dict[str, Any], path: str) -> Any:
+    value = item
+    for part in path.split('.')[1:]:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def _literal(token: str, params: Dict[str, Any]) -> Any:
+    token = token.strip()
+    if token.startswith('@'):
+        return params.get(token)
+    if token.startswith("'") and token.endswith("'"):
+        return token[1:-1]
+    if token.lower() in ('true', 'false'):
+        return token.lower() == 'true'
+    if token.lower() == 'null':
+        return None
+    try:
+        return float(token) if '.' in token else int(token)
+    except ValueError:
+        raise ValueError(f"Unsupported literal: {token}")
+
+def _condition(clause: str, params: Dict[str, Any]):
+    clause = clause.strip()
+    match = re.match(r"^ARRAY_CONTAINS\(\s*(c(?:\.\w+)+)\s*,\s*(.+?)\s*\)$", clause, re.IGNORECASE)
+    if match:
+        path, value = match.group(1), _literal(match.group(2), params)
+        return lambda item: value in (_resolve(item, path) or [])
+    match = re.match(r"^IS_DEFINED\(\s*(c(?:\.\w+)+)\s*\)$", clause, re.IGNORECASE)
+    if match:
+        path = match.group(1)
+        return lambda item: _resolve(item, path) is not None
+    match = re.match(r"^(c(?:\.\w+)+)\s*(=|!=|<>|>=|<=|>|<)\s*(.+)$", clause)
+    if not match:
+        raise ValueError(f"Unsupported condition: {clause}")
+    path, op, value = match.group(1), match.group(2), _literal(match.group(3), params)
+    ops = {
+        '=': lambda a, b: a == b, '!=': lambda a, b: a != b, '<>': lambda a, b: a != b,
+        '>': lambda a, b: a is not None and a > b, '<': lambda a, b: a is not None and a < b,
+        '>=': lambda a, b: a is not None and a >= b, '<=': lambda a, b: a is not None and a <= b
+    }
+    return lambda item: ops[op](_resolve(item, path), value)
+
+def evaluate_query(query: str, items: List[Dict[str, Any]], params: Dict[str, Any]) -> List[Any]:
+    """Evaluate the SELECT/WHERE (AND only)/ORDER BY/OFFSET LIMIT subset the backend issues"""
+    match = _SELECT_RE.match(query)
+    if not match:
+        raise ValueError(f"Unsupported query: {query}")
+
+    results = items
+    if match.group('where'):
+        conditions = [_condition(part, params) for part in re.split(r"\s+AND\s+", match.group('where'), flags=re.IGNORECASE)]
+        results = [item for item in results if all(cond(item) for cond in conditions)]
+
+    if match.group('order'):
+        for term in reversed([t.strip() for t in match.group('order').split(',')]):
+            path, _, direction = term.partition(' ')
+            results = sorted(results, key=lambda item: (_resolve(item, path) is None, _resolve(item, path) or ''),
+                             reverse=direction.strip().upper() == 'DESC')
+
+    if match.group('offset'):
+        offset = _literal(match.group('offset'), params)
+        limit = _literal(match.group('limit'), params)
+        results = results[offset:offset + limit]
+    if match.group('top'):
+        results = results[:int(match.group('top'))]
+
+    fields = match.group('fields').strip()
+    if fields == '*':
+        return results
+    if fields.upper().startswith('VALUE '):
+        path = fields[6:].strip()
+        if path.upper().startswith('COUNT('):
+            return [len(results)]
+        return [_resolve(item, path) for item in results]
+    projected = []
+    for item in results:
+        row = {}
+        for field in fields.split(','):
+            field = field.strip()
+            alias = field.split('.')[-1]
+            row[alias] = _resolve(item, field)
+        projected.append(row)
+    return projected
+
+# ---------------------------------------------------------------------------
+# Azure OpenAI (chat completions and images)
+# ---------------------------------------------------------------------------
+
+class FakeOpenAI:
+    def __init__(self, chat_model: LatencyModel, image_model: LatencyModel, rng: random.Random):
+        self.chat_model = chat_model
+        self.image_model = image_model
+        self.rng = rng
+
+    async def _fail(self, model: LatencyModel) -> Optional[Response]:
+        outcome = model.outcome()
+        await asyncio.sleep(model.sample())
+        if outcome == 'throttle':
+            return JSONResponse({'error': {'code': '429', 'message': 'Rate limit is exceeded'}}, status_code=429,
+                                headers={'retry-after': '1', 'retry-after-ms': '1000'})
+        if outcome == 'error':
+            return JSONResponse({'error': {'code': 'InternalServerError', 'message': 'Injected failure'}}, status_code=500)
+        return None
+
+    async def chat(self, request: Request):
+        failure = await self._fail(self.chat_model)
+        if failure is not None:
+            return failure
+        body = await request.json()
+        text = SYNTHETIC_RECIPE_TEXT.format(
+            title=self.rng.choice(['Spicy Toss', 'Garden Bowl', 'Masala Twist', 'Street Noodles']),
+            minutes=self.rng.choice([15, 20, 25, 30]),
+            tag=self.rng.choice(TAGS)
+        )
+        prompt_tokens = sum(len(m.get('content', '')) for m in body.get('messages', [])) // 4
+        completion_tokens = len(text) // 4
+        return JSONResponse({
+            'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.path_params['deployment'],
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': text}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens}
+        })
+
+    async def images(self, request: Request):
+        failure = await self._fail(self.image_model)
+        if failure is not None:
+            return failure
+        return JSONResponse({
+            'created': int(time.time()),
+            'data': [{'url': f"https://fake-images.local/{uuid.uuid4().hex}.png", 'revised_prompt': None}]
+        })
+
+    async def models(self, request: Request):
+        return JSONResponse({'object': 'list', 'data': []})
+
+    def app(self) -> NormalizePaths:
+        return NormalizePaths(Starlette(routes=[
+            Route('/openai/deployments/{deployment}/chat/completions', self.chat, methods=['POST']),
+            Route('/openai/deployments/{deployment}/images/generations', self.images, methods=['POST']),
+            Route('/openai/models', self.models, methods=['GET'])
+        ]))
+
+# ---------------------------------------------------------------------------
+# Azure AI Language (analyze-text)
+# ---------------------------------------------------------------------------
+
+class FakeTextAnalytics:
+    def __init__(self, model: LatencyModel):
+        self.model = model
+
+    async def analyze(self, request: Request):
+        outcome = self.model.outcome()
+        await asyncio.sleep(self.model.sample())
+        if outcome == 'throttle':
+            return JSONResponse({'error': {'code': '429', 'message': 'Rate limit is exceeded'}}, status_code=429, headers={'retry-after': '1'})
+        if outcome == 'error':
+            return JSONResponse({'error': {'code': 'InternalServerError', 'message': 'Injected failure'}}, status_code=500)
+
+        body = await request.json()
+        kind = body['kind']
+        documents = []
+        for doc in body['analysisInput']['documents']:
+            words = [w.strip(',.:').lower() for w in doc['text'].split()]
+            foods = [w for w in words if w in INGREDIENTS][:5]
+            result = {'id': doc['id'], 'warnings': []}
+            if kind == 'EntityRecognition':
+                result['entities'] = [
+                    {'text': w, 'category': 'Product', 'offset': 0, 'length': len(w), 'confidenceScore': 0.9}
+                    for w in foods
+                ]
+            elif kind == 'KeyPhraseExtraction':
+                result['keyPhrases'] = foods or ['noodles']
+            elif kind == 'SentimentAnalysis':
+                scores = {'positive': 0.8, 'neutral': 0.15, 'negative': 0.05}
+                result.update({'sentiment': 'positive', 'confidenceScores': scores, 'sentences': [{
+                    'text': doc['text'][:100], 'sentiment': 'positive', 'confidenceScores': scores, 'offset': 0, 'length': min(len(doc['text']), 100)
+                }]})
+            documents.append(result)
+
+        result_kind = {
+            'EntityRecognition': 'EntityRecognitionResults',
+            'KeyPhraseExtraction': 'KeyPhraseExtractionResults',
+            'SentimentAnalysis': 'SentimentAnalysisResults'
+        }.get(kind, f"{kind}Results")
+        return JSONResponse({'kind': result_kind, 'results': {'documents': documents, 'errors': [], 'modelVersion': 'fake'}})
+
+    def app(self) -> NormalizePaths:
+        return NormalizePaths(Starlette(routes=[Route('/language/:analyze-text', self.analyze, methods=['POST'])]))
+
+# ---------------------------------------------------------------------------
+# Redis (RESP2 subset)
+# ---------------------------------------------------------------------------
+
+class FakeRedis:
+    """Single-process RESP server with strings, hashes, lists, sets, sorted sets and streams"""
+
+    def __init__(self, model: LatencyModel):
+        self.model = model
+        self.data = {}
+        self.expiry = {}
+        self.stream_seq = 0
+
+    def _alive(self, key: bytes) -> bool:
+        deadline = self.expiry.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.data
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self._client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.strip().split()
+        count = int(line[1:].strip())
+        args = []
+        for _ in range(count):
+            size = int((await reader.readline())[1:].strip())
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Commands queued since MULTI, and the keys WATCHed with their values at the time
+        session = {'queued': None, 'watched': {}}
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                latency = self.model.sample()
+                if latency > 0.0005:
+                    await asyncio.sleep(latency)
+                if self.model.outcome() == 'error':
+                    writer.write(b'-ERR injected failure\r\n')
+                else:
+                    writer.write(self._session_command(command, session))
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _snapshot(self, key: bytes) -> Any:
+        return copy.deepcopy(self.data[key]) if self._alive(key) else None
+
+    def _session_command(self, command: List[bytes], session: Dict[str, Any]) -> bytes:
+        """Transactions need per-connection state; every other command runs directly"""
+        name = command[0].upper()
+        if name == b'MULTI':
+            session['queued'] = []
+            return b'+OK\r\n'
+        if name == b'WATCH':
+            for key in command[1:]:
+                session['watched'][key] = self._snapshot(key)
+            return b'+OK\r\n'
+        if name in (b'UNWATCH', b'DISCARD'):
+            if name == b'DISCARD':
+                session['queued'] = None
+            session['watched'].clear()
+            return b'+OK\r\n'
+        if name == b'EXEC':
+            queued, session['queued'] = session['queued'], None
+            # Compared by value; good enough to detect another client's write in between
+            changed = any(self._snapshot(key) != value for key, value in session['watched'].items())
+            session['watched'].clear()
+            if queued is None:
+                return b'-ERR EXEC without MULTI\r\n'
+            if changed:
+                return b'*-1\r\n'
+            return self._encode([self._execute(queued_command) for queued_command in queued])
+        if session['queued'] is not None:
+            session['queued'].append(command)
+            return b'+QUEUED\r\n'
+        return self._encode(self._execute(command))
+
+    def _encode(self, value: Any) -> bytes:
+        if isinstance(value, Exception):
+            return f"-ERR {value}\r\n".encode()
+        if value is True:
+            return b'+OK\r\n'
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, float):
+            value = repr(value).encode()
+        if isinstance(value, str):
+            value = value.encode()
+        if isinstance(value, bytes):
+            return b'$' + str(len(value)).encode() + b'\r\n' + value + b'\r\n'
+        if isinstance(value, (list, tuple)):
+            return b'*' + str(len(value)).encode() + b'\r\n' + b''.join(self._encode(v) for v in value)
+        return self._encode(str(value))
+
+    def _execute(self, args: List[bytes]) -> Any:
+        name = args[0].decode().upper()
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            return ValueError(f"unknown command '{name}'")
+        try:
+            return handler(*args[1:])
+        except Exception as e:
+            return ValueError(str(e))
+
+    # Connection
+    def cmd_ping(self, *args):
+        return args[0] if args else b'PONG'
+
+    def cmd_client(self, *args):
+        return True
+
+    def cmd_select(self, *args):
+        return True
+
+    def cmd_hello(self, *args):
+        return ValueError("unknown command 'HELLO'")
+
+    def cmd_flushall(self, *args):
+        self.data.clear()
+        self.expiry.clear()
+        return True
+
+    # Keys
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                self.expiry.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expiry[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def cmd_pexpire(self, key, millis):
+        if not self._alive(key):
+            return 0
+        self.expiry[key] = time.monotonic() + int(millis) / 1000
+        return 1
+
+    def cmd_ttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self.expiry.get(key)
+        return -1 if deadline is None else max(0, int(deadline - time.monotonic()))
+
+    def cmd_keys(self, pattern):
+        return [k for k in list(self.data) if self._alive(k) and fnmatch.fnmatchcase(k.decode(), pattern.decode())]
+
+    # Strings
+    def cmd_get(self, key):
+        return self.data.get(key) if self._alive(key) else None
+
+    def cmd_set(self, key, value, *options):
+        options = [o.upper() for o in options]
+        exists = self._alive(key)
+        if b'NX' in options and exists:
+            return None
+        if b'XX' in options and not exists:
+            return None
+        self.data[key] = value
+        self.expiry.pop(key, None)
+        for flag, scale in ((b'EX', 1), (b'PX', 0.001)):
+            if flag in options:
+                self.expiry[key] = time.monotonic() + int(options[options.index(flag) + 1]) * scale
+        return True
+
+    def cmd_setex(self, key, seconds, value):
+        return self.cmd_set(key, value, b'EX', seconds)
+
+    def cmd_getdel(self, key):
+        value = self.cmd_get(key)
+        self.cmd_del(key)
+        return value
+
+    def cmd_mget(self, *keys):
+        return [self.cmd_get(key) for key in keys]
+
+    def cmd_incrby(self, key, amount):
+        value = int(self.cmd_get(key) or 0) + int(amount)
+        self.data[key] = str(value).encode()
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_incrbyfloat(self, key, amount):
+        value = float(self.cmd_get(key) or 0) + float(amount)
+        self.data[key] = repr(value).encode()
+        return repr(value).encode()
+
+    # Hashes
+    def _hash(self, key) -> Dict[bytes, bytes]:
+        if not self._alive(key):
+            self.data[key] = {}
+        return self.data[key]
+
+    def cmd_hset(self, key, *pairs):
+        target = self._hash(key)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in target
+            target[field] = value
+        return added
+
+    def cmd_hget(self, key, field):
+        return self.data[key].get(field) if self._alive(key) else None
+
+    def cmd_hmget(self, key, *fields):
+        target = self.data[key] if self._alive(key) else {}
+        return [target.get(f) for f in fields]
+
+    def cmd_hgetall(self, key):
+        if not self._alive(key):
+            return []
+        return [v for pair in self.data[key].items() for v in pair]
+
+    def cmd_hincrby(self, key, field, amount):
+        target = self._hash(key)
+        target[field] = str(int(target.get(field, 0)) + int(amount)).encode()
+        return int(target[field])
+
+    def cmd_hincrbyfloat(self, key, field, amount):
+        target = self._hash(key)
+        target[field] = repr(float(target.get(field, 0)) + float(amount)).encode()
+        return target[field]
+
+    def cmd_hdel(self, key, *fields):
+        if not self._alive(key):
+            return 0
+        return sum(1 for f in fields if self.data[key].pop(f, None) is not None)
+
+    # Lists
+    def _list(self, key) -> List[bytes]:
+        if not self._alive(key):
+            self.data[key] = []
+        return self.data[key]
+
+    def cmd_lpush(self, key, *values):
+        target = self._list(key)
+        for value in values:
+            target.insert(0, value)
+        return len(target)
+
+    def cmd_rpush(self, key, *values):
+        target = self._list(key)
+        target.extend(values)
+        return len(target)
+
+    def cmd_lpop(self, key):
+        target = self._list(key)
+        return target.pop(0) if target else None
+
+    def cmd_rpop(self, key):
+        target = self._list(key)
+        return target.pop() if target else None
+
+    def cmd_llen(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    def cmd_lrange(self, key, start, stop):
+        target = self.data.get(key, []) if self._alive(key) else []
+        start, stop = int(start), int(stop)
+        stop = len(target) if stop == -1 else stop + 1
+        return target[start:stop]
+
+    def cmd_ltrim(self, key, start, stop):
+        if self._alive(key):
+            start, stop = int(start), int(stop)
+            self.data[key] = self.data[key][start:None if stop == -1 else stop + 1]
+        return True
+
+    def cmd_lrem(self, key, count, value):
+        if not self._alive(key):
+            return 0
+        before = len(self.data[key])
+        self.data[key] = [v for v in self.data[key] if v != value]
+        return before - len(self.data[key])
+
+    def cmd_lpos(self, key, value, *options):
+        target = self.data[key] if self._alive(key) else []
+        return target.index(value) if value in target else None
+
+    def cmd_lmove(self, source, destination, wherefrom, whereto):
+        value = self.cmd_lpop(source) if wherefrom.upper() == b'LEFT' else self.cmd_rpop(source)
+        if value is not None:
+            (self.cmd_lpush if whereto.upper() == b'LEFT' else self.cmd_rpush)(destination, value)
+        return value
+
+    def cmd_rpoplpush(self, source, destination):
+        return self.cmd_lmove(source, destination, b'RIGHT', b'LEFT')
+
+    # Sets
+    def _set(self, key) -> set:
+        if not self._alive(key):
+            self.data[key] = set()
+        return self.data[key]
+
+    def cmd_sadd(self, key, *members):
+        target = self._set(key)
+        before = len(target)
+        target.update(members)
+        return len(target) - before
+
+    def cmd_smembers(self, key):
+        return list(self.data[key]) if self._alive(key) else []
+
+    def cmd_srem(self, key, *members):
+        target = self._set(key)
+        before = len(target)
+        target.difference_update(members)
+        return before - len(target)
+
+    def cmd_scard(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    # Sorted sets
+    def _zset(self, key) -> Dict[bytes, float]:
+        if not self._alive(key):
+            self.data[key] = {}
+        return self.data[key]
+
+    def cmd_zadd(self, key, *args):
+        target = self._zset(key)
+        args = list(args)
+        flags = set()
+        while args and args[0].upper() in (b'NX', b'XX', b'GT', b'LT', b'CH'):
+            flags.add(args.pop(0).upper())
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            if b'NX' in flags and member in target:
+                continue
+            if b'XX' in flags and member not in target:
+                continue
+            added += member not in target
+            target[member] = float(score)
+        return added
+
+    def cmd_zincrby(self, key, amount, member):
+        target = self._zset(key)
+        target[member] = target.get(member, 0.0) + float(amount)
+        return repr(target[member])
+
+    def cmd_zscore(self, key, member):
+        if not self._alive(key) or member not in self.data[key]:
+            return None
+        return repr(self.data[key][member])
+
+    def cmd_zrem(self, key, *members):
+        target = self._zset(key)
+        return sum(1 for m in members if target.pop(m, None) is not None)
+
+    def cmd_zcard(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    def _zsorted(self, key, reverse=False):
+        target = self.data.get(key, {}) if self._alive(key) else {}
+        return sorted(target.items(), key=lambda kv: (kv[1], kv[0]), reverse=reverse)
+
+    def _zrange(self, key, start, stop, withscores, reverse):
+        items = self._zsorted(key, reverse)
+        start, stop = int(start), int(stop)
+        if start < 0:
+            start = max(0, len(items) + start)
+        stop = len(items) + stop if stop < 0 else stop
+        items = items[start:stop + 1]
+        if withscores:
+            return [v for member, score in items for v in (member, repr(score))]
+        return [member for member, _ in items]
+
+    def cmd_zrange(self, key, start, stop, *options):
+        options = [o.upper() for o in options]
+        return self._zrange(key, start, stop, b'WITHSCORES' in options, b'REV' in options)
+
+    def cmd_zrevrange(self, key, start, stop, *options):
+        return self._zrange(key, start, stop, b'WITHSCORES' in [o.upper() for o in options], True)
+
+    def _score_bound(self, raw: bytes):
+        raw = raw.decode()
+        if raw in ('-inf', '+inf', 'inf'):
+            return float(raw.replace('+', '')), False
+        if raw.startswith('('):
+            return float(raw[1:]), True
+        return float(raw), False
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        (low_v, low_x), (high_v, high_x) = self._score_bound(low), self._score_bound(high)
+        items = [
+            (m, s) for m, s in self._zsorted(key)
+            if (s > low_v if low_x else s >= low_v) and (s < high_v if high_x else s <= high_v)
+        ]
+        options = [o.upper() for o in options]
+        if b'LIMIT' in options:
+            index = options.index(b'LIMIT')
+            offset, count = int(options[index + 1]), int(options[index + 2])
+            items = items[offset:offset + count]
+        if b'WITHSCORES' in options:
+            return [v for member, score in items for v in (member, repr(score))]
+        return [member for member, _ in items]
+
+    def cmd_zremrangebyrank(self, key, start, stop):
+        members = self._zrange(key, start, stop, False, False)
+        return self.cmd_zrem(key, *members) if members else 0
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        members = self.cmd_zrangebyscore(key, low, high)
+        return self.cmd_zrem(key, *members) if members else 0
+
+    # Streams (append-only log with MAXLEN trimming)
+    def cmd_xadd(self, key, *args):
+        args = list(args)
+        maxlen = None
+        if args and args[0].upper() == b'MAXLEN':
+            args.pop(0)
+            if args[0] in (b'~', b'='):
+                args.pop(0)
+            maxlen = int(args.pop(0))
+        entry_id = args.pop(0)
+        if entry_id == b'*':
+            self.stream_seq += 1
+            entry_id = f"{int(time.time() * 1000)}-{self.stream_seq}".encode()
+        target = self._list(key)
+        target.append((entry_id, list(args)))
+        if maxlen is not None and len(target) > maxlen:
+            del target[:len(target) - maxlen]
+        return entry_id
+
+    def cmd_xrevrange(self, key, end, start, *options):
+        target = list(reversed(self.data.get(key, []))) if self._alive(key) else []
+        options = [o.upper() for o in options]
+        if b'COUNT' in options:
+            target = target[:int(options[options.index(b'COUNT') + 1])]
+        return [[entry_id, fields] for entry_id, fields in target]
+
+    def cmd_xrange(self, key, start, end, *options):
+        target = list(self.data.get(key, [])) if self._alive(key) else []
+        options = [o.upper() for o in options]
+        if b'COUNT' in options:
+            target = target[:int(options[options.index(b'COUNT') + 1])]
+        return [[entry_id, fields] for entry_id, fields in target]
+
+    def cmd_xlen(self, key):
+        return len(self.data[key]) if self._alive(key) else 0
+
+    # Pub/sub is not modelled; publishes are accepted and dropped
+    def cmd_publish(self, channel, message):
+        return 0
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def load_profile(path: Optional[str]) -> Dict[str, Any]:
+    profile = json.loads(json.dumps(DEFAULT_PROFILE))
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(profile.get(key), dict):
+                profile[key].update(value)
+            else:
+                profile[key] = value
+    return profile
+
+def fake_environment(host: str, ports: Dict[str, int], database: str = 'yippee-recipes') -> Dict[str, str]:
+    """Environment variables that point the backend at the fakes"""
+    fake_key = 'ZmFrZS1rZXk='
+    return {
+        'COSMOS_DB_CONNECTION_STRING': f"AccountEndpoint=http://{host}:{ports['cosmos']}/;AccountKey={fake_key};",
+        'COSMOS_DB_NAME': database,
+        'REDIS_CONNECTION_STRING': f"redis://{host}:{ports['redis']}/0",
+        'AZURE_LANGUAGE_ENDPOINT': f"http://{host}:{ports['text_analytics']}/",
+        'AZURE_LANGUAGE_KEY': 'fake-key',
+        'AZURE_OPENAI_ENDPOINT': f"http://{host}:{ports['openai']}/",
+        'AZURE_OPENAI_KEY': 'fake-key'
+    }
+
+async def serve_fakes(profile: Dict[str, Any], host: str, ports: Dict[str, int]):
+    rng = random.Random(profile.get('seed'))
+    cosmos = FakeCosmos(LatencyModel.from_config(profile['cosmos'], rng), profile.get('partition_keys'))
+    cosmos.seed('recipes', synthetic_base_recipes(profile['catalog_size'], rng))
+    for name in ('generated_recipes', 'user_profiles', 'recipe_history'):
+        cosmos.container(name)
+    openai_fake = FakeOpenAI(
+        LatencyModel.from_config(profile['openai_chat'], rng),
+        LatencyModel.from_config(profile['openai_images'], rng),
+        rng
+    )
+    language = FakeTextAnalytics(LatencyModel.from_config(profile['text_analytics'], rng))
+    redis_fake = FakeRedis(LatencyModel.from_config(profile['redis'], rng))
+
+    servers = []
+    for app, port in ((cosmos.app(), ports['cosmos']), (openai_fake.app(), ports['openai']), (language.app(), ports['text_analytics'])):
+        config = uvicorn.Config(app, host=host, port=port, log_level='warning', access_log=False, loop='asyncio')
+        servers.append(uvicorn.Server(config))
+
+    logger.info(f"Fakes listening on {host}: {ports}")
+    await asyncio.gather(*(server.serve() for server in servers), redis_fake.serve(host, ports['redis']))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local fakes for Cosmos DB, Azure OpenAI, Azure AI Language and Redis")
+    parser.add_argument('--profile', help="JSON file overriding latency/error settings")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=18080)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ports = {
+        'cosmos': args.base_port,
+        'openai': args.base_port + 1,
+        'text_analytics': args.base_port + 2,
+        'redis': args.base_port + 3
+    }
+    for key, value in fake_environment(args.host, ports).items():
+        print(f"{key}={value}")
+    asyncio.run(serve_fakes(load_profile(args.profile), args.host, ports))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+"""
+Open-loop load test for /api/generate-recipe against local fakes.
+
+Starts the fake Azure services and the API in subprocesses, drives the
+generation endpoint at a fixed arrival rate, then reports client-side
+throughput and latency alongside server-side per-stage latency and event
+loop lag derived from /metrics.
+
+    python -m benchmarks.loadtest.run --rps 20 --duration 60 --output results.json
+    python -m benchmarks.loadtest.run --rps 20 --duration 60 --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.loadtest.fakes import fake_environment
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CUISINES = ["Indian", "Italian", "Asian", "Mexican", "Mediterranean", "American", "Thai", "Chinese", "Japanese", "Korean"]
+SPICE_LEVELS = ["Mild", "Medium", "Spicy", "Extra Spicy"]
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack"]
+COOKING_TIMES = ["15 mins", "30 mins", "45 mins", "60+ mins"]
+RESTRICTIONS = ["Vegetarian", "Vegan", "Gluten-Free", "Dairy-Free", "Nut-Free"]
+INGREDIENTS = ["onions", "tomatoes", "paneer", "egg", "chicken", "spinach", "mushrooms", "corn", "cheese", "peas"]
+
+# Metrics compared against a baseline: (path in report, higher is worse)
+COMPARED_METRICS = [
+    (('client', 'throughput_rps'), False),
+    (('client', 'latency_ms', 'p50'), True),
+    (('client', 'latency_ms', 'p95'), True),
+    (('client', 'latency_ms', 'p99'), True),
+    (('client', 'error_rate'), True)
+]
+
+def build_request(rng: random.Random, users: int) -> Dict[str, Any]:
+    return {
+        'preferences': {
+            'cuisine': rng.choice(CUISINES),
+            'spice_level': rng.choice(SPICE_LEVELS),
+            'meal_type': rng.sample(MEAL_TYPES, rng.randint(1, 2)),
+            'max_cooking_time': rng.choice(COOKING_TIMES),
+            'dietary_restrictions': rng.sample(RESTRICTIONS, rng.randint(0, 1)),
+            'available_ingredients': rng.sample(INGREDIENTS, rng.randint(0, 4))
+        },
+        'user_id': f"load-user-{rng.randrange(users)}" if users else None
+    }
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+# ---------------------------------------------------------------------------
+# Prometheus scraping
+# ---------------------------------------------------------------------------
+
+def _parse_labels(raw: str) -> Dict[str, str]:
+    labels = {}
+    for part in raw.split('",'):
+        if '=' not in part:
+            continue
+        name, _, value = part.partition('=')
+        labels[name.strip()] = value.strip().strip('"')
+    return labels
+
+def parse_histograms(text: str) -> Dict[str, Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]]]:
+    """Histogram buckets per metric and label set from the text exposition format"""
+    result = defaultdict(lambda: defaultdict(lambda: {'buckets': {}, 'count': 0.0, 'sum': 0.0}))
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, _, value = line.rpartition(' ')
+        name, _, raw_labels = series.partition('{')
+        labels = _parse_labels(raw_labels.rstrip('}'))
+        if name.endswith('_bucket'):
+            bound = labels.pop('le')
+            key = tuple(sorted(labels.items()))
+            result[name[:-7]][key]['buckets'][float('inf') if bound == '+Inf' else float(bound)] = float(value)
+        elif name.endswith('_count') or name.endswith('_sum'):
+            base, _, suffix = name.rpartition('_')
+            key = tuple(sorted(labels.items()))
+            if base in result and key in result[base]:
+                result[base][key][suffix] = float(value)
+    return result
+
+def histogram_delta(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'buckets': {b: c - before.get('buckets', {}).get(b, 0.0) for b, c in after['buckets'].items()},
+        'count': after['count'] - before.get('count', 0.0),
+        'sum': after['sum'] - before.get('sum', 0.0)
+    }
+
+def histogram_quantile(fraction: float, data: Dict[str, Any]) -> Optional[float]:
+    """Linear interpolation inside the bucket holding the quantile, as PromQL does"""
+    buckets = sorted(data['buckets'].items())
+    total = data['count']
+    if total <= 0 or not buckets:
+        return None
+    rank = fraction * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if bound == float('inf'):
+                return lower_bound
+            if cumulative == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (cumulative - lower_count)
+        lower_bound, lower_count = bound, cumulative
+    return lower_bound
+
+def summarize_histogram(before, after, name: str, group_by: str, where: Dict[str, str] = None) -> Dict[str, Dict[str, Any]]:
+    """Per-label quantiles (in ms) of a histogram's growth between two scrapes"""
+    grouped = {}
+    for key, data in after.get(name, {}).items():
+        labels = dict(key)
+        if where and any(labels.get(k) != v for k, v in where.items()):
+            continue
+        delta = histogram_delta(before.get(name, {}).get(key, {}), data)
+        group = labels.get(group_by, '')
+        if group in grouped:
+            merged = grouped[group]
+            for bound, count in delta['buckets'].items():
+                merged['buckets'][bound] = merged['buckets'].get(bound, 0.0) + count
+            merged['count'] += delta['count']
+            merged['sum'] += delta['sum']
+        else:
+            grouped[group] = delta
+
+    summary = {}
+    for group, data in sorted(grouped.items()):
+        if data['count'] <= 0:
+            continue
+        summary[group] = {
+            'count': int(data['count']),
+            'mean_ms': round(data['sum'] / data['count'] * 1000, 3),
+            **{
+                q: round(histogram_quantile(f, data) * 1000, 3)
+                for q, f in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+            }
+        }
+    return summary
+
+async def scrape(client: httpx.AsyncClient) -> Dict[str, Any]:
+    response = await client.get('/metrics')
+    response.raise_for_status()
+    return parse_histograms(response.text)
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+async def drive(client: httpx.AsyncClient, rps: float, duration: float, users: int, seed: int, timeout: float) -> Dict[str, Any]:
+    """Fire requests at Poisson arrivals regardless of how fast earlier ones complete"""
+    rng = random.Random(seed)
+    latencies = []
+    statuses = defaultdict(int)
+    degraded = 0
+    in_flight = set()
+
+    async def one():
+        nonlocal degraded
+        start_time = time.perf_counter()
+        try:
+            response = await client.post('/api/generate-recipe', json=build_request(rng, users), timeout=timeout)
+            statuses[str(response.status_code)] += 1
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start_time)
+                if response.json().get('degraded'):
+                    degraded += 1
+        except httpx.TimeoutException:
+            statuses['timeout'] += 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+
+    started = time.perf_counter()
+    next_arrival = started
+    sent = 0
+    while next_arrival - started < duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(one())
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        sent += 1
+        next_arrival += rng.expovariate(rps)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    elapsed = time.perf_counter() - started
+
+    succeeded = statuses.get('200', 0)
+    return {
+        'sent': sent,
+        'succeeded': succeeded,
+        'degraded': degraded,
+        'statuses': dict(statuses),
+        'elapsed_seconds': round(elapsed, 3),
+        'offered_rps': rps,
+        'throughput_rps': round(succeeded / elapsed, 3) if elapsed else 0.0,
+        'error_rate': round(1 - succeeded / sent, 4) if sent else 0.0,
+        'latency_ms': {
+            q: round(percentile(latencies, f) * 1000, 3) if latencies else None
+            for q, f in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))
+        }
+    }
+
+# ---------------------------------------------------------------------------
+# Process management
+# ---------------------------------------------------------------------------
+
+def start_process(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable] + args, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def wait_until_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url, timeout=1.0)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Metrics that moved the wrong way by more than the tolerance"""
+    regressions = []
+    for path, higher_is_worse in COMPARED_METRICS:
+        current, previous = report, baseline
+        for part in path:
+            current = (current or {}).get(part)
+            previous = (previous or {}).get(part)
+        if current is None or previous is None:
+            continue
+        label = '.'.join(path)
+        if previous == 0:
+            if higher_is_worse and current > 0.01:
+                regressions.append(f"{label}: {previous} -> {current}")
+            continue
+        change = (current - previous) / previous
+        if (higher_is_worse and change > tolerance) or (not higher_is_worse and change < -tolerance):
+            regressions.append(f"{label}: {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+async def run(args) -> Dict[str, Any]:
+    host = '127.0.0.1'
+    ports = {
+        'cosmos': args.base_port,
+        'openai': args.base_port + 1,
+        'text_analytics': args.base_port + 2,
+        'redis': args.base_port + 3
+    }
+    env = dict(os.environ)
+    env.update(fake_environment(host, ports))
+    env['PYTHONPATH'] = BACKEND_DIR
+    for assignment in args.env or []:
+        key, _, value = assignment.partition('=')
+        env[key] = value
+
+    fake_args = ['-m', 'benchmarks.loadtest.fakes', '--host', host, '--base-port', str(args.base_port)]
+    if args.profile:
+        fake_args += ['--profile', os.path.abspath(args.profile)]
+    processes = [start_process(fake_args, env)]
+    try:
+        await wait_until_ready(f"http://{host}:{ports['openai']}/openai/models")
+        processes.append(start_process(
+            ['-m', 'uvicorn', 'main:app', '--host', host, '--port', str(args.app_port),
+             '--workers', str(args.workers), '--log-level', 'warning', '--no-access-log'],
+            env
+        ))
+        base_url = f"http://{host}:{args.app_port}"
+        await wait_until_ready(f"{base_url}/ready")
+
+        limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+            if args.warmup > 0:
+                await drive(client, args.rps, args.warmup, args.users, args.seed + 1, args.timeout)
+            before = await scrape(client)
+            client_report = await drive(client, args.rps, args.duration, args.users, args.seed, args.timeout)
+            after = await scrape(client)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        'config': {
+            'rps': args.rps,
+            'duration_seconds': args.duration,
+            'warmup_seconds': args.warmup,
+            'users': args.users,
+            'workers': args.workers,
+            'seed': args.seed,
+            'profile': args.profile,
+            'env': args.env or []
+        },
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'client': client_report,
+        'server': {
+            # With several workers each scrape only sees one process
+            'request_latency': summarize_histogram(before, after, 'http_request_duration_seconds', 'status',
+                                                   {'route': '/api/generate-recipe'}),
+            'stages': summarize_histogram(before, after, 'stage_duration_seconds', 'stage'),
+            'event_loop_lag': summarize_histogram(before, after, 'event_loop_lag_seconds', 'stage')
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/generate-recipe against local fakes")
+    parser.add_argument('--rps', type=float, default=10.0, help="Target arrival rate")
+    parser.add_argument('--duration', type=float, default=60.0, help="Measured run length in seconds")
+    parser.add_argument('--warmup', type=float, default=10.0, help="Unmeasured warm-up in seconds")
+    parser.add_argument('--users', type=int, default=200, help="Distinct user IDs to spread requests over (0 for anonymous)")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Client request timeout in seconds")
+    parser.add_argument('--max-connections', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers for the API")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--profile', help="Fake latency/error profile JSON")
+    parser.add_argument('--env', action='append', help="Extra KEY=VALUE passed to the API process")
+    parser.add_argument('--base-port', type=int, default=18080, help="First of four ports used by the fakes")
+    parser.add_argument('--app-port', type=int, default=18000)
+    parser.add_argument('--output', default='loadtest-results.json')
+    parser.add_argument('--compare', help="Baseline results JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed relative change before flagging a regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    client_report = report['client']
+    print(f"sent={client_report['sent']} ok={client_report['succeeded']} degraded={client_report['degraded']} "
+          f"throughput={client_report['throughput_rps']}rps latency_ms={client_report['latency_ms']}")
+    for stage, stats in report['server']['stages'].items():
+        lag = report['server']['event_loop_lag'].get(stage, {})
+        print(f"  {stage:<14} p50={stats['p50']:>9}ms p99={stats['p99']:>9}ms loop_lag_p99={lag.get('p99', '-')}ms")
+    print(f"Results written to {args.output}")
+
+    if report.get('regressions'):
+        print("Regressions against baseline:")
+        for line in report['regressions']:
+            print(f"  {line}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
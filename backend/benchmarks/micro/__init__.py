@@ -0,0 +1 @@
+# Micro-benchmarks for scoring and parsing 
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Seeded synthetic inputs for the micro-benchmarks.
+
+Everything here is deterministic for a given seed so that output digests in
+a baseline stay comparable across runs and machines.
+"""
+import random
+from typing import Dict, Any, List, Tuple
+
+from models.recipe import UserPreferences
+
+CUISINES = ["Indian", "Italian", "Asian", "Mexican", "Mediterranean", "American", "Thai", "Chinese", "Japanese", "Korean", "Fusion"]
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+COOKING_TIMES = [5, 10, 15, 20, 25, 30, 40, 45, 50, 60, 75, 90]
+TAGS = [
+    "quick", "vegetarian", "vegan", "spicy", "mild", "medium", "lunch", "dinner", "snack", "breakfast",
+    "kids", "healthy", "street food", "comfort", "one-pot", "party", "brunch", "late night snack"
+]
+
+# Includes the exact words the dietary rules look for, plus near-misses that only substring-match
+INGREDIENTS = [
+    "Yippee noodles", "onions", "tomatoes", "spices", "vegetables", "soy sauce", "ginger", "garlic",
+    "chicken", "egg", "paneer", "cheese", "butter", "peanut", "cashew", "bell peppers", "spinach",
+    "mushrooms", "corn", "chili", "basil", "coriander", "lemon", "cream", "tofu", "carrots", "peas",
+    "milk", "yogurt", "honey", "flour", "bread", "pasta", "wheat", "almond", "walnut", "fish", "lamb",
+    "peanut butter", "cream cheese", "egg noodles", "chicken stock", "green chili", "red chili flakes",
+    "spring onions", "cabbage", "beans", "capsicum", "curry leaves", "mustard seeds", "cumin", "turmeric",
+    "garam masala", "oregano", "olive oil", "sesame oil", "vinegar", "sugar", "salt", "black pepper"
+]
+TITLE_WORDS = ["Masala", "Stir Fry", "Bowl", "Delight", "Toss", "Twist", "Spicy Surprise", "Mild Medley", "Street Style"]
+
+PANTRY_SIZES = (0, 5, 20)
+RESTRICTION_SETS = (
+    (),
+    ("Vegetarian",),
+    ("Vegan", "Gluten-Free"),
+    ("Vegetarian", "Dairy-Free", "Nut-Free")
+)
+
+def synthetic_catalog(size: int, seed: int, ingredient_range: Tuple[int, int] = (2, 18)) -> List[Dict[str, Any]]:
+    """Base recipes with the same shape as the Cosmos recipes container"""
+    rng = random.Random(seed)
+    catalog = []
+    low, high = ingredient_range
+    for index in range(size):
+        cuisine = rng.choice(CUISINES)
+        tags = rng.sample(TAGS, rng.randint(0, 5))
+        if rng.random() < 0.5:
+            tags.append(cuisine.lower())
+        recipe = {
+            'id': f"base-{index + 1}",
+            'title': f"Yippee {cuisine} {rng.choice(TITLE_WORDS)} {index + 1}",
+            'cuisine': cuisine,
+            'difficulty': rng.choice(DIFFICULTIES),
+            'cooking_time': rng.choice(COOKING_TIMES),
+            'tags': tags,
+            'ingredients': rng.sample(INGREDIENTS, rng.randint(low, high)),
+            'type': 'base_recipe'
+        }
+        # Real documents are not perfectly uniform
+        roll = rng.random()
+        if roll < 0.02:
+            del recipe['tags']
+        elif roll < 0.04:
+            del recipe['cooking_time']
+        elif roll < 0.05:
+            del recipe['difficulty']
+        catalog.append(recipe)
+    return catalog
+
+def synthetic_pantry(size: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    pantry = rng.sample(INGREDIENTS, min(size, len(INGREDIENTS)))
+    # Users type partial and differently-cased names
+    return [item.upper() if rng.random() < 0.2 else item.split()[0] if rng.random() < 0.2 else item for item in pantry]
+
+def synthetic_preferences(seed: int) -> UserPreferences:
+    rng = random.Random(seed)
+    return UserPreferences(
+        cuisine=rng.choice(CUISINES[:-1]),
+        spice_level=rng.choice(["Mild", "Medium", "Spicy", "Extra Spicy"]),
+        meal_type=rng.sample(["Breakfast", "Lunch", "Dinner", "Snack"], rng.randint(1, 3)),
+        max_cooking_time=rng.choice(["15 mins", "30 mins", "45 mins", "60+ mins"]),
+        dietary_restrictions=[],
+        available_ingredients=[]
+    )
+
+def synthetic_profile(catalog: List[Dict[str, Any]], seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    return {
+        'user_id': 'bench-user',
+        'saved_recipes': [recipe['id'] for recipe in rng.sample(catalog, min(20, len(catalog)))],
+        'disliked_ingredients': rng.sample(INGREDIENTS, 2)
+    }
+
+# ---------------------------------------------------------------------------
+# LLM outputs
+# ---------------------------------------------------------------------------
+
+MALFORMATIONS = (
+    'clean',
+    'markdown',        # **Title:** headers and "1)" numbering
+    'crlf',            # Windows line endings and trailing spaces
+    'missing_fields',  # no title, description or tags
+    'bad_numbers',     # "Cooking Time: about twenty minutes", "(Time: a few minutes)"
+    'no_colons',       # ingredient lines without "name: quantity"
+    'truncated'        # cut off mid-line as if max_tokens was hit
+)
+LENGTHS = {'short': (3, 3), 'typical': (8, 7), 'long': (25, 20)}
+
+def synthetic_llm_output(rng: random.Random, ingredient_count: int, step_count: int, malformation: str) -> str:
+    title = f"Yippee! {rng.choice(CUISINES)} {rng.choice(TITLE_WORDS)}"
+    minutes = rng.choice(COOKING_TIMES)
+    lines = []
+    if malformation != 'missing_fields':
+        lines.append(f"Title: {title}")
+        lines.append(f"Description: A {rng.choice(['quick', 'hearty', 'fiery', 'comforting'])} noodle dish with {rng.choice(INGREDIENTS)}")
+    if malformation == 'bad_numbers':
+        lines.append("Cooking Time: about twenty minutes")
+    else:
+        lines.append(f"Cooking Time: {minutes} minutes")
+    lines.append(f"Difficulty: {rng.choice(DIFFICULTIES)}")
+    if malformation != 'missing_fields':
+        lines.append(f"Tags: {', '.join(rng.sample(TAGS, 3))}")
+    lines.append("")
+    lines.append("Ingredients:")
+    for ingredient in rng.sample(INGREDIENTS, min(ingredient_count, len(INGREDIENTS))):
+        quantity = rng.choice(["1 cup", "2 tbsp", "200g", "1", "2 packets", "a pinch", "1/2 tsp"])
+        if malformation == 'no_colons' and rng.random() < 0.5:
+            lines.append(f"- {quantity} {ingredient}")
+        else:
+            notes = rng.choice(["", ", finely chopped", " (optional)", ", to taste"])
+            lines.append(f"- {ingredient.capitalize()}: {quantity}{notes}")
+    lines.append("")
+    lines.append("Instructions:")
+    for step in range(1, step_count + 1):
+        action = rng.choice(["Boil", "Stir-fry", "Toss", "Simmer", "Garnish", "Season", "Mix", "Chop"])
+        target = rng.choice(INGREDIENTS)
+        if malformation == 'bad_numbers' and rng.random() < 0.3:
+            timing = " (Time: a few minutes)"
+        elif rng.random() < 0.7:
+            timing = f" (Time: {rng.randint(1, 15)} minutes)"
+        else:
+            timing = ""
+        number = f"{step})" if malformation == 'markdown' else f"{step}."
+        lines.append(f"{number} {action} the {target} until ready{timing}")
+    lines.append("")
+    lines.append("Serves 2. Enjoy your Yippee creation!")
+
+    if malformation == 'markdown':
+        lines = [
+            f"**{line.split(':', 1)[0]}:**{line.split(':', 1)[1]}" if ':' in line and line.split(':', 1)[0] in
+            ('Title', 'Description', 'Cooking Time', 'Difficulty', 'Tags') else line
+            for line in lines
+        ]
+        lines = [f"**{line}**" if line in ('Ingredients:', 'Instructions:') else line for line in lines]
+    text = '\n'.join(lines)
+    if malformation == 'crlf':
+        text = '\r\n'.join(line + '  ' for line in lines)
+    elif malformation == 'truncated':
+        text = text[:int(len(text) * rng.uniform(0.4, 0.9))]
+    return text
+
+def synthetic_llm_outputs(count: int, seed: int, length: str, malformation: str) -> List[str]:
+    rng = random.Random(seed)
+    ingredients, steps = LENGTHS[length]
+    return [synthetic_llm_output(rng, ingredients, steps, malformation) for _ in range(count)]
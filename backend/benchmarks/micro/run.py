@@ -0,0 +1,257 @@
+"""
+Micro-benchmarks for recommendation scoring and recipe parsing.
+
+Each case runs one engine function over a seeded synthetic input and records
+wall time, peak and retained memory, and a digest of the exact output. A
+baseline written with --write-baseline can later be checked with --check:
+any digest mismatch or a slowdown beyond the tolerance fails the run.
+
+    python -m benchmarks.micro.run --write-baseline benchmarks/micro/baseline.json
+    python -m benchmarks.micro.run --check benchmarks/micro/baseline.json
+    python -m benchmarks.micro.run --check benchmarks/micro/baseline.json \\
+        --engine score=services.fast_scoring:calculate_recipe_score
+"""
+import gc
+import sys
+import json
+import time
+import hashlib
+import logging
+import platform
+import argparse
+import importlib
+import statistics
+import tracemalloc
+import warnings
+from typing import Dict, Any, List, Callable, Tuple
+
+from benchmarks.micro import datasets
+
+# Engine functions under test; override with --engine name=module:function
+DEFAULT_ENGINES = {
+    'score': 'services.recommendation:calculate_recipe_score',
+    'violates': 'services.recommendation:violates_dietary_restrictions',
+    'convert': 'services.recommendation:convert_to_generated_recipe',
+    'parse': 'api.recipes:parse_generated_recipe'
+}
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+CONVERT_SAMPLE = 2000
+PARSE_SAMPLE = 200
+
+class Case:
+    """One benchmark: a prepared input, the workload over it and a canonical form of its output"""
+
+    def __init__(self, name: str, items: int, workload: Callable[[], Any], canonical: Callable[[Any], Any]):
+        self.name = name
+        self.items = items
+        self.workload = workload
+        self.canonical = canonical
+
+def load_engine(spec: str) -> Callable:
+    module_name, _, attribute = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+def _model_dump(value: Any) -> Any:
+    if hasattr(value, 'dict'):
+        return value.dict()
+    if isinstance(value, dict):
+        return {key: _model_dump(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_model_dump(item) for item in value]
+    return value
+
+def digest(canonical: Any) -> str:
+    # repr keeps full float precision so "equal" means bit-for-bit equal scores
+    encoded = json.dumps(canonical, sort_keys=True, default=repr, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def build_cases(engines: Dict[str, Callable], sizes: List[int], seed: int, selected: List[str]) -> List[Tuple[str, Callable[[], List[Case]]]]:
+    """Lazily built case groups so only one large catalog is alive at a time"""
+    groups = []
+
+    def scoring_group(size: int) -> List[Case]:
+        catalog = datasets.synthetic_catalog(size, seed)
+        preferences = datasets.synthetic_preferences(seed)
+        profile = datasets.synthetic_profile(catalog, seed)
+        cases = []
+        if 'score' in selected:
+            score = engines['score']
+            for pantry_size in datasets.PANTRY_SIZES:
+                pantry = datasets.synthetic_pantry(pantry_size, seed + pantry_size)
+                for label, restrictions, user_profile in (('open', [], None), ('restricted', ['Vegetarian', 'Nut-Free'], profile)):
+                    def workload(pantry=pantry, restrictions=restrictions, user_profile=user_profile):
+                        return [
+                            score(recipe=recipe, user_preferences=preferences, dietary_restrictions=restrictions,
+                                  available_ingredients=pantry, user_profile=user_profile)
+                            for recipe in catalog
+                        ]
+                    cases.append(Case(f"score/{size}/pantry{pantry_size}/{label}", size, workload, lambda out: [repr(s) for s in out]))
+        if 'violates' in selected:
+            violates = engines['violates']
+            for restrictions in datasets.RESTRICTION_SETS:
+                label = '+'.join(r.lower() for r in restrictions) or 'none'
+                def workload(restrictions=list(restrictions)):
+                    return [violates(recipe, restrictions) for recipe in catalog]
+                cases.append(Case(f"violates/{size}/{label}", size, workload, lambda out: ''.join('1' if v else '0' for v in out)))
+        return cases
+
+    if 'score' in selected or 'violates' in selected:
+        for size in sizes:
+            groups.append((f"catalog {size}", lambda size=size: scoring_group(size)))
+
+    if 'convert' in selected:
+        def convert_group() -> List[Case]:
+            catalog = datasets.synthetic_catalog(CONVERT_SAMPLE, seed)
+            convert = engines['convert']
+            return [Case(f"convert/{CONVERT_SAMPLE}", CONVERT_SAMPLE, lambda: [convert(recipe) for recipe in catalog], _model_dump)]
+        groups.append(('convert', convert_group))
+
+    if 'parse' in selected:
+        def parse_group() -> List[Case]:
+            parse = engines['parse']
+            cases = []
+            for length in datasets.LENGTHS:
+                for malformation in datasets.MALFORMATIONS:
+                    texts = datasets.synthetic_llm_outputs(PARSE_SAMPLE, seed, length, malformation)
+                    cases.append(Case(f"parse/{length}/{malformation}", len(texts), lambda texts=texts: [parse(text) for text in texts], _model_dump))
+            return cases
+        groups.append(('parse', parse_group))
+
+    return groups
+
+def time_case(case: Case, min_time: float, max_repeat: int) -> Tuple[Any, List[float]]:
+    timings = []
+    output = None
+    gc_was_enabled = gc.isenabled()
+    try:
+        while not timings or (sum(timings) < min_time and len(timings) < max_repeat):
+            output = None
+            gc.collect()
+            gc.disable()
+            start_time = time.perf_counter()
+            output = case.workload()
+            timings.append(time.perf_counter() - start_time)
+            if gc_was_enabled:
+                gc.enable()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return output, timings
+
+def measure_memory(case: Case) -> Dict[str, int]:
+    """Peak and retained traced memory for one run; tracemalloc is too slow to combine with timing"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline_bytes = tracemalloc.get_traced_memory()[0]
+        before = tracemalloc.take_snapshot()
+        output = case.workload()
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+        del output
+    finally:
+        tracemalloc.stop()
+    return {
+        'peak_bytes': peak_bytes - baseline_bytes,
+        'retained_bytes': current_bytes - baseline_bytes,
+        'retained_blocks': retained_blocks
+    }
+
+def run_case(case: Case, min_time: float, max_repeat: int, memory: bool) -> Dict[str, Any]:
+    output, timings = time_case(case, min_time, max_repeat)
+    result = {
+        'items': case.items,
+        'repeats': len(timings),
+        'seconds_min': round(min(timings), 6),
+        'seconds_median': round(statistics.median(timings), 6),
+        'ns_per_item': round(min(timings) / max(case.items, 1) * 1e9, 1),
+        'digest': digest(case.canonical(output))
+    }
+    del output
+    if memory:
+        result.update(measure_memory(case))
+    return result
+
+def check(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    failures = []
+    for name, current in results.items():
+        expected = baseline.get('cases', {}).get(name)
+        if expected is None:
+            continue
+        if current['digest'] != expected['digest']:
+            failures.append(f"{name}: output differs from baseline")
+        slowdown = current['seconds_min'] / expected['seconds_min'] - 1 if expected['seconds_min'] else 0.0
+        if slowdown > tolerance:
+            failures.append(f"{name}: {expected['seconds_min']:.4f}s -> {current['seconds_min']:.4f}s ({slowdown:+.1%})")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for recipe scoring and parsing")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES), help="Comma-separated catalog sizes")
+    parser.add_argument('--only', default=','.join(DEFAULT_ENGINES), help="Comma-separated subset of: " + ', '.join(DEFAULT_ENGINES))
+    parser.add_argument('--engine', action='append', default=[], help="Replace an engine function, e.g. score=pkg.module:func")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.5, help="Keep repeating a case until this many seconds have been spent")
+    parser.add_argument('--max-repeat', type=int, default=7)
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--output', help="Write results JSON here")
+    parser.add_argument('--write-baseline', help="Write results as a new baseline")
+    parser.add_argument('--check', help="Baseline to compare outputs and timings against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown before a case fails")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    warnings.filterwarnings('ignore', category=DeprecationWarning)
+
+    engine_specs = dict(DEFAULT_ENGINES)
+    for override in args.engine:
+        name, _, spec = override.partition('=')
+        engine_specs[name] = spec
+    engines = {name: load_engine(spec) for name, spec in engine_specs.items()}
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    selected = [name for name in args.only.split(',') if name]
+
+    results = {}
+    for label, build in build_cases(engines, sizes, args.seed, selected):
+        print(f"== {label}")
+        for case in build():
+            result = run_case(case, args.min_time, args.max_repeat, not args.no_memory)
+            results[case.name] = result
+            memory = f" peak={result['peak_bytes'] / 1024:.0f}KiB" if 'peak_bytes' in result else ''
+            print(f"  {case.name:<42} {result['seconds_min'] * 1000:>10.2f}ms {result['ns_per_item']:>10.0f}ns/item{memory}")
+        gc.collect()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'engines': engine_specs,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        },
+        'cases': results
+    }
+    for path in (args.output, args.write_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write('\n')
+
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('seed') != args.seed:
+            print(f"Baseline was recorded with seed {baseline['meta'].get('seed')}; digests are not comparable")
+            sys.exit(2)
+        failures = check(results, baseline, args.tolerance)
+        if failures:
+            print("Baseline check failed:")
+            for line in failures:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"Baseline check passed for {sum(1 for name in results if name in baseline['cases'])} cases")
+
+if __name__ == '__main__':
+    main()
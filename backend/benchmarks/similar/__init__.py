@@ -0,0 +1 @@
+# Similar recipes index benchmark 
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""
+Build time, query latency and recall of the similar recipes index.
+
+For each catalog size the index is built over a seeded synthetic catalog,
+then a sample of its recipes is queried at several --nprobe settings.
+Recall@k is measured against an exact scan of the same vectors and counts
+a result as correct when it scores at least as high as the exact k-th
+neighbor, so ties between identical recipes do not count as misses.
+
+    python -m benchmarks.similar.run --sizes 10000,100000 --output similar.json
+    python -m benchmarks.similar.run --sizes 1000000 --queries 200
+"""
+import json
+import time
+import argparse
+import statistics
+from typing import Dict, Any, List
+
+import numpy as np
+
+from benchmarks.micro import datasets
+from services.similar_recipes import SimilarIndex
+
+def percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 3)
+
+def measure(size: int, queries: int, nprobes: List[int], limit: int, seed: int) -> Dict[str, Any]:
+    catalog = datasets.synthetic_catalog(size, seed)
+    started = time.perf_counter()
+    index = SimilarIndex.build(catalog, seed=seed)
+    build_seconds = time.perf_counter() - started
+
+    exact = index.vectors[:index.count].astype(np.float32) / 127
+    exact /= np.maximum(np.linalg.norm(exact, axis=1, keepdims=True), 1e-9)
+    rows = np.random.default_rng(seed).choice(size, size=min(queries, size), replace=False)
+
+    results = {}
+    for nprobe in nprobes:
+        latencies, recalls = [], []
+        for row in rows:
+            vector = exact[row]
+            started = time.perf_counter()
+            found = index.search(vector, limit, nprobe=nprobe, exclude=int(row))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+            scores = exact @ vector
+            scores[row] = -np.inf
+            kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            recalls.append(sum(1 for match, _ in found if scores[match] >= kth - 1e-6) / limit)
+        results[str(nprobe)] = {
+            'p50_ms': percentile(latencies, 50),
+            'p99_ms': percentile(latencies, 99),
+            f"recall_at_{limit}": round(statistics.mean(recalls), 3)
+        }
+        print(f"{size:>8} recipes nprobe={nprobe:<3} p50={results[str(nprobe)]['p50_ms']}ms "
+              f"p99={results[str(nprobe)]['p99_ms']}ms recall@{limit}={results[str(nprobe)][f'recall_at_{limit}']}")
+
+    return {
+        'build_seconds': round(build_seconds, 2),
+        'lists': len(index.centroids),
+        'vector_mb': round(index.vectors.nbytes / 2**20, 1),
+        'nprobe': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the similar recipes index")
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')], default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--nprobe', type=lambda value: [int(n) for n in value.split(',')], default=[4, 8, 16, 32])
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default='similar-results.json')
+    args = parser.parse_args()
+
+    report = {
+        'config': {'sizes': args.sizes, 'queries': args.queries, 'nprobe': args.nprobe, 'limit': args.limit, 'seed': args.seed},
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': {str(size): measure(size, args.queries, args.nprobe, args.limit, args.seed) for size in args.sizes}
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# Import and cold-start benchmark 
\ No newline at end of file
@@ -0,0 +1,254 @@
+"""
+Import and cold-start benchmark for the API.
+
+Measures, over several fresh processes:
+
+- import: wall time of `import main` and the import time spent in each
+  top-level package, from `python -X importtime`
+- startup: time until /health answers (live) and until /ready returns 200
+  (warmed up), with the API pointed at the local fakes
+- first requests: latency of the first and second call to the generation
+  and recipe endpoints, so cold-path costs that warm-up misses show up
+
+    python -m benchmarks.startup.run --runs 5 --output startup.json
+    python -m benchmarks.startup.run --runs 5 --compare startup.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from benchmarks.loadtest.fakes import fake_environment
+from benchmarks.loadtest.run import BACKEND_DIR, build_request, start_process
+
+# Metrics compared against a baseline, all lower is better
+COMPARED_METRICS = [
+    ('import', 'main_seconds'),
+    ('startup', 'live_seconds'),
+    ('startup', 'ready_seconds'),
+    ('first_requests', 'generate_first_ms'),
+    ('first_requests', 'recipe_first_ms')
+]
+
+# Azure settings cleared for --mock so every service falls back to mock mode
+AZURE_SETTINGS = (
+    'COSMOS_DB_CONNECTION_STRING', 'REDIS_CONNECTION_STRING', 'AZURE_LANGUAGE_ENDPOINT', 'AZURE_LANGUAGE_KEY',
+    'AZURE_OPENAI_ENDPOINT', 'AZURE_OPENAI_KEY', 'AZURE_OPENAI_POOL', 'APPLICATIONINSIGHTS_CONNECTION_STRING'
+)
+
+def measure_imports(env: Dict[str, str], top: int) -> Dict[str, Any]:
+    """Wall time of `import main` plus self time summed per top-level package"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+
+    main_seconds = None
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue
+        name = name.strip()
+        if name == 'main':
+            main_seconds = int(cumulative_us) / 1e6
+        packages[name.split('.')[0]] += int(self_us) / 1e6
+    return {
+        'process_seconds': wall,
+        'main_seconds': main_seconds,
+        'slowest': dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top])
+    }
+
+async def wait_for_status(client: httpx.AsyncClient, path: str, started: float, timeout: float) -> float:
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get(path, timeout=1.0)).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.02)
+    raise RuntimeError(f"{path} did not return 200 within {timeout}s")
+
+async def timed(client: httpx.AsyncClient, method: str, path: str, **kwargs) -> Optional[float]:
+    started = time.perf_counter()
+    response = await client.request(method, path, **kwargs)
+    if response.status_code == 404:
+        # Catalog recipes only exist when running against the fakes
+        return None
+    response.raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+async def measure_startup(env: Dict[str, str], host: str, port: int, seed: int, timeout: float) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    process = start_process(['-m', 'uvicorn', 'main:app', '--host', host, '--port', str(port),
+                             '--log-level', 'warning', '--no-access-log'], env)
+    started = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(base_url=f"http://{host}:{port}", timeout=timeout) as client:
+            live = await wait_for_status(client, '/health', started, timeout)
+            ready = await wait_for_status(client, '/ready', started, timeout)
+            report = (await client.get('/ready')).json()
+
+            requests = {}
+            for attempt in ('first', 'second'):
+                requests[f"generate_{attempt}_ms"] = await timed(client, 'POST', '/api/generate-recipe', json=build_request(rng, 50))
+            for attempt in ('first', 'second'):
+                requests[f"recipe_{attempt}_ms"] = await timed(client, 'GET', '/api/recipes/base-1')
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    return {
+        'live_seconds': live,
+        'ready_seconds': ready,
+        'warmup_seconds': report['warmup']['seconds'],
+        'dependencies': {name: state['seconds'] for name, state in report['dependencies'].items()},
+        'requests': requests
+    }
+
+def median_of(values: List[Optional[float]], digits: int = 4) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), digits) if values else None
+
+def summarize(imports: List[Dict[str, Any]], startups: List[Dict[str, Any]]) -> Dict[str, Any]:
+    slowest = defaultdict(list)
+    for run in imports:
+        for name, seconds in run['slowest'].items():
+            slowest[name].append(seconds)
+    dependencies = defaultdict(list)
+    requests = defaultdict(list)
+    for run in startups:
+        for name, seconds in run['dependencies'].items():
+            dependencies[name].append(seconds)
+        for name, value in run['requests'].items():
+            requests[name].append(value)
+
+    return {
+        'import': {
+            'process_seconds': median_of([run['process_seconds'] for run in imports]),
+            'main_seconds': median_of([run['main_seconds'] for run in imports]),
+            'slowest': dict(sorted(((name, median_of(values)) for name, values in slowest.items()),
+                                   key=lambda item: item[1], reverse=True))
+        },
+        'startup': {
+            'live_seconds': median_of([run['live_seconds'] for run in startups]),
+            'ready_seconds': median_of([run['ready_seconds'] for run in startups]),
+            'warmup_seconds': median_of([run['warmup_seconds'] for run in startups]),
+            'dependencies': {name: median_of(values) for name, values in dependencies.items()}
+        },
+        'first_requests': {name: median_of(values, 2) for name, values in requests.items()}
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for section, key in COMPARED_METRICS:
+        current = report.get(section, {}).get(key)
+        previous = baseline.get(section, {}).get(key)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if change > tolerance:
+            regressions.append(f"{section}.{key}: {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+async def run(args) -> Dict[str, Any]:
+    host = '127.0.0.1'
+    env = dict(os.environ)
+    env['PYTHONPATH'] = BACKEND_DIR
+    processes = []
+    if args.mock:
+        for key in AZURE_SETTINGS:
+            env.pop(key, None)
+    else:
+        ports = {
+            'cosmos': args.base_port,
+            'openai': args.base_port + 1,
+            'text_analytics': args.base_port + 2,
+            'redis': args.base_port + 3
+        }
+        env.update(fake_environment(host, ports))
+        fake_args = ['-m', 'benchmarks.loadtest.fakes', '--host', host, '--base-port', str(args.base_port)]
+        if args.profile:
+            fake_args += ['--profile', os.path.abspath(args.profile)]
+        processes.append(start_process(fake_args, env))
+    for assignment in args.env or []:
+        key, _, value = assignment.partition('=')
+        env[key] = value
+
+    try:
+        if processes:
+            async with httpx.AsyncClient() as client:
+                await wait_for_status(client, f"http://{host}:{args.base_port + 1}/openai/models", time.perf_counter(), 30)
+
+        imports, startups = [], []
+        for index in range(args.runs):
+            imports.append(measure_imports(env, args.top))
+            startups.append(await measure_startup(env, host, args.app_port, args.seed + index, args.timeout))
+            print(f"run {index + 1}: import={imports[-1]['main_seconds']:.3f}s "
+                  f"live={startups[-1]['live_seconds']:.3f}s ready={startups[-1]['ready_seconds']:.3f}s")
+    finally:
+        for process in processes:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = summarize(imports, startups)
+    report['config'] = {'runs': args.runs, 'mock': args.mock, 'profile': args.profile, 'env': args.env or []}
+    report['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import time, time to ready and first-request latency")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh processes to measure; medians are reported")
+    parser.add_argument('--top', type=int, default=10, help="Slowest top-level packages to report")
+    parser.add_argument('--mock', action='store_true', help="Start without any Azure settings instead of against the fakes")
+    parser.add_argument('--profile', help="Fake latency/error profile JSON")
+    parser.add_argument('--env', action='append', help="Extra KEY=VALUE passed to the API process")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Limit on reaching /ready and on each request")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--base-port', type=int, default=18080, help="First of four ports used by the fakes")
+    parser.add_argument('--app-port', type=int, default=18000)
+    parser.add_argument('--output', default='startup-results.json')
+    parser.add_argument('--compare', help="Baseline results JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"import main={report['import']['main_seconds']}s live={report['startup']['live_seconds']}s "
+          f"ready={report['startup']['ready_seconds']}s first_requests_ms={report['first_requests']}")
+    for name, seconds in report['import']['slowest'].items():
+        print(f"  {name:<32} {seconds * 1000:>8.1f}ms")
+    print(f"Results written to {args.output}")
+
+    if report.get('regressions'):
+        print("Regressions against baseline:")
+        for line in report['regressions']:
+            print(f"  {line}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
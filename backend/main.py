@@ -1,14 +1,28 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Import our modules
 from api.recipes import router as recipes_router
+from api.jobs import router as jobs_router
 from services.database import init_cosmos_db
 from services.monitoring import setup_monitoring
+from services.ai_integrations import init_ai_clients
+from services.user_profile import init_redis, close_redis
+from services.llm_pool import close_llm_pool
+from services.readiness import warm_up, check_readiness
+from services.similar_recipes import start_similar_index, stop_similar_index
+from services.pregeneration import start_pregeneration, stop_pregeneration
+from middleware.admission import AdmissionControlMiddleware, get_admission_stats
+from middleware.timing import RequestTimingMiddleware
+from middleware.telemetry import TailSamplingMiddleware
+from middleware.compression import CompressionMiddleware
+from services.metrics import render_prometheus, start_event_loop_monitor
 
 # Load environment variables
 load_dotenv()
@@ -17,42 +31,87 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Initialize services on startup, then warm them up in the background.
+    /health answers as soon as the app is up; /ready waits for warm-up.
+    """
+    try:
+        setup_monitoring()
+        await init_cosmos_db()
+        init_ai_clients()
+        await init_redis()
+        start_event_loop_monitor()
+        logger.info("Application started successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize application: {e}")
+        raise
+    
+    warmup_task = asyncio.create_task(warm_up())
+    start_similar_index()
+    start_pregeneration()
+    yield
+    
+    warmup_task.cancel()
+    await stop_pregeneration()
+    await stop_similar_index()
+    await close_llm_pool()
+    await close_redis()
+
 # Create FastAPI app
 app = FastAPI(
     title="ITC Yippee Recipe Generator API",
     description="AI-Powered Personalized Recipe Generator for ITC Yippee",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Add CORS middleware
+# Compress large responses with brotli or gzip as the client accepts
+app.add_middleware(CompressionMiddleware)
+
+# Add admission control so overload is shed with a fast 503 instead of queueing without bound
+app.add_middleware(AdmissionControlMiddleware)
+
+# Add CORS middleware outside admission control so shed 503s carry CORS headers
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Configure appropriately for production
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
-# Setup monitoring
-setup_monitoring()
+# Record request latency outside admission control so shed requests are timed too
+app.add_middleware(RequestTimingMiddleware)
+
+# Buffer per-request logs so tail sampling can keep slow and failed requests
+app.add_middleware(TailSamplingMiddleware)
 
 # Include routers
 app.include_router(recipes_router, prefix="/api")
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup"""
-    try:
-        await init_cosmos_db()
-        logger.info("Application started successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize application: {e}")
-        raise
+app.include_router(jobs_router, prefix="/api")
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "service": "ITC Yippee Recipe Generator API"}
+    """Liveness check; does not wait on dependencies"""
+    return {
+        "status": "healthy",
+        "service": "ITC Yippee Recipe Generator API",
+        "admission": get_admission_stats()
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check with per-dependency status; 503 until warm-up succeeds"""
+    ready, report = await check_readiness()
+    return JSONResponse(report, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
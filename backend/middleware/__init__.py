@@ -0,0 +1 @@
+# Middleware package for ITC Yippee Recipe Generator 
\ No newline at end of file
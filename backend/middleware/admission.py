@@ -0,0 +1,174 @@
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from services.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+# Admission control settings
+DEFAULT_CONCURRENCY = int(os.getenv('ADMISSION_DEFAULT_CONCURRENCY', '64'))
+ROUTE_CONCURRENCY = json.loads(os.getenv('ADMISSION_ROUTE_LIMITS', '{"/api/generate-recipe": 16}'))
+QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '32'))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv('ADMISSION_QUEUE_TIMEOUT_MS', '2000')) / 1000
+RETRY_AFTER_SECONDS = int(os.getenv('ADMISSION_RETRY_AFTER_SECONDS', '2'))
+BYPASS_PATHS = set(os.getenv('ADMISSION_BYPASS_PATHS', '/,/health,/ready,/metrics').split(','))
+BYPASS_GET = os.getenv('ADMISSION_BYPASS_GET', 'true').lower() == 'true'
+
+# One gate per route template
+route_gates = {}
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class RouteGate:
+    """Concurrency cap with a bounded FIFO wait queue"""
+
+    def __init__(self, route: str, limit: int, queue_size: int):
+        self.route = route
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters = deque()
+        self.admitted_count = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    async def acquire(self, timeout: float):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self.admitted_count += 1
+            return
+
+        if len(self.waiters) >= self.queue_size:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        admitted = False
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            admitted = True
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise AdmissionRejected("queue_timeout")
+        finally:
+            if not admitted:
+                if waiter.done() and not waiter.cancelled():
+                    # Handed a slot just as the request was cancelled; pass it on
+                    self.release()
+                else:
+                    try:
+                        self.waiters.remove(waiter)
+                    except ValueError:
+                        pass
+        self.admitted_count += 1
+
+    def release(self):
+        # Hand the slot straight to the oldest live waiter
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'queue_depth': len(self.waiters),
+            'admitted': self.admitted_count,
+            'rejected_queue_full': self.rejected_queue_full,
+            'rejected_timeout': self.rejected_timeout
+        }
+
+def route_template(app, scope, default: str = None) -> str:
+    """Resolve the route template so that /recipes/1 and /recipes/2 share one gate"""
+    for route in getattr(app, 'routes', []):
+        try:
+            match, _ = route.matches(scope)
+        except Exception:
+            continue
+        if match == Match.FULL:
+            return getattr(route, 'path', scope['path'])
+    return default if default is not None else scope['path']
+
+def _get_gate(route: str) -> RouteGate:
+    gate = route_gates.get(route)
+    if gate is None:
+        limit = ROUTE_CONCURRENCY.get(route, DEFAULT_CONCURRENCY)
+        gate = RouteGate(route, limit, QUEUE_SIZE)
+        route_gates[route] = gate
+    return gate
+
+class AdmissionControlMiddleware:
+    """
+    Per-route concurrency caps with a bounded wait queue.
+
+    Requests that find the queue full, or that wait longer than the queueing
+    deadline, get an immediate 503 with Retry-After instead of piling up.
+    CORS preflights are never gated. Register it before CORSMiddleware so the
+    503 carries CORS headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] != 'http'
+            or scope['path'] in BYPASS_PATHS
+            or scope['method'] == 'OPTIONS'
+            or (BYPASS_GET and scope['method'] in ('GET', 'HEAD'))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        gate = _get_gate(route_template(scope['app'], scope))
+        try:
+            await gate.acquire(QUEUE_TIMEOUT_SECONDS)
+        except AdmissionRejected as e:
+            logger.warning(f"Shedding request to {gate.route}: {e.reason}")
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Service is overloaded, please retry shortly"},
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+def get_admission_stats() -> Dict[str, Dict[str, Any]]:
+    """Queue depth, in-flight and rejection counts per route"""
+    return {route: gate.stats() for route, gate in route_gates.items()}
+
+def _collect_admission_metrics():
+    stats = get_admission_stats()
+    return [
+        ('admission_in_flight', 'gauge', 'Requests currently admitted per route',
+         [({'route': route}, s['active']) for route, s in stats.items()]),
+        ('admission_queue_depth', 'gauge', 'Requests waiting for admission per route',
+         [({'route': route}, s['queue_depth']) for route, s in stats.items()]),
+        ('admission_admitted_total', 'counter', 'Requests admitted per route',
+         [({'route': route}, s['admitted']) for route, s in stats.items()]),
+        ('admission_rejected_total', 'counter', 'Requests shed per route and reason',
+         [({'route': route, 'reason': 'queue_full'}, s['rejected_queue_full']) for route, s in stats.items()] +
+         [({'route': route, 'reason': 'queue_timeout'}, s['rejected_timeout']) for route, s in stats.items()])
+    ]
+
+register_collector(_collect_admission_metrics)
@@ -0,0 +1,117 @@
+import os
+import gzip
+import logging
+
+from services.metrics import counter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this cost more to compress than they save on the wire
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+
+compressed_bytes = counter('http_response_compressed_bytes_total', 'Response bytes before and after compression by encoding')
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0"""
+    offered = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[coding.strip().lower()] = quality
+    wildcard = offered.get('*', 0.0)
+
+    candidates = (['br'] if brotli else []) + ['gzip']
+    for coding in candidates:
+        if offered.get(coding, wildcard) > 0:
+            return coding
+    return 'identity'
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """
+    Compress complete response bodies with brotli or gzip as negotiated.
+
+    Streaming responses and bodies under COMPRESSION_MIN_BYTES pass through
+    untouched. Strong ETags are weakened on compressed responses since the
+    bytes no longer match the identity representation.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ''
+        for name, value in scope['headers']:
+            if name == b'accept-encoding':
+                accept_encoding = value.decode('latin-1')
+                break
+        coding = negotiate_encoding(accept_encoding) if accept_encoding else 'identity'
+        if coding == 'identity':
+            await self.app(scope, receive, send)
+            return
+
+        state = {'start': None, 'passthrough': False}
+
+        async def send_wrapper(message):
+            if state['passthrough']:
+                await send(message)
+                return
+
+            if message['type'] == 'http.response.start':
+                state['start'] = message
+                return
+
+            start = state['start']
+            body = message.get('body', b'')
+            headers = [(name, value) for name, value in start['headers']]
+            already_encoded = any(name == b'content-encoding' for name, value in headers)
+            if message.get('more_body', False) or already_encoded or len(body) < COMPRESSION_MIN_BYTES:
+                # Streaming, pre-encoded or small: send as is from here on
+                state['passthrough'] = True
+                await send(start)
+                await send(message)
+                return
+
+            compressed = compress(body, coding)
+            compressed_bytes.inc(len(body), encoding=coding, stage='before')
+            compressed_bytes.inc(len(compressed), encoding=coding, stage='after')
+
+            rewritten = []
+            for name, value in headers:
+                if name == b'content-length':
+                    continue
+                if name == b'etag' and not value.startswith(b'W/'):
+                    value = b'W/' + value
+                if name == b'vary':
+                    continue
+                rewritten.append((name, value))
+            vary = [value for name, value in headers if name == b'vary']
+            rewritten.append((b'vary', b', '.join(vary + [b'Accept-Encoding'])))
+            rewritten.append((b'content-encoding', coding.encode('latin-1')))
+            rewritten.append((b'content-length', str(len(compressed)).encode('latin-1')))
+
+            await send({**start, 'headers': rewritten})
+            await send({'type': 'http.response.body', 'body': compressed, 'more_body': False})
+
+        await self.app(scope, receive, send_wrapper)
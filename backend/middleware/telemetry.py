@@ -0,0 +1,31 @@
+import time
+import logging
+
+from services.telemetry import begin_request, end_request
+
+logger = logging.getLogger(__name__)
+
+class TailSamplingMiddleware:
+    """Hold each request's low-severity logs until its latency and status are known"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_holder = {'status': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status_holder['status'] = message['status']
+            await send(message)
+
+        token = begin_request()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_request(token, time.perf_counter() - start_time, status_holder['status'])
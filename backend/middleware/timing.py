@@ -0,0 +1,44 @@
+import time
+import logging
+
+from middleware.admission import route_template
+from services.metrics import histogram, counter, gauge
+from services.cosmos_metrics import current_route
+
+logger = logging.getLogger(__name__)
+
+request_duration = histogram('http_request_duration_seconds', 'End-to-end HTTP request latency')
+requests_total = counter('http_requests_total', 'HTTP requests by route, method and status')
+requests_in_flight = gauge('http_requests_in_flight', 'HTTP requests currently being processed')
+
+class RequestTimingMiddleware:
+    """Record request latency per route template, method and status code"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_holder = {'status': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status_holder['status'] = message['status']
+            await send(message)
+
+        route = route_template(scope['app'], scope, default='unmatched')
+        # Lets downstream accounting, such as Cosmos request charges, attribute work to the route
+        route_token = current_route.set(route)
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requests_in_flight.dec()
+            current_route.reset(route_token)
+            status = str(status_holder['status'])
+            request_duration.observe(time.perf_counter() - start_time, route=route, method=scope['method'], status=status)
+            requests_total.inc(route=route, method=scope['method'], status=status)
@@ -63,6 +63,18 @@ class RecipeInstruction(BaseModel):
     instruction: str = Field(..., description="Cooking instruction")
     time_minutes: Optional[int] = Field(None, description="Time required for this step")
 
+class BaseRecipe(BaseModel):
+    id: str = Field(..., min_length=1, description="Catalog recipe ID, prefixed with base-")
+    title: str = Field(..., min_length=1, description="Recipe title")
+    description: Optional[str] = Field(None, description="Recipe description")
+    cuisine: str = Field(..., min_length=1, description="Cuisine type")
+    difficulty: str = Field("Medium", description="Easy, Medium or Hard")
+    cooking_time: int = Field(..., gt=0, le=600, description="Total cooking time in minutes")
+    tags: List[str] = Field(default=[], description="Recipe tags")
+    ingredients: List[str] = Field(..., min_length=1, description="Ingredient names")
+    image_url: Optional[str] = Field(None, description="Recipe image URL")
+    nutrition_info: Optional[Dict[str, Any]] = Field(None, description="Nutritional information")
+
 class GeneratedRecipe(BaseModel):
     id: str = Field(..., description="Unique recipe ID")
     title: str = Field(..., description="Recipe title")
@@ -78,17 +90,22 @@ class GeneratedRecipe(BaseModel):
     tags: List[str] = Field(default=[], description="Recipe tags")
     created_at: str = Field(..., description="Creation timestamp")
     user_id: Optional[str] = Field(None, description="User ID who generated this recipe")
+    reused_from: Optional[str] = Field(None, description="ID of the stored recipe this one was copied from")
 
 class RecipeGenerationResponse(BaseModel):
     recipe: GeneratedRecipe = Field(..., description="Generated recipe")
     recommendations: List[GeneratedRecipe] = Field(default=[], description="Recommended recipes")
     nlp_insights: Optional[Dict[str, Any]] = Field(None, description="NLP analysis insights")
+    degraded: bool = Field(False, description="True when the recipe was synthesized from the catalog because generation failed, exceeded its latency budget or the daily token budget was spent")
 
 class UserProfile(BaseModel):
     user_id: str = Field(..., description="Unique user ID")
     preferences: UserPreferences = Field(..., description="User preferences")
-    saved_recipes: List[str] = Field(default=[], description="List of saved recipe IDs")
+    saved_recipes: List[str] = Field(default=[], description="Most recently saved recipe IDs, oldest first; the full list is in the history store")
+    saved_recipes_count: int = Field(0, description="Number of recipes saved")
     disliked_ingredients: List[str] = Field(default=[], description="Ingredients user dislikes")
-    cooking_history: List[str] = Field(default=[], description="List of previously generated recipe IDs")
+    cooking_history: List[str] = Field(default=[], description="Most recently generated recipe IDs, newest first; the full list is in the history store")
+    cooking_history_count: int = Field(0, description="Number of recipes generated")
+    cooked_base_recipes: List[str] = Field(default=[], description="Catalog recipes the most recent generations were based on, newest first")
     created_at: str = Field(..., description="Profile creation timestamp")
     updated_at: str = Field(..., description="Last update timestamp") 
\ No newline at end of file
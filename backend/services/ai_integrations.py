@@ -1,12 +1,14 @@
 import os
+import time
 import logging
 import httpx
 from typing import Dict, Any, List, Optional
-from azure.ai.textanalytics import TextAnalyticsClient
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
 import asyncio
 
+from services import llm_pool
+from services.metrics import stage_timer
+from services.ai_usage import record_ai_call
+
 logger = logging.getLogger(__name__)
 
 # Azure AI Language client
@@ -15,8 +17,37 @@ text_analytics_client = None
 # Azure OpenAI client
 openai_client = None
 
+# Image shown when image generation fails or is skipped
+FALLBACK_IMAGE_URL = "https://via.placeholder.com/1024x1024/FF6B35/FFFFFF?text=Recipe+Image"
+
+# Generic recipe returned when generation fails
+FALLBACK_RECIPE_TEXT = """
+Title: Yippee! Classic Masala
+Description: A simple and delicious Yippee noodles recipe
+Cooking Time: 15 minutes
+Difficulty: Easy
+Tags: classic, vegetarian, quick
+
+Ingredients:
+- Yippee noodles: 1 packet
+- Onions: 1, chopped
+- Tomatoes: 1, chopped
+- Oil: 1 tbsp
+- Salt: to taste
+
+Instructions:
+1. Boil noodles according to package instructions (Time: 5 minutes)
+2. Heat oil and sauté onions (Time: 3 minutes)
+3. Add tomatoes and cook (Time: 3 minutes)
+4. Add noodles and mix well (Time: 2 minutes)
+5. Serve hot (Time: 2 minutes)
+"""
+
 def init_ai_clients():
-    """Initialize Azure AI service clients"""
+    """
+    Initialize Azure AI service clients. The SDKs are imported here rather
+    than at module level so they are only loaded when configured.
+    """
     global text_analytics_client, openai_client
     
     try:
@@ -25,6 +56,9 @@ def init_ai_clients():
         language_key = os.getenv('AZURE_LANGUAGE_KEY')
         
         if language_endpoint and language_key:
+            from azure.ai.textanalytics import TextAnalyticsClient
+            from azure.core.credentials import AzureKeyCredential
+            
             text_analytics_client = TextAnalyticsClient(
                 endpoint=language_endpoint,
                 credential=AzureKeyCredential(language_key)
@@ -39,6 +73,8 @@ def init_ai_clients():
         openai_api_version = os.getenv('AZURE_OPENAI_API_VERSION', '2023-12-01-preview')
         
         if openai_endpoint and openai_key:
+            from openai import AzureOpenAI
+            
             openai_client = AzureOpenAI(
                 azure_endpoint=openai_endpoint,
                 api_key=openai_key,
@@ -47,10 +83,24 @@ def init_ai_clients():
             logger.info("Azure OpenAI client initialized")
         else:
             logger.warning("Azure OpenAI credentials not found, using mock mode")
+        
+        # Initialize the chat deployment pool used for recipe generation
+        llm_pool.init_llm_pool()
             
     except Exception as e:
         logger.error(f"Failed to initialize AI clients: {e}")
 
+async def _language_call(operation: str, method, documents: List[str]):
+    """Run one Language API call and record it; each document is one billed text record"""
+    start_time = time.perf_counter()
+    try:
+        result = method(documents)
+    except Exception:
+        await record_ai_call('language', 'language', time.perf_counter() - start_time, operation=operation, outcome='error')
+        raise
+    await record_ai_call('language', 'language', time.perf_counter() - start_time, operation=operation, documents=len(documents))
+    return result
+
 async def call_azure_ai_language(text_input: str) -> Dict[str, Any]:
     """Call Azure AI Language for NLP processing"""
     try:
@@ -59,7 +109,7 @@ async def call_azure_ai_language(text_input: str) -> Dict[str, Any]:
             documents = [text_input]
             
             # Named Entity Recognition
-            entity_result = text_analytics_client.recognize_entities(documents)
+            entity_result = await _language_call('entities', text_analytics_client.recognize_entities, documents)
             entities = []
             for doc in entity_result:
                 for entity in doc.entities:
@@ -70,16 +120,16 @@ async def call_azure_ai_language(text_input: str) -> Dict[str, Any]:
                     })
             
             # Key Phrase Extraction
-            key_phrase_result = text_analytics_client.extract_key_phrases(documents)
+            key_phrase_result = await _language_call('key_phrases', text_analytics_client.extract_key_phrases, documents)
             key_phrases = []
             for doc in key_phrase_result:
                 key_phrases.extend(doc.key_phrases)
             
             # Sentiment Analysis
-            sentiment_result = text_analytics_client.analyze_sentiment(documents)
+            sentiment_result = await _language_call('sentiment', text_analytics_client.analyze_sentiment, documents)
             sentiment = "neutral"
             for doc in sentiment_result:
-                sentiment = doc.document_sentiment
+                sentiment = doc.sentiment
                 break
             
             result = {
@@ -119,13 +169,14 @@ async def call_azure_ai_language(text_input: str) -> Dict[str, Any]:
             'sentiment': 'neutral'
         }
 
-async def call_azure_openai_generative_ai(prompt: str) -> str:
-    """Call Azure OpenAI Service for recipe generation"""
+async def call_azure_openai_generative_ai(prompt: str, routing=None) -> str:
+    """
+    Call Azure OpenAI Service for recipe generation. routing, a
+    model_routing.RoutingDecision, picks the deployment tier and completion
+    parameters; without it any deployment is used with max_tokens=1000.
+    """
     try:
-        if openai_client:
-            # Get deployment name from environment
-            deployment_name = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-35-turbo')
-            
+        if llm_pool.has_endpoints():
             # Create messages for chat completion
             messages = [
                 {
@@ -138,14 +189,15 @@ async def call_azure_openai_generative_ai(prompt: str) -> str:
                 }
             ]
             
-            # Call Azure OpenAI
-            response = openai_client.chat.completions.create(
-                model=deployment_name,
-                messages=messages,
-                max_tokens=1000,
-                temperature=0.7,
-                top_p=0.9
-            )
+            # Call Azure OpenAI through the deployment pool
+            with stage_timer('llm'):
+                response = await llm_pool.create_chat_completion(
+                    messages,
+                    tier=routing.tier if routing else None,
+                    max_tokens=routing.max_tokens if routing else 1000,
+                    temperature=routing.temperature if routing else 0.7,
+                    top_p=0.9
+                )
             
             generated_text = response.choices[0].message.content
             logger.info("Recipe generated successfully with Azure OpenAI")
@@ -189,27 +241,7 @@ Instructions:
     except Exception as e:
         logger.error(f"Error in Azure OpenAI recipe generation: {e}")
         # Return safe fallback
-        return """
-Title: Yippee! Classic Masala
-Description: A simple and delicious Yippee noodles recipe
-Cooking Time: 15 minutes
-Difficulty: Easy
-Tags: classic, vegetarian, quick
-
-Ingredients:
-- Yippee noodles: 1 packet
-- Onions: 1, chopped
-- Tomatoes: 1, chopped
-- Oil: 1 tbsp
-- Salt: to taste
-
-Instructions:
-1. Boil noodles according to package instructions (Time: 5 minutes)
-2. Heat oil and sauté onions (Time: 3 minutes)
-3. Add tomatoes and cook (Time: 3 minutes)
-4. Add noodles and mix well (Time: 2 minutes)
-5. Serve hot (Time: 2 minutes)
-"""
+        return FALLBACK_RECIPE_TEXT
 
 async def call_azure_openai_dalle(image_prompt: str) -> str:
     """Call Azure OpenAI Service (DALL-E 3) for image generation"""
@@ -219,13 +251,20 @@ async def call_azure_openai_dalle(image_prompt: str) -> str:
             dalle_deployment_name = os.getenv('AZURE_OPENAI_DALLE_DEPLOYMENT_NAME', 'dall-e-3')
             
             # Call DALL-E 3
-            response = openai_client.images.generate(
-                model=dalle_deployment_name,
-                prompt=image_prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1
-            )
+            start_time = time.perf_counter()
+            try:
+                with stage_timer('dalle'):
+                    response = openai_client.images.generate(
+                        model=dalle_deployment_name,
+                        prompt=image_prompt,
+                        size="1024x1024",
+                        quality="standard",
+                        n=1
+                    )
+            except Exception:
+                await record_ai_call('image', dalle_deployment_name, time.perf_counter() - start_time, operation='generate', outcome='error')
+                raise
+            await record_ai_call('image', dalle_deployment_name, time.perf_counter() - start_time, operation='generate', images=len(response.data))
             
             image_url = response.data[0].url
             logger.info("Image generated successfully with DALL-E 3")
@@ -240,7 +279,7 @@ async def call_azure_openai_dalle(image_prompt: str) -> str:
     except Exception as e:
         logger.error(f"Error in DALL-E image generation: {e}")
         # Return safe fallback
-        return "https://via.placeholder.com/1024x1024/FF6B35/FFFFFF?text=Recipe+Image"
+        return FALLBACK_IMAGE_URL
 
 async def call_azure_openai_with_retry(func, *args, max_retries=3, **kwargs):
     """Retry wrapper for Azure OpenAI calls"""
@@ -253,7 +292,4 @@ async def call_azure_openai_with_retry(func, *args, max_retries=3, **kwargs):
                 raise
             else:
                 logger.warning(f"Attempt {attempt + 1} failed for {func.__name__}: {e}")
-                await asyncio.sleep(2 ** attempt)  # Exponential backoff
-
-# Initialize clients on module import
-init_ai_clients() 
\ No newline at end of file
+                await asyncio.sleep(2 ** attempt)  # Exponential backoff 
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Token, unit and cost accounting for Azure AI calls, with optional budgets.
+
+Every chat completion, image generation and Language call is recorded with
+its service, deployment, outcome, latency and usage: prompt and completion
+tokens from the response, images, or documents. Metrics are labelled by the
+HTTP route being served (the same context variable Cosmos accounting uses),
+never by user. Per-user and global totals are kept per UTC day in Redis
+hashes, or in process when Redis is not configured.
+
+AI_USER_DAILY_TOKEN_BUDGET and AI_GLOBAL_DAILY_TOKEN_BUDGET cap chat tokens
+per day (0 disables). When either is spent, generation either downgrades to
+a catalog recipe without calling the LLM or DALL-E, or is rejected with 429,
+depending on AI_BUDGET_ACTION.
+
+AI_PRICES optionally maps deployments to prices so cost is tracked too:
+    {"gpt-35-turbo": {"prompt_per_1k": 0.0015, "completion_per_1k": 0.002},
+     "dall-e-3": {"per_image": 0.04}, "language": {"per_document": 0.001}}
+"""
+import os
+import json
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from fastapi import HTTPException
+
+from services import user_profile
+from services.metrics import counter, histogram
+from services.cosmos_metrics import current_route
+
+logger = logging.getLogger(__name__)
+
+# Daily chat token budgets; 0 disables
+AI_USER_DAILY_TOKEN_BUDGET = int(os.getenv('AI_USER_DAILY_TOKEN_BUDGET', '0'))
+AI_GLOBAL_DAILY_TOKEN_BUDGET = int(os.getenv('AI_GLOBAL_DAILY_TOKEN_BUDGET', '0'))
+
+# What happens once a budget is spent: downgrade or reject
+AI_BUDGET_ACTION = os.getenv('AI_BUDGET_ACTION', 'downgrade').lower()
+
+# Optional per-deployment prices, see the module docstring
+AI_PRICES = json.loads(os.getenv('AI_PRICES', '{}'))
+
+USAGE_FIELDS = ('calls', 'prompt_tokens', 'completion_tokens', 'images', 'documents', 'cost')
+GLOBAL_SCOPE = 'global'
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+calls_total = counter('ai_calls_total', 'Azure AI calls by service, deployment, operation, endpoint, HTTP route and outcome')
+tokens_total = counter('ai_tokens_total', 'Chat tokens by deployment, HTTP route and kind')
+units_total = counter('ai_units_total', 'Images and Language documents by service, deployment and HTTP route')
+cost_total = counter('ai_cost_total', 'Priced cost of Azure AI calls by service, deployment and HTTP route')
+call_duration = histogram('ai_call_duration_seconds', 'Azure AI call latency by service, deployment and operation', LATENCY_BUCKETS)
+budget_exceeded_total = counter('ai_budget_exceeded_total', 'Generations over an AI token budget by scope and action')
+
+# Who AI calls are charged to; generation sets it from the request
+current_user: ContextVar[Optional[str]] = ContextVar('ai_usage_user', default=None)
+
+# day -> scope -> field -> total, when Redis is not configured
+local_usage = {}
+
+def _today() -> str:
+    return datetime.utcnow().strftime('%Y%m%d')
+
+def _usage_key(day: str, scope: str) -> str:
+    return f"ai_usage:{day}:{scope}"
+
+def user_scope(user_id: str) -> str:
+    return f"user:{user_id}"
+
+def _cost(deployment: str, prompt_tokens: int, completion_tokens: int, images: int, documents: int) -> float:
+    prices = AI_PRICES.get(deployment)
+    if not prices:
+        return 0.0
+    return (
+        prompt_tokens / 1000 * prices.get('prompt_per_1k', 0)
+        + completion_tokens / 1000 * prices.get('completion_per_1k', 0)
+        + images * prices.get('per_image', 0)
+        + documents * prices.get('per_document', 0)
+    )
+
+def count_ai_call(service: str, deployment: str, operation: str, endpoint: str, outcome: str):
+    """Count a call whose usage is unknown, such as the abandoned side of a hedged request"""
+    calls_total.inc(service=service, deployment=deployment, operation=operation, endpoint=endpoint, route=current_route.get(), outcome=outcome)
+
+async def record_ai_call(
+    service: str,
+    deployment: str,
+    latency_seconds: float,
+    operation: str = 'default',
+    endpoint: str = 'default',
+    outcome: str = 'ok',
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    images: int = 0,
+    documents: int = 0
+):
+    """Record one call in the metrics and in today's per-user and global totals"""
+    route = current_route.get()
+    count_ai_call(service, deployment, operation, endpoint, outcome)
+    call_duration.observe(latency_seconds, service=service, deployment=deployment, operation=operation)
+    if prompt_tokens:
+        tokens_total.inc(prompt_tokens, deployment=deployment, route=route, kind='prompt')
+    if completion_tokens:
+        tokens_total.inc(completion_tokens, deployment=deployment, route=route, kind='completion')
+    if images:
+        units_total.inc(images, service=service, deployment=deployment, route=route, unit='image')
+    if documents:
+        units_total.inc(documents, service=service, deployment=deployment, route=route, unit='document')
+    cost = _cost(deployment, prompt_tokens, completion_tokens, images, documents)
+    if cost:
+        cost_total.inc(cost, service=service, deployment=deployment, route=route)
+
+    usage = {
+        'calls': 1, 'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+        'images': images, 'documents': documents
+    }
+    scopes = [GLOBAL_SCOPE] + ([user_scope(current_user.get())] if current_user.get() else [])
+    day = _today()
+
+    if not user_profile.redis_client:
+        totals = local_usage.setdefault(day, {})
+        if len(local_usage) > 1:
+            for old_day in [d for d in local_usage if d != day]:
+                del local_usage[old_day]
+        for scope in scopes:
+            scope_totals = totals.setdefault(scope, dict.fromkeys(USAGE_FIELDS, 0))
+            for field, amount in usage.items():
+                scope_totals[field] += amount
+            scope_totals['cost'] += cost
+        return
+
+    try:
+        pipe = user_profile.redis_client.pipeline(transaction=False)
+        for scope in scopes:
+            key = _usage_key(day, scope)
+            for field, amount in usage.items():
+                if amount:
+                    pipe.hincrby(key, field, amount)
+            if cost:
+                pipe.hincrbyfloat(key, 'cost', cost)
+            pipe.expire(key, 2 * 86400)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record AI usage: {e}")
+
+async def get_usage(scope: str, day: Optional[str] = None) -> Dict[str, float]:
+    """Today's totals for a user_scope(...) or GLOBAL_SCOPE"""
+    day = day or _today()
+    if not user_profile.redis_client:
+        return dict(local_usage.get(day, {}).get(scope) or dict.fromkeys(USAGE_FIELDS, 0))
+    values = await user_profile.redis_client.hmget(_usage_key(day, scope), *USAGE_FIELDS)
+    return {
+        field: (float(value) if field == 'cost' else int(value)) if value is not None else 0
+        for field, value in zip(USAGE_FIELDS, values)
+    }
+
+def _tokens(usage: Dict[str, float]) -> int:
+    return int(usage['prompt_tokens'] + usage['completion_tokens'])
+
+async def exceeded_budget(user_id: Optional[str]) -> Optional[str]:
+    """The budget scope (user or global) that today's chat tokens have used up, or None"""
+    if not AI_USER_DAILY_TOKEN_BUDGET and not AI_GLOBAL_DAILY_TOKEN_BUDGET:
+        return None
+    try:
+        if AI_GLOBAL_DAILY_TOKEN_BUDGET and _tokens(await get_usage(GLOBAL_SCOPE)) >= AI_GLOBAL_DAILY_TOKEN_BUDGET:
+            return 'global'
+        if AI_USER_DAILY_TOKEN_BUDGET and user_id and _tokens(await get_usage(user_scope(user_id))) >= AI_USER_DAILY_TOKEN_BUDGET:
+            return 'user'
+    except Exception as e:
+        # Budgets are advisory; never fail a request because the counters are unreachable
+        logger.warning(f"AI budget check failed: {e}")
+    return None
+
+async def enforce_budget(user_id: Optional[str]) -> bool:
+    """
+    Check the token budgets before calling the LLM. Returns True if the
+    request must be downgraded; raises 429 when AI_BUDGET_ACTION is reject.
+    """
+    scope = await exceeded_budget(user_id)
+    if scope is None:
+        return False
+    budget_exceeded_total.inc(scope=scope, action=AI_BUDGET_ACTION)
+    if AI_BUDGET_ACTION == 'reject':
+        raise HTTPException(
+            status_code=429,
+            detail=f"Daily AI token budget ({scope}) exhausted",
+            headers={"Retry-After": str(seconds_until_reset())}
+        )
+    logger.warning(f"Daily AI token budget ({scope}) exhausted, serving a recipe without generation")
+    return True
+
+def seconds_until_reset() -> int:
+    now = datetime.utcnow()
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((tomorrow - now).total_seconds()) + 1
+
+async def usage_report(user_id: str) -> Dict[str, Any]:
+    """Today's usage for a user with the remaining budget"""
+    usage = await get_usage(user_scope(user_id))
+    return {
+        'user_id': user_id,
+        'day': _today(),
+        'usage': usage,
+        'token_budget': AI_USER_DAILY_TOKEN_BUDGET or None,
+        'tokens_remaining': max(AI_USER_DAILY_TOKEN_BUDGET - _tokens(usage), 0) if AI_USER_DAILY_TOKEN_BUDGET else None
+    }
@@ -0,0 +1,355 @@
+"""
+Base recipe catalog shared by every worker process.
+
+One worker per host wins a file lock and becomes the loader. It reads the
+catalog from Cosmos DB every CATALOG_REFRESH_SECONDS and, when the version
+changes, writes a columnar snapshot into CATALOG_SHARED_DIR (tmpfs by
+default) and atomically repoints `current` at it. Every worker, the loader
+included, memory-maps the file that `current` names, so the catalog is held
+once per host however many workers there are. Old files are unlinked once
+replaced; workers still mapping them keep their pages until they swap.
+
+When CATALOG_SNAPSHOT_PATH names a snapshot written by the export command,
+the first load maps that file instead of querying Cosmos DB, and the usual
+refresh picks up anything newer. A missing file, or one that fails its
+format or checksum check, falls back to Cosmos DB.
+
+    python -m services.catalog export --output /var/lib/yippee/catalog.bin
+    python -m services.catalog verify /var/lib/yippee/catalog.bin
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+from typing import Dict, Any, List, Optional
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from services.database import get_base_recipes
+from services.metrics import counter, gauge, stage_timer
+from services.recommendation import convert_to_generated_recipe, select_from_catalog
+from services.catalog_store import build_snapshot, write_snapshot, load_snapshot, CatalogColumns, SnapshotError
+
+logger = logging.getLogger(__name__)
+
+# How long a loaded catalog is served before checking Cosmos DB for changes
+CATALOG_REFRESH_SECONDS = int(os.getenv('CATALOG_REFRESH_SECONDS', '300'))
+
+# Exported snapshot to start from instead of Cosmos DB; empty disables
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', '')
+
+# Where snapshots are published for the other workers; empty keeps the catalog private to each process
+CATALOG_SHARED_DIR = os.getenv('CATALOG_SHARED_DIR', '/dev/shm/yippee-catalog')
+
+# How often workers check whether the loader has published a new version
+CATALOG_SWAP_CHECK_SECONDS = float(os.getenv('CATALOG_SWAP_CHECK_SECONDS', '5'))
+
+# How long a worker waits for the loader's first snapshot before loading its own
+CATALOG_ATTACH_TIMEOUT_SECONDS = float(os.getenv('CATALOG_ATTACH_TIMEOUT_SECONDS', '30'))
+
+POINTER_FILE = 'current'
+LOCK_FILE = 'loader.lock'
+
+catalog_fragment_lookups = counter('catalog_fragment_lookups_total', 'Pre-encoded recommendation lookups by result')
+catalog_swaps = counter('catalog_swaps_total', 'Catalog versions attached by this process, by source')
+snapshot_file_loads = counter('catalog_snapshot_file_loads_total', 'Attempts to start from CATALOG_SNAPSHOT_PATH by result')
+catalog_bytes = gauge('catalog_snapshot_bytes', 'Size of the attached catalog snapshot')
+
+class CatalogSnapshot:
+    """An immutable columnar view of the base recipes, with recommendations encoded once per version"""
+
+    def __init__(self, columns: CatalogColumns, path: Optional[str] = None):
+        self.columns = columns
+        self.version = columns.version
+        self.path = path
+        self.loaded_at = time.monotonic()
+        # recipe index -> JSON of the recipe as a GeneratedRecipe recommendation
+        self.fragments = {}
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def recipe(self, index: int) -> Dict[str, Any]:
+        return self.columns.recipe(index)
+
+    def select(self, **kwargs) -> List[int]:
+        """Indexes of the best recommendations; see select_from_catalog"""
+        return select_from_catalog(self.columns, **kwargs)
+
+    def recommendation_fragment(self, index: int) -> bytes:
+        fragment = self.fragments.get(index)
+        if fragment is None:
+            catalog_fragment_lookups.inc(result='miss')
+            fragment = orjson.dumps(convert_to_generated_recipe(self.recipe(index)).dict())
+            self.fragments[index] = fragment
+        else:
+            catalog_fragment_lookups.inc(result='hit')
+        return fragment
+
+    def recommendation_fragments(self, indexes: List[int]) -> List[bytes]:
+        fragments = []
+        for index in indexes:
+            try:
+                fragments.append(self.recommendation_fragment(index))
+            except Exception as e:
+                logger.warning(f"Failed to convert recipe at catalog index {index}: {e}")
+        return fragments
+
+def catalog_version(recipes: List[Dict[str, Any]]) -> str:
+    """Derive a version from each recipe's id and Cosmos _etag, falling back to its content"""
+    digest = hashlib.sha256()
+    for recipe in sorted(recipes, key=lambda r: r.get('id', '')):
+        digest.update(recipe.get('id', '').encode('utf-8'))
+        digest.update(recipe.get('_etag', '').encode('utf-8') or orjson.dumps(recipe, option=orjson.OPT_SORT_KEYS))
+    return digest.hexdigest()[:16]
+
+current_catalog = None
+refresh_lock = None
+last_swap_check = 0.0
+last_load = None
+loader_lock_file = None
+
+def _shared_dir_usable() -> bool:
+    if not CATALOG_SHARED_DIR or fcntl is None:
+        return False
+    try:
+        os.makedirs(CATALOG_SHARED_DIR, exist_ok=True)
+        return os.access(CATALOG_SHARED_DIR, os.W_OK)
+    except OSError as e:
+        logger.warning(f"Catalog shared directory {CATALOG_SHARED_DIR} unavailable, keeping catalog private: {e}")
+        return False
+
+def _become_loader() -> bool:
+    """Hold the loader lock for the life of the process once acquired"""
+    global loader_lock_file
+    if loader_lock_file is not None:
+        return True
+    lock_file = open(os.path.join(CATALOG_SHARED_DIR, LOCK_FILE), 'a+')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    loader_lock_file = lock_file
+    logger.info(f"This process (pid {os.getpid()}) is the catalog loader")
+    return True
+
+def _published_name() -> Optional[str]:
+    try:
+        with open(os.path.join(CATALOG_SHARED_DIR, POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _attach(name: str) -> CatalogSnapshot:
+    path = os.path.join(CATALOG_SHARED_DIR, name)
+    snapshot = CatalogSnapshot(load_snapshot(path), path=path)
+    catalog_swaps.inc(source='shared')
+    catalog_bytes.set(len(snapshot.columns.buffer))
+    logger.info(f"Attached catalog version {snapshot.version} with {len(snapshot)} recipes from {path}")
+    return snapshot
+
+def _publish(data: bytes, version: str) -> str:
+    """Write the snapshot, then swap the pointer with a rename so readers never see a partial file"""
+    name = f"catalog-{version}.bin"
+    write_snapshot(os.path.join(CATALOG_SHARED_DIR, name), data)
+
+    previous = _published_name()
+    pointer = os.path.join(CATALOG_SHARED_DIR, POINTER_FILE)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(name)
+    os.replace(pointer + '.tmp', pointer)
+
+    for entry in os.listdir(CATALOG_SHARED_DIR):
+        if entry.startswith('catalog-') and entry not in (name, previous):
+            try:
+                os.unlink(os.path.join(CATALOG_SHARED_DIR, entry))
+            except OSError:
+                pass
+    return name
+
+def _load_snapshot_file() -> Optional[CatalogColumns]:
+    """The exported snapshot at CATALOG_SNAPSHOT_PATH, or None to fall back to Cosmos DB"""
+    global last_load
+
+    if not CATALOG_SNAPSHOT_PATH:
+        return None
+    try:
+        columns = load_snapshot(CATALOG_SNAPSHOT_PATH)
+    except FileNotFoundError:
+        snapshot_file_loads.inc(result='missing')
+        logger.info(f"No catalog snapshot at {CATALOG_SNAPSHOT_PATH}, loading from Cosmos DB")
+        return None
+    except (OSError, SnapshotError) as e:
+        snapshot_file_loads.inc(result='invalid')
+        logger.warning(f"Catalog snapshot {CATALOG_SNAPSHOT_PATH} unusable, loading from Cosmos DB: {e}")
+        return None
+
+    # Counts as a load; the next refresh checks Cosmos DB for anything newer
+    last_load = time.monotonic()
+    snapshot_file_loads.inc(result='loaded')
+    logger.info(f"Loaded catalog version {columns.version} with {len(columns)} recipes from {CATALOG_SNAPSHOT_PATH}")
+    return columns
+
+async def _load_from_cosmos(previous: Optional[CatalogSnapshot]) -> Optional[bytes]:
+    """A new snapshot buffer, or None when the catalog is unchanged or could not be read"""
+    global last_load
+
+    with stage_timer('catalog_refresh'):
+        recipes = await get_base_recipes()
+    last_load = time.monotonic()
+    if not recipes and previous and len(previous):
+        # get_base_recipes returns [] on errors; keep serving what we had
+        logger.warning("Catalog refresh returned no recipes, keeping previous catalog")
+        return None
+
+    version = catalog_version(recipes)
+    if previous and previous.version == version:
+        return None
+    with stage_timer('catalog_build'):
+        data = await asyncio.to_thread(build_snapshot, recipes, version)
+    logger.info(f"Built catalog version {version} with {len(recipes)} recipes ({len(data)} bytes)")
+    return data
+
+async def _refresh_private(snapshot: Optional[CatalogSnapshot]) -> Optional[CatalogSnapshot]:
+    if snapshot is None and last_load is None:
+        columns = _load_snapshot_file()
+        if columns is not None:
+            catalog_swaps.inc(source='file')
+            catalog_bytes.set(len(columns.buffer))
+            return CatalogSnapshot(columns, path=CATALOG_SNAPSHOT_PATH)
+
+    data = await _load_from_cosmos(snapshot)
+    if data is None:
+        return snapshot
+    catalog_swaps.inc(source='private')
+    catalog_bytes.set(len(data))
+    # Built just now, so there is nothing to verify
+    return CatalogSnapshot(CatalogColumns(data, verify=False))
+
+async def _refresh_shared(snapshot: Optional[CatalogSnapshot]) -> Optional[CatalogSnapshot]:
+    if _become_loader():
+        due = last_load is None or time.monotonic() - last_load >= CATALOG_REFRESH_SECONDS
+        published = _published_name()
+        if due or published is None:
+            columns = _load_snapshot_file() if last_load is None else None
+            if columns is not None:
+                _publish(bytes(columns.buffer), columns.version)
+            else:
+                data = await _load_from_cosmos(snapshot)
+                if data is not None:
+                    _publish(data, CatalogColumns(data, verify=False).version)
+
+    published = _published_name()
+    if published is None and snapshot is None:
+        # The loader is still building its first snapshot
+        deadline = time.monotonic() + CATALOG_ATTACH_TIMEOUT_SECONDS
+        while published is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+            published = _published_name()
+        if published is None:
+            logger.warning("No shared catalog published in time, loading a private copy")
+            return await _refresh_private(None)
+
+    if published and (snapshot is None or snapshot.path is None or os.path.basename(snapshot.path) != published):
+        try:
+            return _attach(published)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not attach catalog {published}: {e}")
+    return snapshot
+
+async def get_catalog() -> CatalogSnapshot:
+    """Return the current catalog, attaching a newer published version when there is one"""
+    global current_catalog, refresh_lock, last_swap_check
+
+    snapshot = current_catalog
+    if snapshot and time.monotonic() - last_swap_check < CATALOG_SWAP_CHECK_SECONDS:
+        return snapshot
+
+    if refresh_lock is None:
+        refresh_lock = asyncio.Lock()
+    async with refresh_lock:
+        # Another request may have refreshed while we waited
+        snapshot = current_catalog
+        if snapshot and time.monotonic() - last_swap_check < CATALOG_SWAP_CHECK_SECONDS:
+            return snapshot
+
+        if _shared_dir_usable():
+            snapshot = await _refresh_shared(snapshot)
+        elif snapshot is None or time.monotonic() - last_load >= CATALOG_REFRESH_SECONDS:
+            snapshot = await _refresh_private(snapshot)
+        if snapshot is None:
+            snapshot = await _refresh_private(None)
+        last_swap_check = time.monotonic()
+
+        current_catalog = snapshot
+        return current_catalog
+
+async def export_snapshot(path: str) -> Dict[str, Any]:
+    """Read the base recipes from Cosmos DB and write them to a snapshot file"""
+    from services import database
+
+    await database.init_cosmos_db()
+    if not database.recipes_container:
+        raise SystemExit("Cosmos DB is not configured; refusing to export the mock catalog")
+    recipes = await get_base_recipes()
+    if not recipes:
+        raise SystemExit("No base recipes returned; not writing an empty snapshot")
+
+    started = time.perf_counter()
+    version = catalog_version(recipes)
+    data = build_snapshot(recipes, version)
+    write_snapshot(path, data)
+    return {
+        'path': path,
+        'version': version,
+        'recipes': len(recipes),
+        'bytes': len(data),
+        'build_seconds': round(time.perf_counter() - started, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and verify base recipe catalog snapshots")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="Write the Cosmos DB catalog to a snapshot file")
+    export.add_argument('--output', default=CATALOG_SNAPSHOT_PATH or None, required=not CATALOG_SNAPSHOT_PATH,
+                        help="Snapshot file to write (defaults to CATALOG_SNAPSHOT_PATH)")
+
+    verify = commands.add_parser('verify', help="Check a snapshot's format version and checksum")
+    verify.add_argument('path')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('azure').setLevel(logging.WARNING)
+
+    if args.command == 'export':
+        print(json.dumps(asyncio.run(export_snapshot(args.output)), indent=2))
+        return
+
+    started = time.perf_counter()
+    try:
+        columns = load_snapshot(args.path)
+    except (OSError, SnapshotError) as e:
+        print(f"{args.path}: {e}")
+        sys.exit(1)
+    print(json.dumps({
+        'path': args.path,
+        'format': columns.format,
+        'version': columns.version,
+        'recipes': len(columns),
+        'bytes': len(columns.buffer),
+        'load_ms': round((time.perf_counter() - started) * 1000, 3)
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
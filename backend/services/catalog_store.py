@@ -0,0 +1,322 @@
+"""
+Columnar, memory-mappable layout for the base recipe catalog.
+
+A snapshot is a single buffer: a magic number, a JSON header describing
+each array, then the arrays themselves at aligned offsets. Strings are
+interned into tables of utf-8 bytes plus offsets. Tags and ingredients are
+stored CSR-style, as per-recipe offsets into an array of vocabulary codes.
+Everything the scorer needs per recipe is precomputed into a column when
+the snapshot is built, so readers never materialize recipe dicts.
+
+Readers wrap the buffer (an mmap of a shared file, or bytes) in numpy views,
+so any number of processes can attach to one copy. The header records a
+FORMAT_VERSION and a CRC-32 of the array region; a snapshot from another
+format version, or one that was truncated or corrupted, is rejected.
+"""
+import os
+import json
+import mmap
+import zlib
+import struct
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from models.recipe import DietaryRestriction
+from services.recommendation import extract_spice_level, violates_dietary_restrictions, stored_derivation
+
+MAGIC = b'YPCATLG\x00'
+ALIGNMENT = 64
+
+# Bump whenever the columns or their meaning change
+FORMAT_VERSION = 1
+
+# Bits in the `present` column for fields a recipe document may omit
+HAS_ID = 1
+HAS_TITLE = 2
+HAS_CUISINE = 4
+HAS_DIFFICULTY = 8
+HAS_COOKING_TIME = 16
+HAS_TAGS = 32
+HAS_INGREDIENTS = 64
+
+SPICE_LEVELS = ('mild', 'medium', 'spicy')
+
+# One bit per restriction in the `violates` column
+RESTRICTION_BITS = {restriction.value.lower(): 1 << index for index, restriction in enumerate(DietaryRestriction)}
+
+class SnapshotError(ValueError):
+    """A buffer that is not a usable snapshot for this FORMAT_VERSION"""
+
+class StringTable:
+    """Interns strings in first-seen order"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+def _encode_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+def _derive(recipe: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The per-recipe inputs to calculate_recipe_score, or None when the document
+    is malformed in a way that makes calculate_recipe_score give up and return 0.
+    """
+    try:
+        cuisine = recipe.get('cuisine', '')
+        difficulty = recipe.get('difficulty', 'Medium')
+        title = recipe.get('title', '')
+        cooking_time = recipe.get('cooking_time', 30)
+        tags = list(recipe.get('tags', []))
+        ingredients = list(recipe.get('ingredients', []))
+        for value in [cuisine, difficulty, title] + tags + ingredients:
+            if not isinstance(value, str):
+                return None
+        if not isinstance(cooking_time, (int, float)):
+            return None
+        violates = 0
+        stored = stored_derivation(recipe)
+        if stored:
+            # Computed once at ingest
+            spice = stored['spice']
+            for name in stored['violates']:
+                violates |= RESTRICTION_BITS.get(name, 0)
+        else:
+            spice = extract_spice_level(recipe)
+            for name, bit in RESTRICTION_BITS.items():
+                if violates_dietary_restrictions(recipe, [name]):
+                    violates |= bit
+        return {
+            'cuisine': cuisine,
+            'difficulty': difficulty,
+            'title': title,
+            'cooking_time': cooking_time,
+            'tags': tags,
+            'ingredients': ingredients,
+            'spice': SPICE_LEVELS.index(spice),
+            'violates': violates
+        }
+    except Exception:
+        return None
+
+def build_snapshot(recipes: List[Dict[str, Any]], version: str) -> bytes:
+    """Encode base recipes into a snapshot buffer"""
+    count = len(recipes)
+    cuisines, difficulties, tag_vocab, ingredient_vocab = StringTable(), StringTable(), StringTable(), StringTable()
+    ids, titles = [], []
+    columns = {
+        'present': np.zeros(count, dtype=np.uint8),
+        'valid': np.zeros(count, dtype=np.uint8),
+        'cuisine': np.zeros(count, dtype=np.int32),
+        'difficulty': np.zeros(count, dtype=np.int32),
+        'cooking_time': np.zeros(count, dtype=np.float64),
+        'cooking_time_is_int': np.zeros(count, dtype=np.uint8),
+        'spice': np.zeros(count, dtype=np.int8),
+        'violates': np.zeros(count, dtype=np.uint8),
+        'tag_offsets': np.zeros(count + 1, dtype=np.int64),
+        'ingredient_offsets': np.zeros(count + 1, dtype=np.int64)
+    }
+    tag_codes, ingredient_codes = [], []
+
+    for index, recipe in enumerate(recipes):
+        present = 0
+        for bit, field in ((HAS_ID, 'id'), (HAS_TITLE, 'title'), (HAS_CUISINE, 'cuisine'), (HAS_DIFFICULTY, 'difficulty'),
+                           (HAS_COOKING_TIME, 'cooking_time'), (HAS_TAGS, 'tags'), (HAS_INGREDIENTS, 'ingredients')):
+            if field in recipe:
+                present |= bit
+        ids.append(str(recipe.get('id', '')))
+
+        derived = _derive(recipe)
+        if derived is None:
+            # Scored as 0 and never recommended; keep only the id
+            titles.append('')
+            columns['present'][index] = present & HAS_ID
+            columns['cooking_time'][index] = 30
+            columns['tag_offsets'][index + 1] = len(tag_codes)
+            columns['ingredient_offsets'][index + 1] = len(ingredient_codes)
+            continue
+
+        titles.append(derived['title'])
+        columns['present'][index] = present
+        columns['valid'][index] = 1
+        columns['cuisine'][index] = cuisines.code(derived['cuisine'])
+        columns['difficulty'][index] = difficulties.code(derived['difficulty'])
+        columns['cooking_time'][index] = derived['cooking_time']
+        columns['cooking_time_is_int'][index] = isinstance(derived['cooking_time'], int)
+        columns['spice'][index] = derived['spice']
+        columns['violates'][index] = derived['violates']
+        tag_codes.extend(tag_vocab.code(tag) for tag in derived['tags'])
+        ingredient_codes.extend(ingredient_vocab.code(ingredient) for ingredient in derived['ingredients'])
+        columns['tag_offsets'][index + 1] = len(tag_codes)
+        columns['ingredient_offsets'][index + 1] = len(ingredient_codes)
+
+    columns['tag_codes'] = np.array(tag_codes, dtype=np.int32)
+    columns['ingredient_codes'] = np.array(ingredient_codes, dtype=np.int32)
+    # Recipe indexes ordered by id bytes, for binary search without a per-process dict
+    columns['id_order'] = np.array(sorted(range(count), key=lambda i: ids[i].encode('utf-8')), dtype=np.int64)
+    for name, values in (('id', ids), ('title', titles), ('cuisine_vocab', cuisines.values),
+                         ('difficulty_vocab', difficulties.values), ('tag_vocab', tag_vocab.values),
+                         ('ingredient_vocab', ingredient_vocab.values)):
+        columns[f"{name}_offsets"], columns[f"{name}_data"] = _encode_strings(values)
+
+    return _pack({'version': version, 'count': count}, columns)
+
+def _pack(meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> bytes:
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[name] = {'dtype': array.dtype.str, 'offset': offset, 'length': int(array.size)}
+        offset += array.nbytes
+    data = bytearray(offset)
+    for name, array in arrays.items():
+        start = layout[name]['offset']
+        data[start:start + array.nbytes] = array.tobytes()
+
+    header = json.dumps({
+        **meta,
+        'format': FORMAT_VERSION,
+        'checksum': zlib.crc32(data),
+        'data_length': len(data),
+        'arrays': layout
+    }, separators=(',', ':')).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 4 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    buffer = bytearray(data_start)
+    buffer[:len(MAGIC)] = MAGIC
+    struct.pack_into('<I', buffer, len(MAGIC), len(header))
+    buffer[len(MAGIC) + 4:len(MAGIC) + 4 + len(header)] = header
+    buffer += data
+    return bytes(buffer)
+
+def write_snapshot(path: str, data: bytes):
+    """Write a snapshot so that readers of `path` see either the old file or the complete new one"""
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+def load_snapshot(path: str) -> 'CatalogColumns':
+    """Memory-map and verify a snapshot file; raises SnapshotError if it is unusable"""
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SnapshotError(f"{path} is empty")
+    return CatalogColumns(mapped)
+
+class CatalogColumns:
+    """Read-only numpy views over a snapshot buffer"""
+
+    def __init__(self, buffer, verify: bool = True):
+        view = memoryview(buffer)
+        if len(view) < len(MAGIC) + 4 or bytes(view[:len(MAGIC)]) != MAGIC:
+            raise SnapshotError("Not a catalog snapshot")
+        header_length = struct.unpack_from('<I', view, len(MAGIC))[0]
+        header_end = len(MAGIC) + 4 + header_length
+        try:
+            header = json.loads(bytes(view[len(MAGIC) + 4:header_end]))
+        except ValueError:
+            raise SnapshotError("Unreadable snapshot header")
+        if header.get('format') != FORMAT_VERSION:
+            raise SnapshotError(f"Snapshot format {header.get('format')} does not match {FORMAT_VERSION}")
+        data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+        data = view[data_start:]
+        if len(data) != header['data_length']:
+            raise SnapshotError(f"Snapshot is {len(data)} bytes past the header, expected {header['data_length']}")
+        if verify and zlib.crc32(data) != header['checksum']:
+            raise SnapshotError("Snapshot checksum mismatch")
+
+        self.buffer = buffer
+        self.format = header['format']
+        self.checksum = header['checksum']
+        self.version = header['version']
+        self.count = header['count']
+        self.arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            self.arrays[name] = np.frombuffer(view, dtype=dtype, count=spec['length'], offset=data_start + spec['offset'])
+        self._vocab_cache = {}
+        self._lowered_vocab_cache = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        arrays = self.__dict__.get('arrays')
+        if arrays is not None and name in arrays:
+            return arrays[name]
+        raise AttributeError(name)
+
+    def string(self, table: str, index: int) -> str:
+        offsets = self.arrays[f"{table}_offsets"]
+        return self.arrays[f"{table}_data"][offsets[index]:offsets[index + 1]].tobytes().decode('utf-8')
+
+    def vocabulary(self, table: str) -> List[str]:
+        """Decoded vocabulary table, cached per process since vocabularies are small"""
+        values = self._vocab_cache.get(table)
+        if values is None:
+            values = [self.string(table, index) for index in range(len(self.arrays[f"{table}_offsets"]) - 1)]
+            self._vocab_cache[table] = values
+        return values
+
+    def lowered_vocabulary(self, table: str) -> List[str]:
+        """Lowercased vocabulary table, which is what scoring compares against, cached like vocabulary"""
+        values = self._lowered_vocab_cache.get(table)
+        if values is None:
+            values = [value.lower() for value in self.vocabulary(table)]
+            self._lowered_vocab_cache[table] = values
+        return values
+
+    def index_of(self, recipe_id: str) -> Optional[int]:
+        target = recipe_id.encode('utf-8')
+        order = self.arrays['id_order']
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.string('id', order[middle]).encode('utf-8') < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(order) and self.string('id', order[low]) == recipe_id:
+            return int(order[low])
+        return None
+
+    def recipe(self, index: int) -> Dict[str, Any]:
+        """Rebuild the fields of a base recipe document that the API uses"""
+        present = int(self.arrays['present'][index])
+        recipe = {'type': 'base_recipe'}
+        if present & HAS_ID:
+            recipe['id'] = self.string('id', index)
+        if present & HAS_TITLE:
+            recipe['title'] = self.string('title', index)
+        if present & HAS_CUISINE:
+            recipe['cuisine'] = self.vocabulary('cuisine_vocab')[self.arrays['cuisine'][index]]
+        if present & HAS_DIFFICULTY:
+            recipe['difficulty'] = self.vocabulary('difficulty_vocab')[self.arrays['difficulty'][index]]
+        if present & HAS_COOKING_TIME:
+            cooking_time = float(self.arrays['cooking_time'][index])
+            recipe['cooking_time'] = int(cooking_time) if self.arrays['cooking_time_is_int'][index] else cooking_time
+        if present & HAS_TAGS:
+            tag_vocab = self.vocabulary('tag_vocab')
+            start, end = self.arrays['tag_offsets'][index], self.arrays['tag_offsets'][index + 1]
+            recipe['tags'] = [tag_vocab[code] for code in self.arrays['tag_codes'][start:end]]
+        if present & HAS_INGREDIENTS:
+            ingredient_vocab = self.vocabulary('ingredient_vocab')
+            start, end = self.arrays['ingredient_offsets'][index], self.arrays['ingredient_offsets'][index + 1]
+            recipe['ingredients'] = [ingredient_vocab[code] for code in self.arrays['ingredient_codes'][start:end]]
+        return recipe
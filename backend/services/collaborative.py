@@ -0,0 +1,279 @@
+"""
+Item-item collaborative filtering over users' saved and cooked recipes.
+
+An offline job reads users' saved and cooked recipes from the history
+store, counts how often two base recipes appear for the same user (a
+generated recipe counts as the catalog recipe it was based on), and keeps the
+SIMILARITY_NEIGHBORS most similar recipes for each one (cosine over those
+co-occurrence counts). The table is published to Redis. API workers hold
+it in memory and turn a user's history into per-recipe boosts with one
+lookup per history item, so a request costs O(history x neighbors).
+
+Counts are kept in a state file between runs. With --incremental the job
+only reads history entries written since the last run, and only pairs
+involving recipes new to a user are counted.
+
+    python -m services.collaborative build
+    python -m services.collaborative build --incremental
+"""
+import os
+import json
+import math
+import time
+import heapq
+import asyncio
+import hashlib
+import logging
+import argparse
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+import orjson
+
+from services import user_profile
+from services.database import BASE_RECIPE_ID_PREFIX
+from services.metrics import counter, stage_timer
+from services.cosmos_metrics import cosmos_operation
+
+logger = logging.getLogger(__name__)
+
+# Neighbors kept per recipe
+SIMILARITY_NEIGHBORS = int(os.getenv('SIMILARITY_NEIGHBORS', '20'))
+
+# Pairs seen for fewer users than this are noise and get no similarity
+SIMILARITY_MIN_SUPPORT = int(os.getenv('SIMILARITY_MIN_SUPPORT', '2'))
+
+# Largest score boost a user's history can give one recipe
+SIMILARITY_BOOST_WEIGHT = float(os.getenv('SIMILARITY_BOOST_WEIGHT', '0.15'))
+
+# Most recent history entries, and saved recipes, considered per request
+SIMILARITY_HISTORY_LIMIT = int(os.getenv('SIMILARITY_HISTORY_LIMIT', '50'))
+
+# How often workers check Redis for a newer neighbor table
+SIMILARITY_REFRESH_SECONDS = int(os.getenv('SIMILARITY_REFRESH_SECONDS', '300'))
+
+# Where the job keeps co-occurrence counts between runs
+SIMILARITY_STATE_PATH = os.getenv('SIMILARITY_STATE_PATH', 'similarity-state.json')
+
+NEIGHBORS_KEY = 'item_neighbors'
+NEIGHBORS_VERSION_KEY = 'item_neighbors:version'
+STATE_FORMAT = 1
+
+personalized_boosts_total = counter('personalized_boosts_total', 'Collaborative filtering boost lookups by result')
+
+# recipe id -> [(neighbor id, similarity), ...], best first
+neighbor_table = {}
+neighbor_version = None
+last_neighbor_check = None
+
+class CooccurrenceCounts:
+    """Per-recipe and per-pair user counts, updated one user at a time"""
+
+    def __init__(self, state: Optional[Dict[str, Any]] = None):
+        state = state or {}
+        self.watermark = state.get('watermark', 0)
+        self.items = defaultdict(int, state.get('items', {}))
+        # Pairs are stored once, under the smaller id
+        self.pairs = defaultdict(lambda: defaultdict(int))
+        for first, row in state.get('pairs', {}).items():
+            self.pairs[first].update(row)
+        # Recipes already counted for each user, so re-reading a profile is a no-op
+        self.processed = {user_id: set(items) for user_id, items in state.get('users', {}).items()}
+
+    def add_user(self, user_id: str, items: Set[str]) -> int:
+        """Count the recipes new to this user against everything they have now; returns how many were new"""
+        seen = self.processed.get(user_id, set())
+        new = items - seen
+        for item in new:
+            self.items[item] += 1
+            for other in items:
+                if other == item or (other in new and other < item):
+                    # Pairs of two new recipes are counted from the smaller id only
+                    continue
+                first, second = (item, other) if item < other else (other, item)
+                self.pairs[first][second] += 1
+        if new:
+            self.processed[user_id] = seen | items
+        return len(new)
+
+    def neighbors(self, top_n: int, min_support: int) -> Dict[str, List[Tuple[str, float]]]:
+        candidates = defaultdict(list)
+        for first, row in self.pairs.items():
+            for second, together in row.items():
+                if together < min_support:
+                    continue
+                similarity = together / math.sqrt(self.items[first] * self.items[second])
+                candidates[first].append((second, similarity))
+                candidates[second].append((first, similarity))
+        return {
+            item: [(neighbor, round(similarity, 6)) for neighbor, similarity in
+                   heapq.nsmallest(top_n, scored, key=lambda pair: (-pair[1], pair[0]))]
+            for item, scored in candidates.items()
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            'format': STATE_FORMAT,
+            'watermark': self.watermark,
+            'items': dict(self.items),
+            'pairs': {first: dict(row) for first, row in self.pairs.items()},
+            'users': {user_id: sorted(items) for user_id, items in self.processed.items()}
+        }
+
+def history_items(entries: List[Dict[str, Any]]) -> Dict[str, Set[str]]:
+    """
+    Base recipes each user saved or cooked. Generated recipes are unique to
+    one user, so they count as the catalog recipe they were based on.
+    """
+    items = defaultdict(set)
+    for entry in entries:
+        recipe_id = entry.get('base_recipe_id') or entry.get('recipe_id')
+        if isinstance(recipe_id, str) and recipe_id.startswith(BASE_RECIPE_ID_PREFIX):
+            items[entry['user_id']].add(recipe_id)
+    return items
+
+# ---------------------------------------------------------------------------
+# Request time
+# ---------------------------------------------------------------------------
+
+async def get_neighbor_table() -> Dict[str, List[Tuple[str, float]]]:
+    """The published neighbor table, re-checked against Redis every SIMILARITY_REFRESH_SECONDS"""
+    global neighbor_table, neighbor_version, last_neighbor_check
+
+    now = time.monotonic()
+    if not user_profile.redis_client or (last_neighbor_check is not None and now - last_neighbor_check < SIMILARITY_REFRESH_SECONDS):
+        return neighbor_table
+    last_neighbor_check = now
+
+    try:
+        with stage_timer('redis'):
+            version = await user_profile.redis_client.get(NEIGHBORS_VERSION_KEY)
+        if version is None or version.decode('utf-8') == neighbor_version:
+            return neighbor_table
+        with stage_timer('redis'):
+            blob = await user_profile.redis_client.get(NEIGHBORS_KEY)
+        if blob:
+            published = orjson.loads(blob)
+            neighbor_table = {
+                item: [(neighbor, similarity) for neighbor, similarity in neighbors]
+                for item, neighbors in published['neighbors'].items()
+            }
+            neighbor_version = published['version']
+            logger.info(f"Loaded item neighbors version {neighbor_version} for {len(neighbor_table)} recipes")
+    except Exception as e:
+        logger.warning(f"Failed to refresh item neighbors: {e}")
+    return neighbor_table
+
+async def personalized_boosts(profile: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    """Score boosts for recipes similar to what this user saved or cooked"""
+    if not profile:
+        return {}
+    table = await get_neighbor_table()
+    if not table:
+        personalized_boosts_total.inc(result='no_table')
+        return {}
+
+    history = (profile.get('cooked_base_recipes') or [])[:SIMILARITY_HISTORY_LIMIT]
+    history = history + (profile.get('cooking_history') or [])[:SIMILARITY_HISTORY_LIMIT]
+    history = history + (profile.get('saved_recipes') or [])[-SIMILARITY_HISTORY_LIMIT:]
+    totals = {}
+    for item in dict.fromkeys(recipe_id for recipe_id in history if isinstance(recipe_id, str)):
+        for neighbor, similarity in table.get(item, ()):
+            totals[neighbor] = totals.get(neighbor, 0.0) + similarity
+
+    personalized_boosts_total.inc(result='boosted' if totals else 'no_neighbors')
+    # Capped so a long history cannot outweigh the preference match
+    return {neighbor: SIMILARITY_BOOST_WEIGHT * min(1.0, total) for neighbor, total in totals.items()}
+
+# ---------------------------------------------------------------------------
+# Offline job
+# ---------------------------------------------------------------------------
+
+def _read_history_sync(container, since: int) -> List[Dict[str, Any]]:
+    query = "SELECT c.user_id, c.recipe_id, c.base_recipe_id, c._ts FROM c WHERE c._ts >= @since"
+    with cosmos_operation('read_history_for_similarity'):
+        return list(container.query_items(query, parameters=[{'name': '@since', 'value': since}], enable_cross_partition_query=True))
+
+def load_state(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'rb') as f:
+            state = orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    if state.get('format') != STATE_FORMAT:
+        logger.warning(f"Ignoring similarity state {path} with format {state.get('format')}")
+        return None
+    return state
+
+def save_state(path: str, state: Dict[str, Any]):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(orjson.dumps(state))
+    os.replace(path + '.tmp', path)
+
+async def publish_neighbors(neighbors: Dict[str, List[Tuple[str, float]]]) -> str:
+    """Store the table in Redis; workers pick it up on their next refresh check"""
+    blob = orjson.dumps({'neighbors': neighbors}, option=orjson.OPT_SORT_KEYS)
+    version = hashlib.sha256(blob).hexdigest()[:16]
+    blob = orjson.dumps({'version': version, 'neighbors': neighbors})
+    # Table first: a worker that sees the new version always finds the new table
+    await user_profile.redis_client.set(NEIGHBORS_KEY, blob)
+    await user_profile.redis_client.set(NEIGHBORS_VERSION_KEY, version)
+    return version
+
+async def build_neighbors(state_path: str, incremental: bool, publish: bool = True) -> Dict[str, Any]:
+    """Update co-occurrence counts from the history store, then recompute and publish the neighbor table"""
+    from services import database
+
+    await database.init_cosmos_db()
+    if not database.recipe_history_container:
+        raise SystemExit("Cosmos DB is not configured")
+
+    counts = CooccurrenceCounts(load_state(state_path) if incremental else None)
+    started = time.perf_counter()
+    with stage_timer('cosmos_read'):
+        entries = await asyncio.to_thread(_read_history_sync, database.recipe_history_container, counts.watermark)
+
+    new_items = 0
+    users = history_items(entries)
+    for user_id, items in users.items():
+        # Entries are append-only, so a user's recipes are everything counted before plus what is new
+        new_items += counts.add_user(user_id, counts.processed.get(user_id, set()) | items)
+    # Re-read the boundary second next time; add_user makes that a no-op
+    counts.watermark = max([counts.watermark] + [entry.get('_ts') or 0 for entry in entries])
+    neighbors = counts.neighbors(SIMILARITY_NEIGHBORS, SIMILARITY_MIN_SUPPORT)
+    save_state(state_path, counts.to_state())
+
+    result = {
+        'mode': 'incremental' if incremental else 'full',
+        'entries_read': len(entries),
+        'users': len(users),
+        'new_items': new_items,
+        'recipes_with_neighbors': len(neighbors),
+        'watermark': counts.watermark,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+    if publish:
+        await user_profile.init_redis()
+        if not user_profile.redis_client:
+            raise SystemExit("Redis is not configured; use --no-publish to only update the state file")
+        result['version'] = await publish_neighbors(neighbors)
+        await user_profile.close_redis()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the item-item neighbor table from users' recipe history")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Count co-occurrences and publish the neighbor table")
+    build.add_argument('--incremental', action='store_true', help="Only read history written since the last run")
+    build.add_argument('--state', default=SIMILARITY_STATE_PATH, help="Co-occurrence state file")
+    build.add_argument('--no-publish', action='store_true', help="Update the state file without writing to Redis")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('azure').setLevel(logging.WARNING)
+    result = asyncio.run(build_neighbors(args.state, args.incremental, publish=not args.no_publish))
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Request-unit and latency accounting for Cosmos DB calls.
+
+The Cosmos client is built with record_response as its raw_response_hook,
+so every HTTP response the SDK receives is seen here. That includes each
+query page and each attempt the SDK retries after a 429. Responses are
+charged to the logical operation around them (with cosmos_operation(...))
+and to the HTTP route being served, which the timing middleware sets.
+Both are context variables, so attribution follows asyncio tasks and the
+threads started with asyncio.to_thread.
+
+Operations over COSMOS_SLOW_OPERATION_MS or COSMOS_EXPENSIVE_OPERATION_RU
+are logged with their totals.
+"""
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from services.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+# Log operations slower than this, end to end including SDK retries
+COSMOS_SLOW_OPERATION_MS = float(os.getenv('COSMOS_SLOW_OPERATION_MS', '500'))
+
+# Log operations that cost more request units than this
+COSMOS_EXPENSIVE_OPERATION_RU = float(os.getenv('COSMOS_EXPENSIVE_OPERATION_RU', '50'))
+
+RU_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+SERVER_DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+request_charge_total = counter('cosmos_request_charge_total', 'Cosmos DB request units consumed by operation and HTTP route')
+operations_total = counter('cosmos_operations_total', 'Logical Cosmos DB operations by operation, HTTP route and outcome')
+http_requests_total = counter('cosmos_http_requests_total', 'Cosmos DB HTTP requests, including query pages and retries, by operation')
+throttled_total = counter('cosmos_throttled_total', 'Cosmos DB responses with status 429 by operation')
+items_total = counter('cosmos_items_total', 'Documents returned by Cosmos DB queries by operation')
+operation_charge = histogram('cosmos_operation_request_charge', 'Request units per logical Cosmos DB operation', RU_BUCKETS)
+server_duration = histogram('cosmos_server_duration_seconds', 'Server-side duration per logical Cosmos DB operation', SERVER_DURATION_BUCKETS)
+
+class CosmosCall:
+    """Totals for one logical operation across every HTTP request it made"""
+
+    __slots__ = ('operation', 'request_charge', 'server_ms', 'requests', 'throttled', 'items')
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.request_charge = 0.0
+        self.server_ms = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.items = 0
+
+current_call: ContextVar[Optional[CosmosCall]] = ContextVar('cosmos_call', default=None)
+current_route: ContextVar[str] = ContextVar('cosmos_route', default='background')
+
+def _header_float(headers, name: str) -> float:
+    try:
+        return float(headers.get(name) or 0)
+    except ValueError:
+        return 0.0
+
+def record_response(pipeline_response):
+    """raw_response_hook for the Cosmos client; runs on the thread that made the request"""
+    try:
+        response = pipeline_response.http_response
+        headers = response.headers
+        call = current_call.get()
+        if call is None:
+            # A call site without cosmos_operation still shows up, just unnamed
+            call = CosmosCall('unattributed')
+            _record(call, response.status_code, headers)
+            _finish(call, current_route.get(), 'ok', None)
+            return
+        _record(call, response.status_code, headers)
+    except Exception as e:
+        logger.debug(f"Failed to record Cosmos response: {e}")
+
+def _record(call: CosmosCall, status_code: int, headers):
+    call.requests += 1
+    call.request_charge += _header_float(headers, 'x-ms-request-charge')
+    call.server_ms += _header_float(headers, 'x-ms-request-duration-ms')
+    call.items += int(_header_float(headers, 'x-ms-item-count'))
+    if status_code == 429:
+        call.throttled += 1
+
+def _finish(call: CosmosCall, route: str, outcome: str, elapsed_ms: Optional[float]):
+    request_charge_total.inc(call.request_charge, operation=call.operation, route=route)
+    operations_total.inc(operation=call.operation, route=route, outcome=outcome)
+    http_requests_total.inc(call.requests, operation=call.operation)
+    if call.throttled:
+        throttled_total.inc(call.throttled, operation=call.operation)
+    if call.items:
+        items_total.inc(call.items, operation=call.operation)
+    operation_charge.observe(call.request_charge, operation=call.operation)
+    server_duration.observe(call.server_ms / 1000, operation=call.operation)
+
+    if call.request_charge > COSMOS_EXPENSIVE_OPERATION_RU or (elapsed_ms is not None and elapsed_ms > COSMOS_SLOW_OPERATION_MS):
+        elapsed = f"{elapsed_ms:.1f}ms" if elapsed_ms is not None else "n/a"
+        logger.warning(
+            f"Slow or expensive Cosmos operation {call.operation} on {route}: {call.request_charge:.2f} RU, "
+            f"{elapsed} elapsed, {call.server_ms:.1f}ms server, {call.requests} requests, "
+            f"{call.throttled} throttled, {call.items} items, outcome {outcome}"
+        )
+
+@contextmanager
+def cosmos_operation(operation: str):
+    """Charge the Cosmos requests made inside the block to one named operation"""
+    call = CosmosCall(operation)
+    token = current_call.set(call)
+    start_time = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield call
+    except Exception as e:
+        outcome = 'not_found' if getattr(e, 'status_code', None) == 404 else 'error'
+        raise
+    finally:
+        current_call.reset(token)
+        _finish(call, current_route.get(), outcome, (time.perf_counter() - start_time) * 1000)
@@ -1,10 +1,14 @@
 import os
 import logging
 from typing import List, Dict, Any, Optional
-from azure.cosmos import CosmosClient, PartitionKey
-from azure.cosmos.exceptions import CosmosHttpResponseError
+from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError
 import json
 
+from services.metrics import stage_timer
+from services.cosmos_metrics import cosmos_operation, record_response
+from services.provisioning import ensure_container, ensure_containers
+
 logger = logging.getLogger(__name__)
 
 # Global Cosmos DB client
@@ -13,10 +17,24 @@ database = None
 recipes_container = None
 generated_recipes_container = None
 user_profiles_container = None
+recipe_history_container = None
+
+# Create containers and apply indexing policies when the app starts
+PROVISION_ON_STARTUP = os.getenv('COSMOS_PROVISION_ON_STARTUP', 'false').lower() == 'true'
+
+# Catalog recipe IDs are namespaced so lookups go straight to the right container
+BASE_RECIPE_ID_PREFIX = 'base-'
+
+# User recipe history paging
+USER_RECIPES_PAGE_SIZE = int(os.getenv('USER_RECIPES_PAGE_SIZE', '20'))
+USER_RECIPES_MAX_PAGE_SIZE = int(os.getenv('USER_RECIPES_MAX_PAGE_SIZE', '100'))
+
+# Fields returned for recipe list views; full recipes are fetched by ID
+USER_RECIPE_LIST_FIELDS = ['id', 'title', 'description', 'cuisine', 'difficulty', 'cooking_time', 'spice_level', 'image_url', 'tags', 'created_at']
 
 async def init_cosmos_db():
     """Initialize Cosmos DB connection and containers"""
-    global cosmos_client, database, recipes_container, generated_recipes_container, user_profiles_container
+    global cosmos_client, database, recipes_container, generated_recipes_container, user_profiles_container, recipe_history_container
     
     try:
         # Get connection string from environment
@@ -25,8 +43,8 @@ async def init_cosmos_db():
             logger.warning("COSMOS_DB_CONNECTION_STRING not found, using mock mode")
             return
         
-        # Initialize Cosmos client
-        cosmos_client = CosmosClient.from_connection_string(connection_string)
+        # Initialize Cosmos client; every response's request charge is recorded per operation
+        cosmos_client = CosmosClient.from_connection_string(connection_string, raw_response_hook=record_response)
         
         # Get database
         database_name = os.getenv('COSMOS_DB_NAME', 'yippee-recipes')
@@ -36,6 +54,11 @@ async def init_cosmos_db():
         recipes_container = database.get_container_client('recipes')
         generated_recipes_container = database.get_container_client('generated_recipes')
         user_profiles_container = database.get_container_client('user_profiles')
+        recipe_history_container = database.get_container_client('recipe_history')
+        
+        if PROVISION_ON_STARTUP:
+            for result in ensure_containers(database):
+                logger.info(f"Container {result['container']}: {result['action']}")
         
         logger.info("Cosmos DB initialized successfully")
         
@@ -53,7 +76,8 @@ async def store_generated_recipe(recipe_data: Dict[str, Any]) -> str:
             recipe_data['created_at'] = recipe_data.get('created_at', '')
             
             # Store in Cosmos DB
-            response = generated_recipes_container.create_item(recipe_data)
+            with stage_timer('cosmos_write'), cosmos_operation('store_generated_recipe'):
+                response = generated_recipes_container.create_item(recipe_data)
             logger.info(f"Stored generated recipe: {recipe_data['id']}")
             return recipe_data['id']
         else:
@@ -74,7 +98,8 @@ async def get_base_recipes() -> List[Dict[str, Any]]:
         if recipes_container:
             # Query base recipes
             query = "SELECT * FROM c WHERE c.type = 'base_recipe'"
-            items = list(recipes_container.query_items(query, enable_cross_partition_query=True))
+            with stage_timer('cosmos_read'), cosmos_operation('get_base_recipes'):
+                items = list(recipes_container.query_items(query, enable_cross_partition_query=True))
             logger.info(f"Retrieved {len(items)} base recipes from Cosmos DB")
             return items
         else:
@@ -111,67 +136,86 @@ async def get_base_recipes() -> List[Dict[str, Any]]:
         logger.error(f"Error retrieving base recipes: {e}")
         return []
 
-async def get_recipe_by_id(recipe_id: str) -> Optional[Dict[str, Any]]:
-    """Retrieve a specific recipe by ID"""
+async def get_recipe_by_id(recipe_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Retrieve a specific recipe by ID, or None if it does not exist.
+
+    Catalog IDs carry the base- prefix and live in the recipes container;
+    everything else is a generated recipe partitioned by user. With the owner's
+    user_id that is a point read, otherwise a parameterized query by ID.
+    """
     try:
-        if generated_recipes_container:
-            # Try generated recipes first
-            try:
-                item = generated_recipes_container.read_item(recipe_id, recipe_id)
-                return item
-            except CosmosHttpResponseError:
-                pass
-            
-        if recipes_container:
-            # Try base recipes
-            try:
-                item = recipes_container.read_item(recipe_id, recipe_id)
-                return item
-            except CosmosHttpResponseError:
-                pass
-                
-        return None
-        
-    except Exception as e:
-        logger.error(f"Error retrieving recipe {recipe_id}: {e}")
+        if recipe_id.startswith(BASE_RECIPE_ID_PREFIX):
+            if not recipes_container:
+                return None
+            with stage_timer('cosmos_read'), cosmos_operation('read_base_recipe'):
+                return recipes_container.read_item(recipe_id, partition_key=recipe_id)
+
+        if not generated_recipes_container:
+            return None
+        if user_id:
+            with stage_timer('cosmos_read'), cosmos_operation('read_generated_recipe'):
+                return generated_recipes_container.read_item(recipe_id, partition_key=user_id)
+        with stage_timer('cosmos_read'), cosmos_operation('query_generated_recipe'):
+            items = list(generated_recipes_container.query_items(
+                "SELECT * FROM c WHERE c.id = @id",
+                parameters=[{"name": "@id", "value": recipe_id}],
+                enable_cross_partition_query=True,
+                max_item_count=1
+            ))
+        return items[0] if items else None
+
+    except CosmosResourceNotFoundError:
         return None
+    except CosmosHttpResponseError as e:
+        logger.error(f"Cosmos DB error retrieving recipe {recipe_id}: {e}")
+        raise
+
+async def get_user_recipes(user_id: str, page_size: int = None, continuation_token: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Retrieve one page of recipes generated by a specific user, newest first.
 
-async def get_user_recipes(user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-    """Retrieve recipes generated by a specific user"""
+    The query is scoped to the user's partition and resumes from the Cosmos
+    continuation token, so every page costs about the same regardless of depth.
+    """
+    page_size = min(page_size or USER_RECIPES_PAGE_SIZE, USER_RECIPES_MAX_PAGE_SIZE)
     try:
         if generated_recipes_container:
-            query = f"SELECT * FROM c WHERE c.user_id = '{user_id}' AND c.type = 'generated_recipe' ORDER BY c.created_at DESC OFFSET 0 LIMIT {limit}"
-            items = list(generated_recipes_container.query_items(query, enable_cross_partition_query=True))
+            query = (
+                f"SELECT {', '.join('c.' + field for field in USER_RECIPE_LIST_FIELDS)} FROM c "
+                "WHERE c.user_id = @user_id AND c.type = 'generated_recipe' ORDER BY c.created_at DESC"
+            )
+            with stage_timer('cosmos_read'), cosmos_operation('get_user_recipes'):
+                pages = generated_recipes_container.query_items(
+                    query,
+                    parameters=[{"name": "@user_id", "value": user_id}],
+                    partition_key=user_id,
+                    max_item_count=page_size
+                ).by_page(continuation_token)
+                items = list(next(pages, []))
             logger.info(f"Retrieved {len(items)} recipes for user {user_id}")
-            return items
+            return {"items": items, "continuation_token": pages.continuation_token}
         else:
             # Mock response
-            return []
+            return {"items": [], "continuation_token": None}
             
     except CosmosHttpResponseError as e:
         logger.error(f"Cosmos DB error retrieving user recipes: {e}")
-        return []
+        raise
     except Exception as e:
         logger.error(f"Error retrieving user recipes: {e}")
-        return []
+        raise
 
-async def create_container_if_not_exists(container_name: str, partition_key: str = "/id"):
-    """Create a Cosmos DB container if it doesn't exist"""
+async def create_container_if_not_exists(container_name: str):
+    """Create a Cosmos DB container from its provisioning spec, or update its indexing policy"""
     try:
         if not database:
             logger.warning("Database not initialized, skipping container creation")
             return
-            
-        try:
-            database.get_container_client(container_name)
-            logger.info(f"Container {container_name} already exists")
-        except CosmosHttpResponseError:
-            # Container doesn't exist, create it
-            database.create_container(
-                id=container_name,
-                partition_key=PartitionKey(path=partition_key)
-            )
-            logger.info(f"Created container: {container_name}")
+        
+        result = ensure_container(database, container_name)
+        logger.info(f"Container {container_name}: {result['action']}")
+        return result
             
     except Exception as e:
         logger.error(f"Error creating container {container_name}: {e}")
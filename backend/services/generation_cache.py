@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Awaitable
+
+from services import user_profile
+from services.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# How long a late LLM result stays available for the next matching request
+CACHE_TTL_SECONDS = int(os.getenv('GENERATION_CACHE_TTL_SECONDS', '1800'))
+
+# In-process fallback when Redis is not configured: key -> (expires_at, recipe_text), oldest first
+local_cache = OrderedDict()
+
+# Generations still running after their request was answered, keyed by generation fingerprint
+background_generations = {}
+
+# Strong references to pending cache writes so they are not garbage collected
+pending_cache_writes = set()
+
+def generation_cache_key(preferences, user_id: Optional[str] = None) -> str:
+    """
+    Fingerprint of the preference fields that shape the generated recipe.
+
+    Pass the user_id when the prompt carries that user's profile, so the
+    recipe is only shared with and cached for the same user.
+    """
+    parts = [
+        user_id or '',
+        preferences.cuisine.value,
+        preferences.spice_level.value,
+        ','.join(sorted(mt.value for mt in preferences.meal_type)),
+        preferences.max_cooking_time.value,
+        ','.join(sorted(dr.value for dr in preferences.dietary_restrictions)),
+        ','.join(sorted(ing.strip().lower() for ing in preferences.available_ingredients))
+    ]
+    digest = hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+    return f"generation:{digest}"
+
+async def take_cached_generation(key: str) -> Optional[str]:
+    """Pop a cached recipe text so each late result is served to exactly one request"""
+    try:
+        if user_profile.redis_client:
+            with stage_timer('redis'):
+                cached = await user_profile.redis_client.getdel(key)
+            if cached:
+                logger.info("Serving recipe from generation cache")
+                return cached.decode('utf-8') if isinstance(cached, bytes) else cached
+            return None
+
+        entry = local_cache.pop(key, None)
+        if entry and entry[0] > time.monotonic():
+            logger.info("Serving recipe from generation cache")
+            return entry[1]
+        return None
+
+    except Exception as e:
+        logger.warning(f"Generation cache lookup failed: {e}")
+        return None
+
+def _remember_locally(key: str, recipe_text: str):
+    now = time.monotonic()
+    local_cache[key] = (now + CACHE_TTL_SECONDS, recipe_text)
+    local_cache.move_to_end(key)
+    # Every entry has the same TTL, so expired ones are at the front
+    while local_cache and next(iter(local_cache.values()))[0] <= now:
+        local_cache.popitem(last=False)
+
+async def cache_generation(key: str, recipe_text: str):
+    """Keep a finished generation for the next matching request"""
+    try:
+        if user_profile.redis_client:
+            with stage_timer('redis'):
+                await user_profile.redis_client.setex(key, CACHE_TTL_SECONDS, recipe_text)
+        else:
+            _remember_locally(key, recipe_text)
+        logger.info("Cached late recipe generation")
+    except Exception as e:
+        logger.warning(f"Failed to cache recipe generation: {e}")
+
+def start_generation(key: str, generation: Awaitable[str]) -> asyncio.Task:
+    """
+    Run a generation as an independent task.
+
+    Matching requests that arrive while it is still running share the same
+    task instead of starting another LLM call.
+    """
+    task = background_generations.get(key)
+    if task is not None and not task.done():
+        generation.close()
+        return task
+
+    task = asyncio.ensure_future(generation)
+    background_generations[key] = task
+
+    def _forget(finished):
+        if background_generations.get(key) is finished:
+            del background_generations[key]
+
+    task.add_done_callback(_forget)
+    return task
+
+def cache_when_done(key: str, task: asyncio.Task, skip_text: Optional[str] = None):
+    """Cache the task's result once it finishes, unless it is the generic fallback"""
+    async def _store():
+        try:
+            recipe_text = await task
+        except Exception as e:
+            logger.warning(f"Background recipe generation failed: {e}")
+            return
+        if recipe_text and recipe_text != skip_text:
+            await cache_generation(key, recipe_text)
+
+    store_task = asyncio.ensure_future(_store())
+    pending_cache_writes.add(store_task)
+    store_task.add_done_callback(pending_cache_writes.discard)
@@ -0,0 +1,166 @@
+"""
+Idempotency-Key handling for POST endpoints that are expensive to repeat.
+
+The first request with a key runs as its own task and marks the key
+pending in Redis. A duplicate on the same worker attaches to that task;
+a duplicate on another worker polls Redis until the response is stored.
+Completed responses are kept for IDEMPOTENCY_TTL_SECONDS and replayed
+byte for byte. Failures are not stored, so a retry after an error runs
+again. A key reused with a different request body is rejected.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException
+
+from services import user_profile
+from services.metrics import counter, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# How long a completed response is replayed for its key
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+
+# How long a key stays pending, which bounds how long a duplicate waits on a worker that died
+IDEMPOTENCY_PENDING_SECONDS = int(os.getenv('IDEMPOTENCY_PENDING_SECONDS', '60'))
+
+# How often a duplicate on another worker checks for the stored response
+IDEMPOTENCY_POLL_SECONDS = float(os.getenv('IDEMPOTENCY_POLL_SECONDS', '0.1'))
+
+# Most responses kept in process when Redis is not configured
+IDEMPOTENCY_LOCAL_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_LOCAL_MAX_ENTRIES', '1000'))
+
+MAX_KEY_LENGTH = 255
+
+# Stored values are a status byte, the 32-character request fingerprint and, once done, the response body
+PENDING = b'P'
+DONE = b'D'
+FINGERPRINT_LENGTH = 32
+
+idempotent_requests = counter('idempotent_requests_total', 'Requests carrying an Idempotency-Key by outcome')
+
+# Requests still running in this worker: storage key -> (fingerprint, task)
+inflight_requests = {}
+
+# In-process fallback when Redis is not configured: storage key -> (expires_at, fingerprint, body), oldest first
+local_responses = OrderedDict()
+
+def request_fingerprint(payload) -> bytes:
+    digest = hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return digest[:FINGERPRINT_LENGTH].encode('ascii')
+
+def _storage_key(scope: str, idempotency_key: str) -> str:
+    digest = hashlib.sha256(idempotency_key.encode('utf-8')).hexdigest()
+    return f"idempotency:{scope}:{digest}"
+
+def _conflict():
+    idempotent_requests.inc(result='conflict')
+    raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+async def _lookup(key: str) -> Optional[bytes]:
+    if user_profile.redis_client:
+        with stage_timer('redis'):
+            return await user_profile.redis_client.get(key)
+    entry = local_responses.get(key)
+    if entry and entry[0] > time.monotonic():
+        return DONE + entry[1] + entry[2]
+    local_responses.pop(key, None)
+    return None
+
+async def _claim(key: str, fingerprint: bytes) -> bool:
+    if not user_profile.redis_client:
+        return True
+    with stage_timer('redis'):
+        return bool(await user_profile.redis_client.set(key, PENDING + fingerprint, nx=True, ex=IDEMPOTENCY_PENDING_SECONDS))
+
+def _remember_locally(key: str, fingerprint: bytes, body: bytes):
+    now = time.monotonic()
+    local_responses[key] = (now + IDEMPOTENCY_TTL_SECONDS, fingerprint, body)
+    local_responses.move_to_end(key)
+    # Every entry has the same TTL, so expired ones are at the front
+    while local_responses and (
+        len(local_responses) > IDEMPOTENCY_LOCAL_MAX_ENTRIES or next(iter(local_responses.values()))[0] <= now
+    ):
+        local_responses.popitem(last=False)
+
+async def _run(key: str, fingerprint: bytes, handler: Callable[[], Awaitable[bytes]]) -> bytes:
+    try:
+        body = await handler()
+    except BaseException:
+        # Let the next retry run the request again
+        if user_profile.redis_client:
+            try:
+                await user_profile.redis_client.delete(key)
+            except Exception as e:
+                logger.warning(f"Failed to release idempotency key: {e}")
+        raise
+
+    try:
+        if user_profile.redis_client:
+            with stage_timer('redis'):
+                await user_profile.redis_client.set(key, DONE + fingerprint + body, ex=IDEMPOTENCY_TTL_SECONDS)
+        else:
+            _remember_locally(key, fingerprint, body)
+    except Exception as e:
+        logger.warning(f"Failed to store idempotent response: {e}")
+    return body
+
+def _start(key: str, fingerprint: bytes, handler: Callable[[], Awaitable[bytes]]) -> asyncio.Task:
+    # A task of its own, so the work finishes and is stored even if the first client hangs up
+    task = asyncio.ensure_future(_run(key, fingerprint, handler))
+    inflight_requests[key] = (fingerprint, task)
+
+    def _forget(finished):
+        if inflight_requests.get(key, (None, None))[1] is finished:
+            del inflight_requests[key]
+
+    task.add_done_callback(_forget)
+    return task
+
+async def run_idempotent(idempotency_key: Optional[str], scope: str, payload,
+                         handler: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, bool]:
+    """
+    Run handler once per (scope, Idempotency-Key) and return (body, replayed).
+    Without a key the handler simply runs.
+    """
+    if not idempotency_key:
+        return await handler(), False
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+    key = _storage_key(scope, idempotency_key)
+    fingerprint = request_fingerprint(payload)
+
+    while True:
+        inflight = inflight_requests.get(key)
+        if inflight is not None:
+            if inflight[0] != fingerprint:
+                _conflict()
+            idempotent_requests.inc(result='attached')
+            return await asyncio.shield(inflight[1]), True
+
+        try:
+            stored = await _lookup(key)
+            claimed = stored is None and await _claim(key, fingerprint)
+        except Exception as e:
+            logger.warning(f"Idempotency lookup failed: {e}")
+            idempotent_requests.inc(result='error')
+            return await handler(), False
+
+        if claimed:
+            idempotent_requests.inc(result='new')
+            return await asyncio.shield(_start(key, fingerprint, handler)), False
+        if stored is not None:
+            if stored[1:1 + FINGERPRINT_LENGTH] != fingerprint:
+                _conflict()
+            if stored[:1] == DONE:
+                idempotent_requests.inc(result='replayed')
+                return stored[1 + FINGERPRINT_LENGTH:], True
+            # Running on another worker; its pending marker expires if that worker dies
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
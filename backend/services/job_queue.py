@@ -0,0 +1,218 @@
+"""
+Redis-backed job queue for recipe generation.
+
+A job is a hash (job:{id}) holding the request, its status and, once done,
+the encoded response. Its id moves through two lists:
+
+    jobs:queue  --claim (LMOVE)-->  jobs:processing  --complete/fail--> removed
+
+A claim takes a lease in the jobs:leases sorted set, scored by when it
+runs out; the worker renews it while the job runs. A reaper returns jobs
+whose lease ran out (the worker died or hung) to the queue, or fails them
+once they have used JOB_MAX_ATTEMPTS.
+
+Completing, failing and requeueing a job update its hash and move its id
+in one MULTI transaction, so a job that says queued is always on the
+queue. The reaper WATCHes the job hash, which every transition rewrites,
+so only one reaper, and no finishing worker, wins a race for a job.
+"""
+import os
+import time
+import uuid
+import logging
+from typing import Dict, Any, List, Optional
+
+import orjson
+from redis.exceptions import WatchError
+
+from services import user_profile
+from services.metrics import counter, gauge, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Accept POST /api/jobs/generate-recipe; needs Redis and at least one worker process
+JOBS_ENABLED = os.getenv('JOBS_ENABLED', 'false').lower() == 'true'
+
+# How long a claimed job may go without a lease renewal before it is handed to another worker
+JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv('JOB_VISIBILITY_TIMEOUT_SECONDS', '60'))
+
+# Attempts per job, including the first, before it is marked failed
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+# How long job status and results are kept after the last update
+JOB_RESULT_TTL_SECONDS = int(os.getenv('JOB_RESULT_TTL_SECONDS', '86400'))
+
+QUEUE_KEY = 'jobs:queue'
+PROCESSING_KEY = 'jobs:processing'
+LEASES_KEY = 'jobs:leases'
+
+GENERATE_RECIPE = 'generate_recipe'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+jobs_total = counter('jobs_total', 'Recipe generation jobs by transition')
+queue_depth = gauge('jobs_queue_depth', 'Jobs waiting in the queue as of the last enqueue or claim')
+
+def _job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+# Stored encoded; everything else is text
+BLOB_FIELDS = ('request', 'result')
+
+def _decode(job: Dict[bytes, bytes]) -> Dict[str, Any]:
+    decoded = {}
+    for field, value in job.items():
+        field = field.decode('utf-8')
+        decoded[field] = value if field in BLOB_FIELDS else value.decode('utf-8')
+    return decoded
+
+def decode_request(job: Dict[str, Any]) -> Dict[str, Any]:
+    return orjson.loads(job['request'])
+
+async def enqueue_job(kind: str, payload: Dict[str, Any]) -> str:
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    with stage_timer('redis'):
+        async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(_job_key(job_id), mapping={
+                'kind': kind,
+                'status': QUEUED,
+                'attempts': 0,
+                'request': orjson.dumps(payload),
+                'created_at': now,
+                'updated_at': now
+            })
+            pipe.expire(_job_key(job_id), JOB_RESULT_TTL_SECONDS)
+            # Written before the id is queued so a worker never claims a job it cannot read
+            pipe.lpush(QUEUE_KEY, job_id)
+            *_, depth = await pipe.execute()
+    queue_depth.set(depth)
+    jobs_total.inc(transition='enqueued')
+    return job_id
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with stage_timer('redis'):
+        job = await user_profile.redis_client.hgetall(_job_key(job_id))
+    return _decode(job) if job else None
+
+async def claim_job() -> Optional[Dict[str, Any]]:
+    """Move the oldest queued job to processing and lease it; None when the queue is empty"""
+    with stage_timer('redis'):
+        job_id = await user_profile.redis_client.lmove(QUEUE_KEY, PROCESSING_KEY, 'RIGHT', 'LEFT')
+        if job_id is None:
+            return None
+        job_id = job_id.decode('utf-8')
+        async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+            pipe.zadd(LEASES_KEY, {job_id: time.time() + JOB_VISIBILITY_TIMEOUT_SECONDS})
+            pipe.hincrby(_job_key(job_id), 'attempts', 1)
+            pipe.hset(_job_key(job_id), mapping={'status': RUNNING, 'updated_at': time.time()})
+            pipe.hgetall(_job_key(job_id))
+            pipe.llen(QUEUE_KEY)
+            *_, job, depth = await pipe.execute()
+    queue_depth.set(depth)
+    if not job.get(b'request'):
+        # Expired or deleted while queued; drop the fields the claim just wrote
+        await _release(job_id)
+        await user_profile.redis_client.delete(_job_key(job_id))
+        jobs_total.inc(transition='dropped')
+        return None
+    jobs_total.inc(transition='claimed')
+    return {'id': job_id, **_decode(job)}
+
+async def renew_lease(job_id: str):
+    with stage_timer('redis'):
+        await user_profile.redis_client.zadd(LEASES_KEY, {job_id: time.time() + JOB_VISIBILITY_TIMEOUT_SECONDS}, xx=True)
+
+async def _release(job_id: str):
+    async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+        pipe.zrem(LEASES_KEY, job_id)
+        pipe.lrem(PROCESSING_KEY, 1, job_id)
+        await pipe.execute()
+
+def _queue_transition(pipe, job_id: str, fields: Dict[str, Any]):
+    """Add the commands that record a job's new status and take it off processing to a transaction"""
+    pipe.hset(_job_key(job_id), mapping={**fields, 'updated_at': time.time()})
+    pipe.expire(_job_key(job_id), JOB_RESULT_TTL_SECONDS)
+    pipe.zrem(LEASES_KEY, job_id)
+    pipe.lrem(PROCESSING_KEY, 1, job_id)
+    if fields['status'] == QUEUED:
+        pipe.lpush(QUEUE_KEY, job_id)
+
+def _failure_fields(attempts: int, error: str) -> Dict[str, Any]:
+    return {'status': QUEUED if attempts < JOB_MAX_ATTEMPTS else FAILED, 'error': error}
+
+async def _finish(job_id: str, fields: Dict[str, Any]):
+    with stage_timer('redis'):
+        async with user_profile.redis_client.pipeline(transaction=True) as pipe:
+            _queue_transition(pipe, job_id, fields)
+            await pipe.execute()
+
+async def complete_job(job_id: str, result: bytes):
+    await _finish(job_id, {'status': SUCCEEDED, 'result': result})
+    jobs_total.inc(transition='succeeded')
+
+async def fail_job(job_id: str, attempts: int, error: str):
+    """Requeue the job for another attempt, or mark it failed once it has used them all"""
+    fields = _failure_fields(attempts, error)
+    await _finish(job_id, fields)
+    jobs_total.inc(transition='retried' if fields['status'] == QUEUED else 'failed')
+
+async def _reap(job_id: str, now: float) -> Optional[Dict[str, Any]]:
+    """
+    Requeue or fail a job whose worker is gone and return it, or None if
+    a worker or another reaper got to it first.
+    """
+    key = _job_key(job_id)
+    try:
+        with stage_timer('redis'):
+            async with user_profile.redis_client.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                job = await pipe.hgetall(key)
+                lease = await pipe.zscore(LEASES_KEY, job_id)
+                position = await pipe.lpos(PROCESSING_KEY, job_id)
+                # A job whose worker died before its claim finished still says queued
+                if not job or position is None or (lease is not None and lease > now):
+                    return None
+                job = _decode(job)
+                if job['status'] not in (QUEUED, RUNNING):
+                    return None
+                fields = _failure_fields(int(job.get('attempts', 0)), "worker lease expired")
+                pipe.multi()
+                _queue_transition(pipe, job_id, fields)
+                await pipe.execute()
+    except WatchError:
+        return None
+    jobs_total.inc(transition='retried' if fields['status'] == QUEUED else 'failed')
+    return job
+
+async def reap_expired_leases(unleased: set) -> List[str]:
+    """
+    Hand jobs whose lease ran out back to the queue. Jobs found in processing
+    without a lease (their worker died between the claim and the lease) are
+    treated the same once they are seen that way on two consecutive passes;
+    unleased carries them from one pass to the next.
+    """
+    now = time.time()
+    with stage_timer('redis'):
+        expired = [job_id.decode('utf-8') for job_id in await user_profile.redis_client.zrangebyscore(LEASES_KEY, '-inf', now)]
+        processing = [job_id.decode('utf-8') for job_id in await user_profile.redis_client.lrange(PROCESSING_KEY, 0, -1)]
+        async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+            for job_id in processing:
+                pipe.zscore(LEASES_KEY, job_id)
+            scores = await pipe.execute()
+
+    missing = {job_id for job_id, score in zip(processing, scores) if score is None}
+    reaped = []
+    for job_id in dict.fromkeys(expired + sorted(missing & unleased)):
+        job = await _reap(job_id, now)
+        if job is None:
+            continue
+        logger.warning(f"Job {job_id} lost its worker after {int(job.get('attempts', 0))} attempts")
+        jobs_total.inc(transition='lease_expired')
+        reaped.append(job_id)
+    unleased.clear()
+    unleased.update(missing - set(reaped))
+    return reaped
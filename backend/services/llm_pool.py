@@ -0,0 +1,356 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from services.metrics import register_collector
+from services.ai_usage import record_ai_call, count_ai_call
+
+logger = logging.getLogger(__name__)
+
+# Pool of Azure OpenAI chat deployments
+pool_endpoints = []
+
+# Circuit breaker and latency tracking settings
+FAILURE_THRESHOLD = int(os.getenv('LLM_POOL_FAILURE_THRESHOLD', '5'))
+COOLDOWN_SECONDS = float(os.getenv('LLM_POOL_COOLDOWN_SECONDS', '30'))
+LATENCY_WINDOW = int(os.getenv('LLM_POOL_LATENCY_WINDOW', '200'))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('LLM_POOL_REQUEST_TIMEOUT_SECONDS', '30'))
+CLIENT_MAX_RETRIES = int(os.getenv('LLM_POOL_CLIENT_MAX_RETRIES', '0'))
+
+# Seconds of recent calls, failed ones included, that tier latency is computed over
+TIER_LATENCY_WINDOW_SECONDS = float(os.getenv('LLM_POOL_TIER_LATENCY_WINDOW_SECONDS', '120'))
+
+# Hedged request settings
+HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+
+class LLMPoolUnavailableError(Exception):
+    """Raised when no pool endpoint is available to serve a request"""
+
+def is_client_error(error: Exception) -> bool:
+    """
+    A 4xx other than 408 and 429, such as a bad request or a content filter
+    rejection: the prompt is at fault, not the endpoint
+    """
+    status_code = getattr(error, 'status_code', None)
+    return status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429)
+
+class PoolEndpoint:
+    """A single Azure OpenAI deployment with its own latency window and circuit breaker"""
+
+    def __init__(self, name: str, deployment: str, weight: float = 1.0, client=None, tier: str = 'quality'):
+        self.name = name
+        self.deployment = deployment
+        self.weight = weight
+        self.tier = tier
+        self.client = client
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        # (finished at, elapsed) for successes and endpoint failures alike, for tier routing
+        self.recent_calls = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.success_count = 0
+        self.failure_count = 0
+
+    def is_available(self, now: float) -> bool:
+        """Closed circuits are available; open ones allow a single probe after the cooldown"""
+        if self.opened_at is None:
+            return True
+        return now - self.opened_at >= COOLDOWN_SECONDS and not self.probe_in_flight
+
+    def observe_call(self, elapsed: float):
+        self.recent_calls.append((time.monotonic(), elapsed))
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.success_count += 1
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        if self.opened_at is not None:
+            logger.info(f"LLM endpoint {self.name} recovered, closing circuit")
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failure_count += 1
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.opened_at is not None or self.consecutive_failures >= FAILURE_THRESHOLD:
+            if self.opened_at is None:
+                logger.warning(f"LLM endpoint {self.name} ejected after {self.consecutive_failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency percentile in seconds over the recent window"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(fraction * len(ordered)))
+        return ordered[index]
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            'name': self.name,
+            'deployment': self.deployment,
+            'tier': self.tier,
+            'weight': self.weight,
+            'circuit': 'closed' if self.opened_at is None else 'open',
+            'successes': self.success_count,
+            'failures': self.failure_count,
+            'latency_p50_ms': p50 * 1000 if p50 is not None else None,
+            'latency_p95_ms': p95 * 1000 if p95 is not None else None
+        }
+
+def _load_pool_config() -> List[Dict[str, Any]]:
+    """Read the pool definition from AZURE_OPENAI_POOL, falling back to the single-endpoint settings"""
+    pool_json = os.getenv('AZURE_OPENAI_POOL')
+    if pool_json:
+        return json.loads(pool_json)
+
+    endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
+    key = os.getenv('AZURE_OPENAI_KEY')
+    if endpoint and key:
+        pool = [{
+            'name': 'default',
+            'endpoint': endpoint,
+            'key': key,
+            'deployment': os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME', 'gpt-35-turbo'),
+            'weight': 1.0,
+            'tier': 'quality'
+        }]
+        # A smaller deployment on the same resource for requests routed to the fast tier
+        fast_deployment = os.getenv('AZURE_OPENAI_FAST_DEPLOYMENT_NAME')
+        if fast_deployment:
+            pool.append({'name': 'fast', 'endpoint': endpoint, 'key': key, 'deployment': fast_deployment, 'weight': 1.0, 'tier': 'fast'})
+        return pool
+    return []
+
+def init_llm_pool():
+    """Initialize the pool of Azure OpenAI chat endpoints"""
+    global pool_endpoints
+
+    try:
+        default_api_version = os.getenv('AZURE_OPENAI_API_VERSION', '2023-12-01-preview')
+        endpoints = []
+        pool_config = _load_pool_config()
+        if pool_config:
+            from openai import AsyncAzureOpenAI
+        for index, entry in enumerate(pool_config):
+            api_key = entry.get('key') or os.getenv(entry.get('key_env', ''), '')
+            client = AsyncAzureOpenAI(
+                azure_endpoint=entry['endpoint'],
+                api_key=api_key,
+                api_version=entry.get('api_version', default_api_version),
+                timeout=REQUEST_TIMEOUT_SECONDS,
+                max_retries=CLIENT_MAX_RETRIES
+            )
+            endpoints.append(PoolEndpoint(
+                name=entry.get('name', f"endpoint-{index}"),
+                deployment=entry.get('deployment', 'gpt-35-turbo'),
+                weight=float(entry.get('weight', 1.0)),
+                client=client,
+                tier=entry.get('tier', 'quality')
+            ))
+        pool_endpoints = endpoints
+
+        if pool_endpoints:
+            logger.info(f"Azure OpenAI pool initialized with {len(pool_endpoints)} endpoints")
+        else:
+            logger.warning("No Azure OpenAI pool endpoints configured")
+
+    except Exception as e:
+        logger.error(f"Failed to initialize Azure OpenAI pool: {e}")
+        pool_endpoints = []
+
+def has_endpoints() -> bool:
+    return bool(pool_endpoints)
+
+def has_tier(tier: str) -> bool:
+    return any(ep.tier == tier for ep in pool_endpoints)
+
+def tier_latency_percentile(tier: str, fraction: float) -> Optional[float]:
+    """
+    Latency percentile in seconds over the last TIER_LATENCY_WINDOW_SECONDS
+    of calls to every endpoint in a tier. Failed and timed-out calls count at
+    their elapsed time; with no recent calls there is no percentile.
+    """
+    since = time.monotonic() - TIER_LATENCY_WINDOW_SECONDS
+    latencies = sorted(
+        elapsed for ep in pool_endpoints if ep.tier == tier
+        for finished_at, elapsed in ep.recent_calls if finished_at >= since
+    )
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+def choose_endpoint(exclude: Optional[List[PoolEndpoint]] = None, tier: Optional[str] = None) -> Optional[PoolEndpoint]:
+    """
+    Weighted random choice among endpoints whose circuit allows traffic,
+    preferring the requested tier and falling back to any tier
+    """
+    now = time.monotonic()
+    candidates = [
+        ep for ep in pool_endpoints
+        if ep.weight > 0 and ep.is_available(now) and not (exclude and ep in exclude)
+    ]
+    if tier is not None and any(ep.tier == tier for ep in candidates):
+        candidates = [ep for ep in candidates if ep.tier == tier]
+    if not candidates:
+        return None
+
+    chosen = random.choices(candidates, weights=[ep.weight for ep in candidates])[0]
+    if chosen.opened_at is not None:
+        # Half-open: this request is the probe
+        chosen.probe_in_flight = True
+    return chosen
+
+async def _call_endpoint(endpoint: PoolEndpoint, messages: List[Dict[str, str]], params: Dict[str, Any]):
+    start_time = time.perf_counter()
+    try:
+        response = await endpoint.client.chat.completions.create(
+            model=endpoint.deployment,
+            messages=messages,
+            **params
+        )
+    except asyncio.CancelledError:
+        # Losing side of a hedge; not a health signal, and its usage is never reported
+        endpoint.probe_in_flight = False
+        count_ai_call('chat', endpoint.deployment, 'completion', endpoint.name, 'cancelled')
+        raise
+    except Exception as e:
+        if is_client_error(e):
+            # The endpoint answered; only the circuit's probe slot is given back
+            endpoint.probe_in_flight = False
+            logger.warning(f"LLM endpoint {endpoint.name} rejected the request: {e}")
+            await record_ai_call('chat', endpoint.deployment, time.perf_counter() - start_time,
+                                 operation='completion', endpoint=endpoint.name, outcome='rejected')
+            raise
+        elapsed = time.perf_counter() - start_time
+        endpoint.record_failure()
+        endpoint.observe_call(elapsed)
+        logger.warning(f"LLM endpoint {endpoint.name} failed: {e}")
+        await record_ai_call('chat', endpoint.deployment, elapsed,
+                             operation='completion', endpoint=endpoint.name, outcome='error')
+        raise
+    latency = time.perf_counter() - start_time
+    endpoint.record_success(latency)
+    endpoint.observe_call(latency)
+    usage = getattr(response, 'usage', None)
+    await record_ai_call(
+        'chat', endpoint.deployment, latency, operation='completion', endpoint=endpoint.name,
+        prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+        completion_tokens=getattr(usage, 'completion_tokens', 0) or 0
+    )
+    return response
+
+def _hedge_delay(endpoint: PoolEndpoint) -> Optional[float]:
+    if not HEDGE_ENABLED or len(endpoint.latencies) < HEDGE_MIN_SAMPLES:
+        return None
+    return endpoint.percentile(0.95)
+
+async def create_chat_completion(messages: List[Dict[str, str]], tier: Optional[str] = None, **params):
+    """
+    Send a chat completion to the pool.
+
+    The primary endpoint is picked by weight, within the requested tier while
+    it has a healthy endpoint. If hedging is enabled and the
+    primary has not answered by its own p95, a second request goes to another
+    endpoint and the first successful response wins. Without a hedge, a failed
+    primary fails over once to another endpoint. Client errors (see
+    is_client_error) are raised as they are, without failover or hedging.
+    """
+    primary = choose_endpoint(tier=tier)
+    if primary is None:
+        raise LLMPoolUnavailableError("No healthy Azure OpenAI endpoints available")
+
+    primary_task = asyncio.create_task(_call_endpoint(primary, messages, params))
+    hedge_delay = _hedge_delay(primary)
+    if hedge_delay is None:
+        try:
+            return await primary_task
+        except Exception as e:
+            if is_client_error(e):
+                raise
+            secondary = choose_endpoint(exclude=[primary], tier=tier)
+            if secondary is None:
+                raise
+            logger.info(f"Failing over LLM request from {primary.name} to {secondary.name}")
+            return await _call_endpoint(secondary, messages, params)
+
+    done, _ = await asyncio.wait({primary_task}, timeout=hedge_delay)
+    if done and not primary_task.exception():
+        return primary_task.result()
+    if done and is_client_error(primary_task.exception()):
+        raise primary_task.exception()
+
+    secondary = choose_endpoint(exclude=[primary], tier=tier)
+    if secondary is None:
+        return await primary_task
+
+    logger.info(f"Hedging LLM request from {primary.name} to {secondary.name}")
+    pending = {primary_task} if not done else set()
+    pending.add(asyncio.create_task(_call_endpoint(secondary, messages, params)))
+    last_error = primary_task.exception() if done else None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+                if is_client_error(last_error):
+                    raise last_error
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def warm_up_pool() -> int:
+    """
+    Open a connection to every endpoint so the first completion does not pay
+    for DNS and the TLS handshake. Any HTTP response counts, even an error
+    status; only connection failures are raised. Returns the endpoints warmed.
+    """
+    from openai import APIStatusError
+
+    async def touch(endpoint: PoolEndpoint):
+        try:
+            await endpoint.client.with_options(max_retries=0).models.list()
+        except APIStatusError:
+            pass
+
+    await asyncio.gather(*(touch(ep) for ep in pool_endpoints))
+    return len(pool_endpoints)
+
+async def close_llm_pool():
+    """Close every endpoint's HTTP connection pool"""
+    for endpoint in pool_endpoints:
+        try:
+            await endpoint.client.close()
+        except Exception as e:
+            logger.warning(f"Error closing Azure OpenAI client {endpoint.name}: {e}")
+
+def get_pool_stats() -> List[Dict[str, Any]]:
+    """Per-endpoint routing, circuit and latency statistics"""
+    return [ep.stats() for ep in pool_endpoints]
+
+def _collect_pool_metrics():
+    stats = get_pool_stats()
+    return [
+        ('llm_endpoint_circuit_open', 'gauge', 'Whether the endpoint circuit breaker is open',
+         [({'endpoint': s['name']}, 1 if s['circuit'] == 'open' else 0) for s in stats]),
+        ('llm_endpoint_requests_total', 'counter', 'Chat completions per endpoint and outcome',
+         [({'endpoint': s['name'], 'outcome': 'success'}, s['successes']) for s in stats] +
+         [({'endpoint': s['name'], 'outcome': 'failure'}, s['failures']) for s in stats]),
+        ('llm_endpoint_latency_p95_seconds', 'gauge', 'Recent p95 chat completion latency per endpoint',
+         [({'endpoint': s['name']}, s['latency_p95_ms'] / 1000 if s['latency_p95_ms'] is not None else None) for s in stats])
+    ]
+
+register_collector(_collect_pool_metrics)
@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, tuned for a pipeline whose p99 sits around 10s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 7.5, 10.0, 15.0, 30.0)
+
+# Registered metric families keyed by name
+histograms = {}
+counters = {}
+gauges = {}
+
+# Callbacks that contribute point-in-time samples at scrape time
+collectors = []
+
+# Event loop lag sampling interval
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv('EVENT_LOOP_LAG_INTERVAL_MS', '100')) / 1000
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Stages currently in progress across all requests, with their nesting counts
+active_stages = {}
+
+# Stages entered since the last lag sample; a blocking stage has usually exited by the time the sampler wakes
+entered_stages = set()
+
+# Background lag sampler
+lag_monitor_task = None
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+class Histogram:
+    """Cumulative-bucket histogram; updates are plain list writes so observe() stays cheap"""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]]:
+        return {
+            key: {'buckets': list(counts), 'sum': total, 'count': count}
+            for key, (counts, total, count) in self.series.items()
+        }
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+class Gauge:
+    """Settable gauge with labels"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def set(self, value: float, **labels):
+        self.series[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+def histogram(name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    if name not in histograms:
+        histograms[name] = Histogram(name, help_text, buckets)
+    return histograms[name]
+
+def counter(name: str, help_text: str) -> Counter:
+    if name not in counters:
+        counters[name] = Counter(name, help_text)
+    return counters[name]
+
+def gauge(name: str, help_text: str) -> Gauge:
+    if name not in gauges:
+        gauges[name] = Gauge(name, help_text)
+    return gauges[name]
+
+def register_collector(callback: Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]):
+    """
+    Register a scrape-time callback.
+
+    The callback returns (name, type, help, samples) tuples where samples is a
+    list of (labels, value) pairs.
+    """
+    collectors.append(callback)
+
+# Per-stage latency of the recipe pipeline and its dependencies
+stage_duration = histogram('stage_duration_seconds', 'Latency of individual pipeline stages')
+stage_errors = counter('stage_errors_total', 'Pipeline stage invocations that raised')
+
+event_loop_lag = histogram('event_loop_lag_seconds', 'Event loop scheduling delay by stage in progress', LAG_BUCKETS)
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a block of work as one stage: with stage_timer('llm'): ..."""
+    start_time = time.perf_counter()
+    active_stages[stage] = active_stages.get(stage, 0) + 1
+    entered_stages.add(stage)
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        if active_stages[stage] == 1:
+            del active_stages[stage]
+        else:
+            active_stages[stage] -= 1
+        stage_duration.observe(time.perf_counter() - start_time, stage=stage)
+
+async def _sample_event_loop_lag():
+    while True:
+        # Stages that ran at any point while we slept are the candidates for whatever blocked the loop
+        running = set(active_stages)
+        entered_stages.clear()
+        expected = time.perf_counter() + EVENT_LOOP_LAG_INTERVAL_SECONDS
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL_SECONDS)
+        lag = max(0.0, time.perf_counter() - expected)
+        for stage in (running | entered_stages | set(active_stages)) or {'idle'}:
+            event_loop_lag.observe(lag, stage=stage)
+
+def start_event_loop_monitor():
+    """Start sampling event loop lag on the running loop"""
+    global lag_monitor_task
+    if lag_monitor_task is None or lag_monitor_task.done():
+        lag_monitor_task = asyncio.get_running_loop().create_task(_sample_event_loop_lag())
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(key: Iterable[Tuple[str, str]], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus() -> str:
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines = []
+
+    for hist in histograms.values():
+        lines.append(f"# HELP {hist.name} {hist.help_text}")
+        lines.append(f"# TYPE {hist.name} histogram")
+        for key, data in hist.snapshot().items():
+            cumulative = 0
+            for bound, count in zip(hist.buckets + (float('inf'),), data['buckets']):
+                cumulative += count
+                lines.append(f"{hist.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{hist.name}_sum{_format_labels(key)} {_format_value(data['sum'])}")
+            lines.append(f"{hist.name}_count{_format_labels(key)} {data['count']}")
+
+    for family, metric_type in ((counters, 'counter'), (gauges, 'gauge')):
+        for metric in family.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric_type}")
+            for key, value in list(metric.series.items()):
+                lines.append(f"{metric.name}{_format_labels(key)} {_format_value(value)}")
+
+    for callback in collectors:
+        try:
+            for name, metric_type, help_text, samples in callback():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        except Exception as e:
+            logger.warning(f"Metrics collector failed: {e}")
+
+    return '\n'.join(lines) + '\n'
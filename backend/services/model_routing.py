@@ -0,0 +1,208 @@
+"""
+Routing of recipe generations between fast and quality chat deployments.
+
+Each request gets a complexity score from its dietary restrictions, pantry
+size and whether the user is returning (their prompt carries a profile).
+Requests below quality_threshold go to the fast tier, the rest to the
+quality tier. max_tokens is sized to the recipe the request should produce
+and capped per tier, so a simple request cannot run long.
+
+Routing follows observed latency: while the quality tier's p95 over the
+last LLM_POOL_TIER_LATENCY_WINDOW_SECONDS (failed and timed-out calls
+included) is above quality_max_p95_seconds, only requests scoring at least
+force_quality_score keep using it and the rest move to the fast tier,
+except a quality_probe_fraction share that keeps the measurement fresh so
+routing returns once the tier recovers.
+Without a fast deployment in the pool every request goes to the quality
+endpoints, as before.
+
+The policy starts from DEFAULT_POLICY and MODEL_ROUTING_POLICY, and can be
+changed at runtime: workers re-read overrides from Redis every
+MODEL_ROUTING_REFRESH_SECONDS.
+
+    python -m services.model_routing show
+    python -m services.model_routing set quality_threshold=3 max_tokens.fast=700
+    python -m services.model_routing reset
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from typing import Dict, Any, List, Optional
+
+from services import llm_pool, user_profile
+from services.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+FAST = 'fast'
+QUALITY = 'quality'
+
+DEFAULT_POLICY = {
+    # Complexity points per dietary restriction, per available ingredient and for a returning user
+    'restriction_weight': 1.0,
+    'ingredient_weight': 0.25,
+    'returning_user_weight': 1.0,
+    # Requests scoring at least this go to the quality tier
+    'quality_threshold': 2.0,
+    # While the quality tier's p95 is above this, only requests scoring at least force_quality_score use it
+    'quality_max_p95_seconds': 8.0,
+    'force_quality_score': 4.0,
+    # Share of the requests moved off a slow quality tier that still go to it, as latency probes
+    'quality_probe_fraction': 0.05,
+    # Expected completion length: a base recipe plus lines for ingredients and restriction notes
+    'base_tokens': 550,
+    'tokens_per_ingredient': 20,
+    'tokens_per_restriction': 25,
+    'max_tokens': {FAST: 800, QUALITY: 1200},
+    'temperature': {FAST: 0.7, QUALITY: 0.7}
+}
+
+# Startup overrides of DEFAULT_POLICY, as JSON
+MODEL_ROUTING_POLICY = json.loads(os.getenv('MODEL_ROUTING_POLICY', '{}'))
+
+# How often workers check Redis for runtime policy overrides
+MODEL_ROUTING_REFRESH_SECONDS = float(os.getenv('MODEL_ROUTING_REFRESH_SECONDS', '30'))
+
+POLICY_KEY = 'model_routing:policy'
+
+routing_decisions_total = counter('llm_routing_decisions_total', 'Generation routing decisions by tier and reason')
+
+runtime_overrides = {}
+last_policy_check = None
+
+class RoutingDecision:
+    """Where one generation goes and with which parameters"""
+
+    __slots__ = ('tier', 'max_tokens', 'temperature', 'score', 'reason')
+
+    def __init__(self, tier: str, max_tokens: int, temperature: float, score: float, reason: str):
+        self.tier = tier
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.score = score
+        self.reason = reason
+
+def _merge(base: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(base)
+    for key, value in overrides.items():
+        merged[key] = _merge(merged[key], value) if isinstance(value, dict) and isinstance(merged.get(key), dict) else value
+    return merged
+
+def current_policy() -> Dict[str, Any]:
+    return _merge(_merge(DEFAULT_POLICY, MODEL_ROUTING_POLICY), runtime_overrides)
+
+async def refresh_policy():
+    """Pick up runtime overrides from Redis, at most every MODEL_ROUTING_REFRESH_SECONDS"""
+    global runtime_overrides, last_policy_check
+
+    now = time.monotonic()
+    if not user_profile.redis_client or (last_policy_check is not None and now - last_policy_check < MODEL_ROUTING_REFRESH_SECONDS):
+        return
+    last_policy_check = now
+    try:
+        blob = await user_profile.redis_client.get(POLICY_KEY)
+        overrides = json.loads(blob) if blob else {}
+        if overrides != runtime_overrides:
+            logger.info(f"Model routing overrides changed to {overrides}")
+            runtime_overrides = overrides
+    except Exception as e:
+        logger.warning(f"Failed to refresh model routing policy: {e}")
+
+def complexity_score(preferences, profile: Optional[Dict[str, Any]], policy: Dict[str, Any]) -> float:
+    returning = bool(profile and (profile.get('cooking_history_count') or profile.get('cooking_history')))
+    return (
+        policy['restriction_weight'] * len(preferences.dietary_restrictions)
+        + policy['ingredient_weight'] * len(preferences.available_ingredients)
+        + (policy['returning_user_weight'] if returning else 0.0)
+    )
+
+def decide(preferences, profile: Optional[Dict[str, Any]], policy: Dict[str, Any]) -> RoutingDecision:
+    score = complexity_score(preferences, profile, policy)
+    if score < policy['quality_threshold']:
+        tier, reason = FAST, 'simple'
+    else:
+        quality_p95 = llm_pool.tier_latency_percentile(QUALITY, 0.95)
+        if quality_p95 is not None and quality_p95 > policy['quality_max_p95_seconds'] and score < policy['force_quality_score']:
+            if random.random() < policy['quality_probe_fraction']:
+                tier, reason = QUALITY, 'quality_probe'
+            else:
+                tier, reason = FAST, 'quality_slow'
+        else:
+            tier, reason = QUALITY, 'complex'
+    if not llm_pool.has_tier(tier):
+        reason = f"{reason}_no_{tier}"
+        tier = QUALITY if tier == FAST else FAST
+
+    expected_tokens = (
+        policy['base_tokens']
+        + policy['tokens_per_ingredient'] * len(preferences.available_ingredients)
+        + policy['tokens_per_restriction'] * len(preferences.dietary_restrictions)
+    )
+    max_tokens = int(min(expected_tokens, policy['max_tokens'].get(tier, expected_tokens)))
+    return RoutingDecision(tier, max_tokens, policy['temperature'].get(tier, 0.7), score, reason)
+
+async def route_generation(preferences, profile: Optional[Dict[str, Any]]) -> RoutingDecision:
+    """Classify a generation request and pick its tier and completion parameters"""
+    await refresh_policy()
+    decision = decide(preferences, profile, current_policy())
+    routing_decisions_total.inc(tier=decision.tier, reason=decision.reason)
+    return decision
+
+# ---------------------------------------------------------------------------
+# Runtime policy changes
+# ---------------------------------------------------------------------------
+
+def _parse_assignment(assignment: str) -> Dict[str, Any]:
+    """quality_threshold=3 or max_tokens.fast=700 as a nested override"""
+    path, _, raw = assignment.partition('=')
+    if not path or not raw:
+        raise SystemExit(f"Expected key=value, got {assignment}")
+    if path.split('.')[0] not in DEFAULT_POLICY:
+        raise SystemExit(f"Unknown policy key {path.split('.')[0]}; choose from {', '.join(DEFAULT_POLICY)}")
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    override = value
+    for key in reversed(path.split('.')):
+        override = {key: override}
+    return override
+
+async def _run(command: str, assignments: List[str]) -> Dict[str, Any]:
+    global runtime_overrides
+
+    await user_profile.init_redis()
+    if not user_profile.redis_client:
+        raise SystemExit("Redis is not configured")
+    blob = await user_profile.redis_client.get(POLICY_KEY)
+    overrides = json.loads(blob) if blob else {}
+    if command == 'set':
+        for assignment in assignments:
+            overrides = _merge(overrides, _parse_assignment(assignment))
+        await user_profile.redis_client.set(POLICY_KEY, json.dumps(overrides))
+    elif command == 'reset':
+        overrides = {}
+        await user_profile.redis_client.delete(POLICY_KEY)
+    runtime_overrides = overrides
+    await user_profile.close_redis()
+    return {'overrides': overrides, 'policy': current_policy()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or change the model routing policy at runtime")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('show', help="Print the overrides and the effective policy")
+    set_parser = commands.add_parser('set', help="Override policy values, e.g. quality_threshold=3 max_tokens.fast=700")
+    set_parser.add_argument('assignments', nargs='+')
+    commands.add_parser('reset', help="Remove every runtime override")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(_run(args.command, getattr(args, 'assignments', [])))
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    main()
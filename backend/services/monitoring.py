@@ -1,28 +1,39 @@
 import os
 import logging
-from opencensus.ext.azure.log_exporter import AzureLogHandler
-from opencensus.ext.azure.trace_exporter import AzureExporter
-from opencensus.trace.tracer import Tracer
-from opencensus.trace.samplers import ProbabilitySampler
+
+from services.telemetry import install_background_logging
 
 logger = logging.getLogger(__name__)
 
+# Trace sampling rate for the Application Insights tracer
+TRACE_SAMPLE_RATE = float(os.getenv('TELEMETRY_TRACE_SAMPLE_RATE', '0.1'))
+
+# Application Insights tracer, when configured
+tracer = None
+
 def setup_monitoring():
     """Setup Azure Application Insights monitoring"""
+    global tracer
+    
     try:
         # Get Application Insights instrumentation key
         instrumentation_key = os.getenv('APPLICATIONINSIGHTS_CONNECTION_STRING')
         
         if instrumentation_key:
+            # opencensus is only loaded when Application Insights is configured
+            from opencensus.ext.azure.log_exporter import AzureLogHandler
+            from opencensus.ext.azure.trace_exporter import AzureExporter
+            from opencensus.trace.tracer import Tracer
+            from opencensus.trace.samplers import ProbabilitySampler
+            
             # Setup Azure Log Handler
             azure_handler = AzureLogHandler(
                 connection_string=instrumentation_key
             )
             azure_handler.setLevel(logging.INFO)
             
-            # Add handler to root logger
-            root_logger = logging.getLogger()
-            root_logger.addHandler(azure_handler)
+            # Export through the background queue so logging never blocks requests
+            install_background_logging(extra_handlers=[azure_handler])
             
             # Setup Azure Trace Exporter
             azure_exporter = AzureExporter(
@@ -32,12 +43,14 @@ def setup_monitoring():
             # Setup tracer
             tracer = Tracer(
                 exporter=azure_exporter,
-                sampler=ProbabilitySampler(1.0)
+                sampler=ProbabilitySampler(TRACE_SAMPLE_RATE)
             )
             
             logger.info("Azure Application Insights monitoring configured")
             
         else:
+            # Console logging still moves off the request path
+            install_background_logging()
             logger.warning("APPLICATIONINSIGHTS_CONNECTION_STRING not found, monitoring disabled")
             
     except Exception as e:
@@ -0,0 +1,299 @@
+"""
+Off-peak pre-generation for popular preference combinations.
+
+Every generation request counts its combination of cuisine, spice level,
+meal types, cooking time and dietary restrictions (ingredients are left
+out; they are too varied to pre-generate for) in a per-day Redis sorted
+set. During PREGEN_OFF_PEAK_HOURS one worker at a time tops up a pool of
+ready recipes, text and image, for the PREGEN_TOP_COMBINATIONS most
+requested combinations of the last PREGEN_POPULARITY_DAYS. Each LLM call
+is charged against PREGEN_DAILY_LLM_BUDGET, shared by all workers.
+generate_recipe takes from the pool before anything else, so at peak a
+popular combination costs one Redis round trip instead of an LLM call.
+Requests that list available ingredients neither count nor draw from the
+pool: a pooled recipe was not written for their pantry. A drawn recipe
+that contains one of the user's disliked ingredients is pushed back for
+the next request.
+
+Pooled entries carry their creation time and are dropped once older than
+PREGEN_POOL_TTL_SECONDS, which is kept below the lifetime of the DALL-E
+image URL stored with them.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+import orjson
+
+from models.recipe import UserPreferences
+from services import user_profile
+from services.ai_integrations import call_azure_openai_generative_ai, call_azure_openai_dalle, FALLBACK_RECIPE_TEXT
+from services.recipe_reuse import contains_disliked
+from services.metrics import counter, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Count combinations and serve pre-generated recipes from the pool
+PREGEN_ENABLED = os.getenv('PREGEN_ENABLED', 'true').lower() == 'true'
+
+# LLM generations the scheduler may spend per UTC day across all workers; 0 disables pre-generation
+PREGEN_DAILY_LLM_BUDGET = int(os.getenv('PREGEN_DAILY_LLM_BUDGET', '0'))
+
+# UTC hours when the scheduler runs, as comma-separated start-end ranges; ranges may wrap midnight
+PREGEN_OFF_PEAK_HOURS = os.getenv('PREGEN_OFF_PEAK_HOURS', '22-6,15-17')
+
+# Combinations kept topped up, most requested first
+PREGEN_TOP_COMBINATIONS = int(os.getenv('PREGEN_TOP_COMBINATIONS', '20'))
+
+# Ready recipes kept per combination
+PREGEN_POOL_SIZE = int(os.getenv('PREGEN_POOL_SIZE', '5'))
+
+# Days of requests that decide popularity
+PREGEN_POPULARITY_DAYS = int(os.getenv('PREGEN_POPULARITY_DAYS', '7'))
+
+# Azure OpenAI image URLs stop working after 24 hours
+IMAGE_URL_LIFETIME_SECONDS = 86400
+
+# How long an unused pre-generated recipe is kept; capped an hour below the image URL lifetime
+PREGEN_POOL_TTL_SECONDS = min(int(os.getenv('PREGEN_POOL_TTL_SECONDS', '72000')), IMAGE_URL_LIFETIME_SECONDS - 3600)
+
+# How often each worker checks whether there is pre-generation to do
+PREGEN_INTERVAL_SECONDS = int(os.getenv('PREGEN_INTERVAL_SECONDS', '300'))
+
+COMBINATIONS_KEY = 'pregen:combinations'
+LOCK_KEY = 'pregen:lock'
+
+pool_draws = counter('pregen_pool_draws_total', 'Generation requests by whether a pre-generated recipe was available')
+pregenerated = counter('pregenerated_recipes_total', 'Scheduler generation attempts by result')
+
+scheduler_task = None
+
+def combination_key(preferences) -> str:
+    """Fingerprint of the enum-valued preferences; available ingredients are ignored"""
+    parts = [
+        preferences.cuisine.value,
+        preferences.spice_level.value,
+        ','.join(sorted(mt.value for mt in preferences.meal_type)),
+        preferences.max_cooking_time.value,
+        ','.join(sorted(dr.value for dr in preferences.dietary_restrictions))
+    ]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:24]
+
+def _combination_spec(preferences) -> bytes:
+    return orjson.dumps({
+        'cuisine': preferences.cuisine.value,
+        'spice_level': preferences.spice_level.value,
+        'meal_type': sorted(mt.value for mt in preferences.meal_type),
+        'max_cooking_time': preferences.max_cooking_time.value,
+        'dietary_restrictions': sorted(dr.value for dr in preferences.dietary_restrictions)
+    })
+
+def _popularity_key(day: datetime) -> str:
+    return f"pregen:popularity:{day.strftime('%Y%m%d')}"
+
+def _pool_key(combination: str) -> str:
+    return f"pregen:pool:{combination}"
+
+def _budget_key(day: datetime) -> str:
+    return f"pregen:budget:{day.strftime('%Y%m%d')}"
+
+def parse_hours(spec: str) -> Set[int]:
+    hours = set()
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        start, end = (int(value) for value in part.split('-'))
+        # 0-24 is the whole day, 22-6 wraps past midnight
+        length = (end - start) % 24 or (24 if end != start else 0)
+        hours.update((start + offset) % 24 for offset in range(length))
+    return hours
+
+OFF_PEAK_HOURS = parse_hours(PREGEN_OFF_PEAK_HOURS)
+
+def is_off_peak(now: Optional[datetime] = None) -> bool:
+    return (now or datetime.utcnow()).hour in OFF_PEAK_HOURS
+
+async def take_pregenerated(preferences, disliked_ingredients: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Count this request towards its combination's popularity and pop a
+    pre-generated {'recipe_text', 'image_url'} for it, in one round trip.
+    """
+    if not PREGEN_ENABLED or not user_profile.redis_client or preferences.available_ingredients:
+        return None
+
+    try:
+        combination = combination_key(preferences)
+        popularity_key = _popularity_key(datetime.utcnow())
+        with stage_timer('redis'):
+            async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+                pipe.zincrby(popularity_key, 1, combination)
+                pipe.expire(popularity_key, (PREGEN_POPULARITY_DAYS + 1) * 86400)
+                pipe.hset(COMBINATIONS_KEY, combination, _combination_spec(preferences))
+                pipe.lpop(_pool_key(combination))
+                results = await pipe.execute()
+        entry = results[-1]
+        # The pool is oldest first, so past the first fresh entry the rest are fresh too
+        expired = 0
+        while entry:
+            decoded = orjson.loads(entry)
+            if time.time() - decoded.get('created_at', 0) < PREGEN_POOL_TTL_SECONDS:
+                disliked = [ingredient.lower() for ingredient in disliked_ingredients or [] if ingredient.strip()]
+                # Entries pooled before ingredients were stored cannot be checked
+                if disliked and ('ingredients' not in decoded or contains_disliked(decoded['ingredients'], disliked)):
+                    # Back at the front, where the oldest entry belongs
+                    with stage_timer('redis'):
+                        await user_profile.redis_client.lpush(_pool_key(combination), entry)
+                    pool_draws.inc(result='disliked')
+                    return None
+                pool_draws.inc(result='hit')
+                logger.info("Serving pre-generated recipe")
+                return decoded
+            pool_draws.inc(result='expired')
+            expired += 1
+            if expired >= PREGEN_POOL_SIZE:
+                break
+            with stage_timer('redis'):
+                entry = await user_profile.redis_client.lpop(_pool_key(combination))
+        pool_draws.inc(result='empty')
+        return None
+    except Exception as e:
+        logger.warning(f"Pre-generated recipe lookup failed: {e}")
+        return None
+
+async def popular_combinations(limit: int) -> List[Tuple[str, float]]:
+    """Most requested combinations over the last PREGEN_POPULARITY_DAYS"""
+    today = datetime.utcnow()
+    with stage_timer('redis'):
+        async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+            for days_ago in range(PREGEN_POPULARITY_DAYS):
+                pipe.zrevrange(_popularity_key(today - timedelta(days=days_ago)), 0, limit * 4, withscores=True)
+            days = await pipe.execute()
+
+    totals = {}
+    for day in days:
+        for combination, count in day:
+            combination = combination.decode('utf-8')
+            totals[combination] = totals.get(combination, 0.0) + count
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+async def _charge_budget() -> bool:
+    """Reserve one LLM generation from today's budget"""
+    key = _budget_key(datetime.utcnow())
+    with stage_timer('redis'):
+        spent = await user_profile.redis_client.incr(key)
+        if spent == 1:
+            await user_profile.redis_client.expire(key, 2 * 86400)
+    return spent <= PREGEN_DAILY_LLM_BUDGET
+
+async def pregenerate_recipe(preferences: UserPreferences) -> Optional[Dict[str, Any]]:
+    """Generate one recipe and its image the way generate_recipe would for an anonymous user"""
+    # Imported here; the API module imports this one
+    from api.recipes import construct_recipe_prompt, parse_generated_recipe
+
+    recipe_text = await call_azure_openai_generative_ai(construct_recipe_prompt(preferences, {}, None))
+    if not recipe_text or recipe_text == FALLBACK_RECIPE_TEXT:
+        return None
+    parsed_recipe = parse_generated_recipe(recipe_text)
+    image_prompt = f"Delicious {parsed_recipe['title']} with Yippee noodles, professional food photography, appetizing presentation"
+    image_url = await call_azure_openai_dalle(image_prompt)
+    return {
+        'recipe_text': recipe_text,
+        'image_url': image_url,
+        'ingredients': [ingredient.name.lower() for ingredient in parsed_recipe['ingredients']],
+        'created_at': time.time()
+    }
+
+async def run_pregeneration() -> Dict[str, Any]:
+    """Top up the pools of the most popular combinations until they are full or the budget is spent"""
+    combinations = await popular_combinations(PREGEN_TOP_COMBINATIONS)
+    if not combinations:
+        return {'combinations': 0, 'generated': 0}
+
+    with stage_timer('redis'):
+        async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+            for combination, _ in combinations:
+                pipe.llen(_pool_key(combination))
+            pipe.hmget(COMBINATIONS_KEY, [combination for combination, _ in combinations])
+            *pool_sizes, specs = await pipe.execute()
+
+    generated = 0
+    for (combination, _), pool_size, spec in zip(combinations, pool_sizes, specs):
+        if not spec:
+            continue
+        preferences = UserPreferences(**orjson.loads(spec))
+        for _ in range(PREGEN_POOL_SIZE - pool_size):
+            if not is_off_peak():
+                return {'combinations': len(combinations), 'generated': generated, 'stopped': 'peak'}
+            if not await _charge_budget():
+                pregenerated.inc(result='budget_exhausted')
+                return {'combinations': len(combinations), 'generated': generated, 'stopped': 'budget'}
+            try:
+                entry = await pregenerate_recipe(preferences)
+            except Exception as e:
+                logger.warning(f"Pre-generation for {combination} failed: {e}")
+                entry = None
+            if entry is None:
+                pregenerated.inc(result='failed')
+                continue
+            with stage_timer('redis'):
+                async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.rpush(_pool_key(combination), orjson.dumps(entry))
+                    pipe.expire(_pool_key(combination), PREGEN_POOL_TTL_SECONDS)
+                    await pipe.execute()
+            pregenerated.inc(result='pooled')
+            generated += 1
+    return {'combinations': len(combinations), 'generated': generated}
+
+async def _hold_lock(token: bytes):
+    """Keep extending the scheduler lock while this worker's run lasts; a run can outlast one interval"""
+    while True:
+        await asyncio.sleep(PREGEN_INTERVAL_SECONDS / 3)
+        try:
+            if await user_profile.redis_client.get(LOCK_KEY) != token:
+                logger.warning("Lost the pre-generation lock during a run")
+                return
+            await user_profile.redis_client.expire(LOCK_KEY, PREGEN_INTERVAL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Failed to extend the pre-generation lock: {e}")
+
+async def _schedule():
+    token = f"{os.getpid()}:{os.urandom(8).hex()}".encode('utf-8')
+    while True:
+        await asyncio.sleep(PREGEN_INTERVAL_SECONDS)
+        try:
+            if not user_profile.redis_client or not is_off_peak():
+                continue
+            # One worker per interval; the lock expires on its own if that worker dies
+            if not await user_profile.redis_client.set(LOCK_KEY, token, nx=True, ex=PREGEN_INTERVAL_SECONDS):
+                continue
+            holder = asyncio.create_task(_hold_lock(token))
+            try:
+                result = await run_pregeneration()
+            finally:
+                holder.cancel()
+            if result['generated']:
+                logger.info(f"Pre-generated {result['generated']} recipes for {result['combinations']} popular combinations")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Recipe pre-generation failed: {e}")
+
+def start_pregeneration():
+    """Run the off-peak scheduler until stop_pregeneration"""
+    global scheduler_task
+    if PREGEN_ENABLED and PREGEN_DAILY_LLM_BUDGET > 0 and scheduler_task is None:
+        scheduler_task = asyncio.create_task(_schedule())
+
+async def stop_pregeneration():
+    global scheduler_task
+    if scheduler_task is not None:
+        scheduler_task.cancel()
+        try:
+            await scheduler_task
+        except asyncio.CancelledError:
+            pass
+        scheduler_task = None
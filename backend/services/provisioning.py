@@ -0,0 +1,315 @@
+"""
+Cosmos DB container provisioning and copy-migration.
+
+Each container's partition key and indexing policy is declared once here.
+Indexing policies can be changed in place, but partition keys cannot. A
+container on the wrong key is copied into a new one with `migrate`.
+
+    python -m services.provisioning ensure
+    python -m services.provisioning migrate generated_recipes generated_recipes_v2 --max-ru-per-second 400
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import argparse
+from typing import Dict, Any, List, Optional, Callable
+
+from azure.cosmos import CosmosClient, PartitionKey
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# Large free-text and nested fields that are never filtered or sorted on
+_UNQUERIED_RECIPE_PATHS = [
+    {"path": "/instructions/*"},
+    {"path": "/ingredients/*"},
+    {"path": "/description/?"},
+    {"path": "/nutrition_info/*"},
+    {"path": "/image_url/?"},
+    {"path": "/\"_etag\"/?"}
+]
+
+CONTAINER_SPECS = {
+    'recipes': {
+        'partition_key': '/id',
+        'indexing_policy': {
+            'indexingMode': 'consistent',
+            'automatic': True,
+            'includedPaths': [{"path": "/*"}],
+            'excludedPaths': _UNQUERIED_RECIPE_PATHS
+        }
+    },
+    'generated_recipes': {
+        # History is always read per user, so one user's recipes share a logical partition;
+        # the similar-recipes sync scans by _ts across partitions
+        'partition_key': '/user_id',
+        'indexing_policy': {
+            'indexingMode': 'consistent',
+            'automatic': True,
+            'includedPaths': [
+                {"path": "/user_id/?"},
+                {"path": "/type/?"},
+                {"path": "/created_at/?"},
+                {"path": "/cuisine/?"},
+                {"path": "/_ts/?"}
+            ],
+            'excludedPaths': [{"path": "/*"}],
+            'compositeIndexes': [
+                # get_user_recipes: WHERE user_id = @user_id AND type = ... ORDER BY created_at DESC
+                [
+                    {"path": "/user_id", "order": "ascending"},
+                    {"path": "/type", "order": "ascending"},
+                    {"path": "/created_at", "order": "descending"}
+                ]
+            ]
+        }
+    },
+    'user_profiles': {
+        # Profiles are only ever point-read by id within the user's partition
+        'partition_key': '/user_id',
+        'indexing_policy': {
+            'indexingMode': 'consistent',
+            'automatic': True,
+            'includedPaths': [{"path": "/user_id/?"}, {"path": "/updated_at/?"}],
+            'excludedPaths': [{"path": "/*"}]
+        }
+    },
+    'recipe_history': {
+        # Append-only entries, read per user newest first and scanned by _ts for the similarity job
+        'partition_key': '/user_id',
+        'indexing_policy': {
+            'indexingMode': 'consistent',
+            'automatic': True,
+            'includedPaths': [
+                {"path": "/user_id/?"},
+                {"path": "/kind/?"},
+                {"path": "/created_at/?"},
+                {"path": "/_ts/?"}
+            ],
+            'excludedPaths': [{"path": "/*"}],
+            'compositeIndexes': [
+                # get_history: WHERE user_id = @user_id AND kind = @kind ORDER BY created_at DESC
+                [
+                    {"path": "/user_id", "order": "ascending"},
+                    {"path": "/kind", "order": "ascending"},
+                    {"path": "/created_at", "order": "descending"}
+                ]
+            ]
+        }
+    }
+}
+
+# Per-container document fixes applied while copying
+def _fix_user_profile(item: Dict[str, Any]) -> Dict[str, Any]:
+    item.setdefault('id', item.get('user_id'))
+    return item
+
+MIGRATION_TRANSFORMS = {
+    'user_profiles': _fix_user_profile
+}
+
+def _system_fields_removed(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in item.items() if key not in ('_rid', '_self', '_etag', '_attachments', '_ts')}
+
+def _same_policy(current: Dict[str, Any], desired: Dict[str, Any]) -> bool:
+    """Compare the parts of an indexing policy we declare; the service adds defaults of its own"""
+    def paths(policy, key):
+        return sorted(entry['path'] for entry in policy.get(key, []))
+
+    def composites(policy):
+        return sorted(
+            json.dumps([(entry['path'], entry.get('order', 'ascending')) for entry in index])
+            for index in policy.get('compositeIndexes', [])
+        )
+
+    return (
+        paths(current, 'includedPaths') == paths(desired, 'includedPaths')
+        and paths(current, 'excludedPaths') == paths(desired, 'excludedPaths')
+        and composites(current) == composites(desired)
+    )
+
+def ensure_container(database, name: str, spec: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Create the container from its spec, or bring an existing container's
+    indexing policy up to date. Returns what was done.
+    """
+    spec = spec or CONTAINER_SPECS[name]
+    container = database.create_container_if_not_exists(
+        id=name,
+        partition_key=PartitionKey(path=spec['partition_key']),
+        indexing_policy=spec['indexing_policy']
+    )
+    properties = container.read()
+
+    current_key = properties.get('partitionKey', {}).get('paths', [None])[0]
+    if current_key != spec['partition_key']:
+        logger.error(
+            f"Container {name} is partitioned on {current_key}, expected {spec['partition_key']}; "
+            f"copy it into a new container with 'python -m services.provisioning migrate'"
+        )
+        return {'container': name, 'action': 'needs_migration', 'partition_key': current_key}
+
+    if not _same_policy(properties.get('indexingPolicy', {}), spec['indexing_policy']):
+        database.replace_container(
+            container,
+            partition_key=PartitionKey(path=spec['partition_key']),
+            indexing_policy=spec['indexing_policy']
+        )
+        logger.info(f"Updated indexing policy for container {name}")
+        return {'container': name, 'action': 'reindexing'}
+
+    return {'container': name, 'action': 'up_to_date'}
+
+def ensure_containers(database) -> List[Dict[str, Any]]:
+    """Apply every container spec; failures are reported per container"""
+    results = []
+    for name in CONTAINER_SPECS:
+        try:
+            results.append(ensure_container(database, name))
+        except CosmosHttpResponseError as e:
+            logger.error(f"Failed to provision container {name}: {e}")
+            results.append({'container': name, 'action': 'failed', 'error': str(e)})
+    return results
+
+class RequestUnitThrottle:
+    """Keep a long-running copy under a request-unit-per-second budget; safe to share between threads"""
+
+    def __init__(self, max_ru_per_second: float):
+        self.max_ru_per_second = max_ru_per_second
+        self.started = time.monotonic()
+        self.consumed = 0.0
+        self.lock = threading.Lock()
+
+    def charge(self, request_units: float):
+        with self.lock:
+            self.consumed += request_units
+            if self.max_ru_per_second <= 0:
+                return
+            ahead = self.consumed / self.max_ru_per_second - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+def _request_charge(container) -> float:
+    headers = container.client_connection.last_response_headers or {}
+    try:
+        return float(headers.get('x-ms-request-charge', 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+def migrate_container(
+    database,
+    source_name: str,
+    target_name: str,
+    max_ru_per_second: float = 400,
+    page_size: int = 100,
+    continuation_token: Optional[str] = None,
+    checkpoint: Optional[Callable[[Optional[str], int], None]] = None,
+    transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    spec_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Copy every document from source into target with upserts, so a rerun after
+    an interruption is safe. Reads and writes are both charged against the RU
+    budget. checkpoint(continuation_token, copied) is called after every page
+    so a copy can be resumed.
+    """
+    spec_name = spec_name or source_name
+    if spec_name not in CONTAINER_SPECS:
+        raise ValueError(f"No container spec for {spec_name}")
+    ensure_container(database, target_name, CONTAINER_SPECS[spec_name])
+
+    source = database.get_container_client(source_name)
+    target = database.get_container_client(target_name)
+    transform = transform or MIGRATION_TRANSFORMS.get(spec_name)
+    throttle = RequestUnitThrottle(max_ru_per_second)
+    copied = 0
+    skipped = 0
+
+    pages = source.query_items(
+        "SELECT * FROM c",
+        enable_cross_partition_query=True,
+        max_item_count=page_size
+    ).by_page(continuation_token)
+
+    for page in pages:
+        items = list(page)
+        throttle.charge(_request_charge(source))
+        for item in items:
+            document = _system_fields_removed(item)
+            if transform:
+                document = transform(document)
+            if not document.get('id'):
+                skipped += 1
+                logger.warning(f"Skipping document without id in {source_name}")
+                continue
+            target.upsert_item(document)
+            throttle.charge(_request_charge(target))
+            copied += 1
+        if checkpoint:
+            checkpoint(pages.continuation_token, copied)
+        logger.info(f"Copied {copied} documents from {source_name} to {target_name} ({throttle.consumed:.0f} RU)")
+
+    return {'copied': copied, 'skipped': skipped, 'request_units': round(throttle.consumed, 2)}
+
+def _connect():
+    connection_string = os.getenv('COSMOS_DB_CONNECTION_STRING')
+    if not connection_string:
+        raise SystemExit("COSMOS_DB_CONNECTION_STRING is not set")
+    client = CosmosClient.from_connection_string(connection_string)
+    return client.get_database_client(os.getenv('COSMOS_DB_NAME', 'yippee-recipes'))
+
+def main():
+    parser = argparse.ArgumentParser(description="Provision and migrate Cosmos DB containers")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('ensure', help="Create missing containers and update indexing policies")
+
+    migrate = commands.add_parser('migrate', help="Copy a container into a new one with the declared partition key")
+    migrate.add_argument('source')
+    migrate.add_argument('target')
+    migrate.add_argument('--spec', help="Container spec to apply to the target (defaults to the source name)")
+    migrate.add_argument('--max-ru-per-second', type=float, default=400, help="RU budget for reads and writes combined (0 disables)")
+    migrate.add_argument('--page-size', type=int, default=100)
+    migrate.add_argument('--checkpoint-file', help="Resume from and record progress to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    database = _connect()
+
+    if args.command == 'ensure':
+        results = ensure_containers(database)
+        print(json.dumps(results, indent=2))
+        sys.exit(1 if any(r['action'] in ('failed', 'needs_migration') for r in results) else 0)
+
+    continuation_token = None
+    checkpoint = None
+    if args.checkpoint_file:
+        if os.path.exists(args.checkpoint_file):
+            with open(args.checkpoint_file) as f:
+                continuation_token = json.load(f).get('continuation_token')
+            logger.info(f"Resuming migration from {args.checkpoint_file}")
+
+        def checkpoint(token, copied):
+            with open(args.checkpoint_file, 'w') as f:
+                json.dump({'continuation_token': token, 'copied': copied}, f)
+
+    try:
+        result = migrate_container(
+            database,
+            args.source,
+            args.target,
+            max_ru_per_second=args.max_ru_per_second,
+            page_size=args.page_size,
+            continuation_token=continuation_token,
+            checkpoint=checkpoint,
+            spec_name=args.spec
+        )
+    except CosmosResourceNotFoundError:
+        raise SystemExit(f"Container {args.source} not found")
+    print(json.dumps(result, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Callable, Awaitable, Optional, Tuple
+
+from services import database, user_profile, llm_pool, ai_integrations
+from services.catalog import get_catalog
+from services.metrics import gauge
+from services.cosmos_metrics import cosmos_operation
+
+logger = logging.getLogger(__name__)
+
+# Per-dependency limit on a warm-up probe
+WARMUP_TIMEOUT_SECONDS = float(os.getenv('WARMUP_TIMEOUT_SECONDS', '20'))
+
+# How often /ready re-probes a dependency that failed
+READINESS_RETRY_SECONDS = float(os.getenv('READINESS_RETRY_SECONDS', '5'))
+
+dependency_ready = gauge('dependency_ready', 'Whether a dependency passed its readiness probe')
+
+# name -> {'status', 'seconds', 'detail', 'checked_at'}
+dependency_states = {}
+
+warmup_done = False
+warmup_started_at = None
+warmup_seconds = None
+
+def _warm_cosmos_sync():
+    # Reading each container primes the connection, TLS session and the SDK's container properties cache
+    with cosmos_operation('warm_up'):
+        database.database.read()
+        for container in (
+            database.recipes_container, database.generated_recipes_container,
+            database.user_profiles_container, database.recipe_history_container
+        ):
+            container.read()
+
+async def _probe_cosmos() -> Optional[str]:
+    if not database.database:
+        return None
+    await asyncio.to_thread(_warm_cosmos_sync)
+    return "containers read"
+
+async def _probe_redis() -> Optional[str]:
+    if not user_profile.redis_client:
+        return None
+    await user_profile.redis_client.ping()
+    return "ping ok"
+
+async def _probe_llm_pool() -> Optional[str]:
+    if not llm_pool.has_endpoints():
+        return None
+    warmed = await llm_pool.warm_up_pool()
+    return f"{warmed} endpoints connected"
+
+async def _probe_language() -> Optional[str]:
+    # No free probe exists for Azure AI Language; configured is as good as it gets
+    if not ai_integrations.text_analytics_client:
+        return None
+    return "configured"
+
+async def _probe_catalog() -> Optional[str]:
+    catalog = await get_catalog()
+    return f"version {catalog.version}, {len(catalog)} recipes"
+
+PROBES: Dict[str, Callable[[], Awaitable[Optional[str]]]] = {
+    'cosmos': _probe_cosmos,
+    'redis': _probe_redis,
+    'llm_pool': _probe_llm_pool,
+    'language': _probe_language,
+    'catalog': _probe_catalog
+}
+
+async def _run_probe(name: str):
+    started = time.perf_counter()
+    try:
+        detail = await asyncio.wait_for(PROBES[name](), timeout=WARMUP_TIMEOUT_SECONDS)
+        status = 'ready' if detail is not None else 'disabled'
+    except asyncio.TimeoutError:
+        status, detail = 'failed', f"timed out after {WARMUP_TIMEOUT_SECONDS}s"
+    except Exception as e:
+        status, detail = 'failed', str(e)
+
+    if status == 'failed':
+        logger.warning(f"Readiness probe for {name} failed: {detail}")
+    dependency_states[name] = {
+        'status': status,
+        'seconds': round(time.perf_counter() - started, 4),
+        'detail': detail,
+        'checked_at': time.monotonic()
+    }
+    dependency_ready.set(0 if status == 'failed' else 1, dependency=name)
+
+async def warm_up():
+    """Probe every dependency concurrently, opening connection pools and loading the catalog"""
+    global warmup_done, warmup_started_at, warmup_seconds
+
+    warmup_started_at = time.perf_counter()
+    await asyncio.gather(*(_run_probe(name) for name in PROBES))
+    warmup_seconds = time.perf_counter() - warmup_started_at
+    warmup_done = True
+
+    failed = [name for name, state in dependency_states.items() if state['status'] == 'failed']
+    if failed:
+        logger.warning(f"Warm-up finished in {warmup_seconds:.2f}s with failed dependencies: {', '.join(failed)}")
+    else:
+        logger.info(f"Warm-up finished in {warmup_seconds:.2f}s")
+
+async def check_readiness() -> Tuple[bool, Dict[str, Any]]:
+    """
+    Ready once warm-up has finished and no dependency is failing. Failed
+    dependencies are re-probed at most every READINESS_RETRY_SECONDS so a
+    pod recovers without a restart.
+    """
+    if warmup_done:
+        now = time.monotonic()
+        retry = [
+            name for name, state in dependency_states.items()
+            if state['status'] == 'failed' and now - state['checked_at'] >= READINESS_RETRY_SECONDS
+        ]
+        if retry:
+            await asyncio.gather(*(_run_probe(name) for name in retry))
+
+    ready = warmup_done and all(state['status'] != 'failed' for state in dependency_states.values())
+    return ready, {
+        'ready': ready,
+        'warmup': {
+            'done': warmup_done,
+            'seconds': round(warmup_seconds, 4) if warmup_seconds is not None else None
+        },
+        'dependencies': {
+            name: {key: value for key, value in state.items() if key != 'checked_at'}
+            for name, state in dependency_states.items()
+        }
+    }
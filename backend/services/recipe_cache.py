@@ -0,0 +1,124 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import orjson
+
+from services import user_profile
+from services.database import get_recipe_by_id
+from services.metrics import counter, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Read-through cache settings; recipes never change once written
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv('RECIPE_CACHE_MAX_ENTRIES', '2000'))
+LOCAL_CACHE_TTL_SECONDS = int(os.getenv('RECIPE_CACHE_LOCAL_TTL_SECONDS', '3600'))
+REDIS_TTL_SECONDS = int(os.getenv('RECIPE_CACHE_REDIS_TTL_SECONDS', '86400'))
+
+# Cosmos system properties that are not part of the recipe
+SYSTEM_FIELDS = ('_rid', '_self', '_etag', '_attachments', '_ts')
+
+recipe_cache_lookups = counter('recipe_cache_lookups_total', 'Recipe cache lookups by tier that answered')
+
+# recipe_id -> (expires_at, etag, body)
+local_cache = OrderedDict()
+
+# Database fetches in progress, so concurrent misses for one recipe share a read
+inflight_fetches = {}
+
+def _redis_key(recipe_id: str) -> str:
+    return f"recipe:{recipe_id}"
+
+def encode_recipe(recipe: Dict[str, Any]) -> Tuple[str, bytes]:
+    """Serialize a recipe once and derive its strong ETag from the bytes"""
+    document = {key: value for key, value in recipe.items() if key not in SYSTEM_FIELDS}
+    body = orjson.dumps(document, default=str, option=orjson.OPT_SORT_KEYS)
+    return _etag(body), body
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def _remember_locally(recipe_id: str, etag: str, body: bytes):
+    local_cache[recipe_id] = (time.monotonic() + LOCAL_CACHE_TTL_SECONDS, etag, body)
+    local_cache.move_to_end(recipe_id)
+    while len(local_cache) > LOCAL_CACHE_MAX_ENTRIES:
+        local_cache.popitem(last=False)
+
+def _local_lookup(recipe_id: str) -> Optional[Tuple[str, bytes]]:
+    entry = local_cache.get(recipe_id)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        del local_cache[recipe_id]
+        return None
+    local_cache.move_to_end(recipe_id)
+    return entry[1], entry[2]
+
+async def _redis_lookup(recipe_id: str) -> Optional[bytes]:
+    if not user_profile.redis_client:
+        return None
+    try:
+        with stage_timer('redis'):
+            return await user_profile.redis_client.get(_redis_key(recipe_id))
+    except Exception as e:
+        logger.warning(f"Recipe cache Redis lookup failed: {e}")
+        return None
+
+async def _redis_store(recipe_id: str, body: bytes):
+    if not user_profile.redis_client:
+        return
+    try:
+        with stage_timer('redis'):
+            await user_profile.redis_client.setex(_redis_key(recipe_id), REDIS_TTL_SECONDS, body)
+    except Exception as e:
+        logger.warning(f"Recipe cache Redis write failed: {e}")
+
+async def _load(recipe_id: str, user_id: Optional[str]) -> Optional[Tuple[str, bytes]]:
+    body = await _redis_lookup(recipe_id)
+    if body is not None:
+        recipe_cache_lookups.inc(tier='redis')
+        etag = _etag(body)
+        _remember_locally(recipe_id, etag, body)
+        return etag, body
+
+    recipe = await get_recipe_by_id(recipe_id, user_id=user_id)
+    if recipe is None:
+        recipe_cache_lookups.inc(tier='not_found')
+        return None
+    recipe_cache_lookups.inc(tier='database')
+    etag, body = encode_recipe(recipe)
+    _remember_locally(recipe_id, etag, body)
+    await _redis_store(recipe_id, body)
+    return etag, body
+
+async def get_cached_recipe(recipe_id: str, user_id: Optional[str] = None) -> Optional[Tuple[str, bytes]]:
+    """
+    Return (etag, json_body) for a recipe, checking the in-process LRU, then
+    Redis, then Cosmos DB. Misses are not cached so a recipe that is still
+    being written is found on the next request.
+    """
+    cached = _local_lookup(recipe_id)
+    if cached is not None:
+        recipe_cache_lookups.inc(tier='local')
+        return cached
+
+    fetch = inflight_fetches.get(recipe_id)
+    if fetch is None:
+        fetch = asyncio.ensure_future(_load(recipe_id, user_id))
+        inflight_fetches[recipe_id] = fetch
+        fetch.add_done_callback(lambda _: inflight_fetches.pop(recipe_id, None))
+    return await asyncio.shield(fetch)
+
+async def cache_recipe(recipe: Dict[str, Any]):
+    """Prime both tiers with a freshly written recipe, which clients usually fetch next"""
+    etag, body = encode_recipe(recipe)
+    await cache_encoded_recipe(recipe['id'], etag, body)
+
+async def cache_encoded_recipe(recipe_id: str, etag: str, body: bytes):
+    """Prime both tiers with bytes already produced by encode_recipe"""
+    _remember_locally(recipe_id, etag, body)
+    await _redis_store(recipe_id, body)
@@ -0,0 +1,258 @@
+"""
+Per-user recipe history, kept outside the profile document.
+
+Each recipe a user cooks (generates) or saves is appended to the
+recipe_history container as one small document in the user's partition.
+Entries are only ever created, never rewritten. Redis keeps each user's
+HISTORY_CACHE_LIMIT most recent entries per kind in a sorted set scored by
+time for GET /api/user/{user_id}/history. get_history fills it from Cosmos
+on a miss; appends only add to a set that is already there, so a set is
+never mistaken for the full history.
+
+The profile keeps a count per kind and the PROFILE_RECENT_LIMIT most recent
+IDs, which is all request-time personalization reads. Generated recipes are
+unique to one user, so cooked entries also record the catalog recipe each
+one was based on (base_recipe_id), and the profile keeps the most recent of
+those for collaborative filtering. Profile reads therefore
+stay the same size however long the history grows.
+
+Profiles written before the store existed carry their history inline; the
+backfill command copies it into the store and trims the profile:
+
+    python -m services.recipe_history backfill --max-ru-per-second 400
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Tuple
+
+from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceExistsError
+
+from services import database, user_profile
+from services.metrics import counter, stage_timer
+from services.cosmos_metrics import cosmos_operation, record_response
+from services.provisioning import RequestUnitThrottle
+
+logger = logging.getLogger(__name__)
+
+# Most recent IDs per kind kept on the profile for personalization
+PROFILE_RECENT_LIMIT = int(os.getenv('PROFILE_RECENT_LIMIT', '20'))
+
+# Most recent entries per kind and user kept in Redis
+HISTORY_CACHE_LIMIT = int(os.getenv('HISTORY_CACHE_LIMIT', '200'))
+
+# Idle users' Redis history expires after this
+HISTORY_CACHE_TTL_SECONDS = int(os.getenv('HISTORY_CACHE_TTL_SECONDS', '604800'))
+
+COOKED = 'cooked'
+SAVED = 'saved'
+
+# Most recent catalog recipes the user's generations were based on, newest first
+BASE_RECIPES_FIELD = 'cooked_base_recipes'
+
+# kind -> (profile list field, profile count field)
+PROFILE_FIELDS = {
+    COOKED: ('cooking_history', 'cooking_history_count'),
+    SAVED: ('saved_recipes', 'saved_recipes_count')
+}
+
+history_appends_total = counter('recipe_history_appends_total', 'Recipe history appends by kind and result')
+history_reads_total = counter('recipe_history_reads_total', 'Recipe history reads by source')
+
+def _cache_key(user_id: str, kind: str) -> str:
+    return f"history:{kind}:{user_id}"
+
+def history_entry(user_id: str, kind: str, recipe_id: str, created_at: str = None, base_recipe_id: str = None) -> Dict[str, Any]:
+    entry = {
+        # One entry per user, kind and recipe, so a repeated append is rejected rather than duplicated
+        'id': f"{user_id}:{kind}:{recipe_id}",
+        'user_id': user_id,
+        'kind': kind,
+        'recipe_id': recipe_id,
+        'type': 'history_entry',
+        'created_at': created_at or datetime.utcnow().isoformat()
+    }
+    if base_recipe_id:
+        entry['base_recipe_id'] = base_recipe_id
+    return entry
+
+def recent_ids(kind: str, current: List[str], recipe_id: str) -> List[str]:
+    """The profile's recent list with recipe_id added: cooking history is newest first, saved recipes oldest first"""
+    others = [existing for existing in current if existing != recipe_id]
+    if kind == COOKED:
+        return ([recipe_id] + others)[:PROFILE_RECENT_LIMIT]
+    return (others + [recipe_id])[-PROFILE_RECENT_LIMIT:]
+
+async def append_history(user_id: str, kind: str, recipe_id: str, base_recipe_id: str = None) -> bool:
+    """Record one history entry; returns False if the user already has it"""
+    entry = history_entry(user_id, kind, recipe_id, base_recipe_id=base_recipe_id)
+    added = True
+    if database.recipe_history_container:
+        try:
+            with stage_timer('cosmos_write'), cosmos_operation('append_history'):
+                database.recipe_history_container.create_item(entry)
+        except CosmosResourceExistsError:
+            added = False
+    history_appends_total.inc(kind=kind, result='added' if added else 'exists')
+
+    if user_profile.redis_client:
+        try:
+            key = _cache_key(user_id, kind)
+            with stage_timer('redis'):
+                # A missing set is filled from Cosmos by the next read, which includes this entry
+                if await user_profile.redis_client.exists(key):
+                    pipe = user_profile.redis_client.pipeline(transaction=False)
+                    pipe.zadd(key, {recipe_id: time.time()})
+                    pipe.zremrangebyrank(key, 0, -HISTORY_CACHE_LIMIT - 1)
+                    pipe.expire(key, HISTORY_CACHE_TTL_SECONDS)
+                    await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to cache history entry for {user_id}: {e}")
+    return added
+
+def _read_history_page(user_id: str, kind: str, limit: int) -> List[Dict[str, Any]]:
+    query = (
+        "SELECT c.recipe_id, c.created_at FROM c "
+        "WHERE c.user_id = @user_id AND c.kind = @kind ORDER BY c.created_at DESC"
+    )
+    with stage_timer('cosmos_read'), cosmos_operation('read_history'):
+        pages = database.recipe_history_container.query_items(
+            query,
+            parameters=[{"name": "@user_id", "value": user_id}, {"name": "@kind", "value": kind}],
+            partition_key=user_id,
+            max_item_count=limit
+        ).by_page()
+        return list(next(pages, []))[:limit]
+
+async def get_history(user_id: str, kind: str, limit: int = 50) -> List[str]:
+    """A user's most recent recipe IDs of one kind, newest first; at most HISTORY_CACHE_LIMIT"""
+    limit = min(limit, HISTORY_CACHE_LIMIT)
+    key = _cache_key(user_id, kind)
+    if user_profile.redis_client:
+        try:
+            with stage_timer('redis'):
+                pipe = user_profile.redis_client.pipeline(transaction=False)
+                pipe.exists(key)
+                pipe.zrevrange(key, 0, limit - 1)
+                exists, members = await pipe.execute()
+            if exists:
+                history_reads_total.inc(source='redis')
+                return [member.decode('utf-8') for member in members]
+        except Exception as e:
+            logger.warning(f"History cache read failed for {user_id}: {e}")
+
+    if not database.recipe_history_container:
+        history_reads_total.inc(source='none')
+        return []
+    entries = _read_history_page(user_id, kind, HISTORY_CACHE_LIMIT)
+    history_reads_total.inc(source='cosmos')
+
+    if entries and user_profile.redis_client:
+        try:
+            scores = {
+                entry['recipe_id']: datetime.fromisoformat(entry['created_at']).replace(tzinfo=timezone.utc).timestamp()
+                for entry in entries
+            }
+            with stage_timer('redis'):
+                pipe = user_profile.redis_client.pipeline(transaction=False)
+                pipe.zadd(key, scores)
+                pipe.expire(key, HISTORY_CACHE_TTL_SECONDS)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to refill history cache for {user_id}: {e}")
+    return [entry['recipe_id'] for entry in entries[:limit]]
+
+# ---------------------------------------------------------------------------
+# Backfill from profiles with inline history
+# ---------------------------------------------------------------------------
+
+def backfill_profile(profiles, history, profile: Dict[str, Any], throttle: RequestUnitThrottle) -> Tuple[int, bool]:
+    """Copy one profile's inline history into the store and trim it; returns (entries added, profile trimmed)"""
+    user_id = profile.get('user_id') or profile['id']
+    base_time = datetime.fromisoformat(profile['updated_at']) if profile.get('updated_at') else datetime.utcnow()
+    added = 0
+    operations = []
+    for kind, (field, count_field) in PROFILE_FIELDS.items():
+        ids = [recipe_id for recipe_id in profile.get(field) or [] if isinstance(recipe_id, str)]
+        # Newest first, spaced a second apart so the stored order matches the profile's
+        newest_first = ids if kind == COOKED else list(reversed(ids))
+        for offset, recipe_id in enumerate(newest_first):
+            created_at = (base_time - timedelta(seconds=offset)).isoformat()
+            try:
+                with cosmos_operation('backfill_history') as call:
+                    history.create_item(history_entry(user_id, kind, recipe_id, created_at))
+                added += 1
+            except CosmosResourceExistsError:
+                pass
+            throttle.charge(call.request_charge)
+
+        recent = newest_first[:PROFILE_RECENT_LIMIT]
+        recent = recent if kind == COOKED else list(reversed(recent))
+        if len(ids) > len(recent) or count_field not in profile:
+            operations.append({'op': 'set', 'path': f'/{field}', 'value': recent})
+            operations.append({'op': 'set', 'path': f'/{count_field}', 'value': max(profile.get(count_field) or 0, len(ids))})
+
+    if not operations:
+        return added, False
+    with cosmos_operation('backfill_user_profile') as call:
+        profiles.patch_item(profile['id'], user_id, operations)
+    throttle.charge(call.request_charge)
+    return added, True
+
+def backfill(database_client, max_ru_per_second: float) -> Dict[str, Any]:
+    profiles = database_client.get_container_client('user_profiles')
+    history = database_client.get_container_client('recipe_history')
+    throttle = RequestUnitThrottle(max_ru_per_second)
+    result = {'profiles': 0, 'entries_added': 0, 'profiles_trimmed': 0, 'failed': 0}
+    started = time.perf_counter()
+
+    pages = profiles.query_items("SELECT * FROM c", enable_cross_partition_query=True, max_item_count=100).by_page()
+    while True:
+        with cosmos_operation('backfill_read_profiles') as call:
+            items = list(next(pages, []))
+        throttle.charge(call.request_charge)
+        if not items:
+            break
+        for profile in items:
+            result['profiles'] += 1
+            try:
+                added, trimmed = backfill_profile(profiles, history, profile, throttle)
+            except CosmosHttpResponseError as e:
+                result['failed'] += 1
+                logger.error(f"Failed to backfill profile {profile.get('id')}: {e}")
+                continue
+            result['entries_added'] += added
+            result['profiles_trimmed'] += trimmed
+
+    result['request_units'] = round(throttle.consumed, 2)
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-user recipe history store")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = commands.add_parser('backfill', help="Move inline profile history into the history store")
+    backfill_parser.add_argument('--max-ru-per-second', type=float, default=400, help="RU budget for reads and writes (0 disables)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('azure').setLevel(logging.WARNING)
+
+    connection_string = os.getenv('COSMOS_DB_CONNECTION_STRING')
+    if not connection_string:
+        raise SystemExit("COSMOS_DB_CONNECTION_STRING is not set")
+    client = CosmosClient.from_connection_string(connection_string, raw_response_hook=record_response)
+    database_client = client.get_database_client(os.getenv('COSMOS_DB_NAME', 'yippee-recipes'))
+
+    result = backfill(database_client, args.max_ru_per_second)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result['failed'] else 0)
+
+if __name__ == '__main__':
+    main()
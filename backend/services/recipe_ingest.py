@@ -0,0 +1,210 @@
+"""
+Bulk ingest of base recipes into the recipes container.
+
+Reads NDJSON (one recipe object per line) or CSV (tags and ingredients
+separated by |), validates each recipe, computes the fields scoring derives
+from it (derive_recipe_fields) and stores them with the recipe, so neither
+request handling nor catalog snapshot builds derive them again. Upserts run
+on --concurrency threads, all charged to one request-unit budget; the SDK
+retries throttled (429) writes itself and those retries are counted.
+
+    python -m services.recipe_ingest load recipes.ndjson
+    python -m services.recipe_ingest load recipes.csv --concurrency 32 --max-ru-per-second 2000
+    python -m services.recipe_ingest load recipes.ndjson --dry-run --errors rejected.ndjson
+"""
+import os
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Iterator, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.exceptions import AzureError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.cosmos import CosmosClient
+from azure.cosmos.exceptions import CosmosHttpResponseError
+from pydantic import ValidationError
+
+from models.recipe import BaseRecipe
+from services.database import BASE_RECIPE_ID_PREFIX
+from services.recommendation import derive_recipe_fields
+from services.provisioning import RequestUnitThrottle
+from services.cosmos_metrics import cosmos_operation, record_response
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = ('Easy', 'Medium', 'Hard')
+
+# Separator for list-valued CSV columns
+CSV_LIST_SEPARATOR = '|'
+CSV_LIST_FIELDS = ('tags', 'ingredients')
+
+def read_ndjson(path: str) -> Iterator[Tuple[int, Any]]:
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"invalid JSON: {e}")
+
+def read_csv(path: str) -> Iterator[Tuple[int, Any]]:
+    with open(path, encoding='utf-8', newline='') as f:
+        # Line 1 is the header
+        for line_number, row in enumerate(csv.DictReader(f), start=2):
+            record = {field: value for field, value in row.items() if field and value not in (None, '')}
+            for field in CSV_LIST_FIELDS:
+                if field in record:
+                    record[field] = record[field].split(CSV_LIST_SEPARATOR)
+            yield line_number, record
+
+def prepare_recipe(record: Any) -> Dict[str, Any]:
+    """Validate one input record and return the document to store; raises ValueError if it is unusable"""
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+    try:
+        recipe = BaseRecipe(**record)
+    except ValidationError as e:
+        raise ValueError('; '.join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+
+    document = recipe.dict(exclude_none=True)
+    for field in ('id', 'title', 'cuisine', 'difficulty'):
+        document[field] = ' '.join(document[field].split())
+    document['tags'] = [' '.join(tag.split()) for tag in document['tags'] if tag.strip()]
+    document['ingredients'] = [' '.join(ingredient.split()) for ingredient in document['ingredients'] if ingredient.strip()]
+    if not document['id'].startswith(BASE_RECIPE_ID_PREFIX):
+        raise ValueError(f"id: must start with {BASE_RECIPE_ID_PREFIX}")
+    if document['difficulty'] not in DIFFICULTIES:
+        raise ValueError(f"difficulty: must be one of {', '.join(DIFFICULTIES)}")
+    if not document['ingredients']:
+        raise ValueError("ingredients: no non-empty ingredient")
+
+    document['type'] = 'base_recipe'
+    document['derived'] = derive_recipe_fields(document)
+    document['ingested_at'] = datetime.utcnow().isoformat()
+    return document
+
+def _connect_recipes_container(concurrency: int):
+    connection_string = os.getenv('COSMOS_DB_CONNECTION_STRING')
+    if not connection_string:
+        raise SystemExit("COSMOS_DB_CONNECTION_STRING is not set")
+    # The default pool keeps 10 connections, fewer than the upserts in flight
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(concurrency, 10))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    client = CosmosClient.from_connection_string(
+        connection_string,
+        transport=RequestsTransport(session=session, session_owner=False),
+        raw_response_hook=record_response
+    )
+    return client.get_database_client(os.getenv('COSMOS_DB_NAME', 'yippee-recipes')).get_container_client('recipes')
+
+def ingest(
+    records: Iterator[Tuple[int, Any]],
+    container=None,
+    concurrency: int = 16,
+    max_ru_per_second: float = 400,
+    errors_file=None
+) -> Dict[str, Any]:
+    """
+    Validate and upsert every record; with container=None only validates.
+    Invalid records are skipped and written to errors_file as NDJSON.
+    """
+    throttle = RequestUnitThrottle(max_ru_per_second)
+    stats = {'read': 0, 'invalid': 0, 'upserted': 0, 'failed': 0, 'throttled_retries': 0}
+    started = time.perf_counter()
+
+    def reject(line_number: int, error: str, record: Any = None):
+        stats['invalid'] += 1
+        logger.warning(f"Line {line_number}: {error}")
+        if errors_file:
+            errors_file.write(json.dumps({'line': line_number, 'error': error, 'record': record}, default=str) + '\n')
+
+    def upsert(document: Dict[str, Any]) -> Tuple[str, int]:
+        with cosmos_operation('ingest_base_recipe') as call:
+            container.upsert_item(document)
+        throttle.charge(call.request_charge)
+        return document['id'], call.throttled
+
+    def collect(done):
+        for future in done:
+            try:
+                _, throttled = future.result()
+                stats['upserted'] += 1
+                stats['throttled_retries'] += throttled
+            except CosmosHttpResponseError as e:
+                stats['failed'] += 1
+                logger.error(f"Upsert failed: {e.status_code} {e.message}")
+            except AzureError as e:
+                # A transport failure, such as a reset connection, loses this recipe rather than the ingest
+                stats['failed'] += 1
+                logger.error(f"Upsert failed: {e}")
+            if stats['upserted'] and stats['upserted'] % 1000 == 0:
+                logger.info(f"Upserted {stats['upserted']} recipes ({throttle.consumed:.0f} RU)")
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        pending = set()
+        for line_number, record in records:
+            stats['read'] += 1
+            if isinstance(record, Exception):
+                reject(line_number, str(record))
+                continue
+            try:
+                document = prepare_recipe(record)
+            except ValueError as e:
+                reject(line_number, str(e), record)
+                continue
+            if container is None:
+                continue
+            # Bounded so a large file is streamed rather than queued whole
+            if len(pending) >= concurrency * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(upsert, document))
+        collect(wait(pending)[0])
+
+    stats['valid'] = stats['read'] - stats['invalid']
+    stats['request_units'] = round(throttle.consumed, 2)
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    if stats['upserted'] and stats['seconds']:
+        stats['recipes_per_second'] = round(stats['upserted'] / stats['seconds'], 1)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load base recipes with precomputed scoring fields")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('load', help="Validate recipes from a file and upsert them")
+    load.add_argument('path')
+    load.add_argument('--format', choices=('ndjson', 'csv'), help="Defaults to csv for .csv files, ndjson otherwise")
+    load.add_argument('--concurrency', type=int, default=16, help="Upserts in flight")
+    load.add_argument('--max-ru-per-second', type=float, default=400, help="RU budget for all upserts (0 disables)")
+    load.add_argument('--dry-run', action='store_true', help="Validate and derive without writing")
+    load.add_argument('--errors', help="Write rejected records to this NDJSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('azure').setLevel(logging.WARNING)
+
+    file_format = args.format or ('csv' if args.path.lower().endswith('.csv') else 'ndjson')
+    records = read_csv(args.path) if file_format == 'csv' else read_ndjson(args.path)
+    container = None if args.dry_run else _connect_recipes_container(args.concurrency)
+    errors_file = open(args.errors, 'w', encoding='utf-8') if args.errors else None
+    try:
+        result = ingest(records, container, args.concurrency, args.max_ru_per_second, errors_file)
+    finally:
+        if errors_file:
+            errors_file.close()
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result['invalid'] or result['failed'] else 0)
+
+if __name__ == '__main__':
+    main()
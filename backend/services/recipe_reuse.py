@@ -0,0 +1,190 @@
+"""
+Reuse of stored generated recipes for near-identical requests.
+
+When a recipe is generated, the request's preferences, dietary restrictions
+and available ingredients are reduced to a feature set and a MinHash
+signature. The signature is split into LSH bands, and the recipe id is
+pushed onto a short Redis list per band. A later request looks up its own
+bands, compares the feature sets of the candidates it finds, and reuses the
+closest one when it:
+
+- has the same cuisine, spice level and maximum cooking time
+- was generated under at least the requested dietary restrictions
+- contains none of the requesting user's disliked ingredients
+- reaches a Jaccard similarity of REUSE_SIMILARITY_THRESHOLD
+- belongs to another user
+
+With MINHASH_PERMUTATIONS = LSH_BANDS x 4, a pair at Jaccard 0.8 shares a
+band with probability above 0.999, and a pair at 0.3 with about 0.12.
+"""
+import os
+import random
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+import orjson
+
+from services import user_profile
+from services.recipe_cache import get_cached_recipe
+from services.metrics import counter, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Serve a stored recipe instead of generating when a near-identical request produced one
+REUSE_ENABLED = os.getenv('RECIPE_REUSE_ENABLED', 'true').lower() == 'true'
+
+# Minimum Jaccard similarity between request feature sets for a reuse
+REUSE_SIMILARITY_THRESHOLD = float(os.getenv('RECIPE_REUSE_SIMILARITY_THRESHOLD', '0.8'))
+
+# How long a generated recipe stays reusable
+REUSE_TTL_SECONDS = int(os.getenv('RECIPE_REUSE_TTL_SECONDS', '604800'))
+
+# Most recent recipes kept per LSH bucket, which bounds the candidates checked per request
+REUSE_BUCKET_SIZE = int(os.getenv('RECIPE_REUSE_BUCKET_SIZE', '20'))
+
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+ROWS_PER_BAND = MINHASH_PERMUTATIONS // LSH_BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Fixed so signatures computed by every worker and every release agree
+_permutation_rng = random.Random(20240611)
+PERMUTATIONS = [
+    (_permutation_rng.randrange(1, MERSENNE_PRIME), _permutation_rng.randrange(0, MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+reuse_lookups = counter('recipe_reuse_lookups_total', 'Near-duplicate recipe lookups before generation by result')
+
+def preference_features(preferences) -> List[str]:
+    """The request as a set of tokens; ingredients are normalized the way users type them"""
+    features = {f"cuisine:{preferences.cuisine.value.lower()}", f"spice:{preferences.spice_level.value.lower()}",
+                f"time:{preferences.max_cooking_time.value.lower()}"}
+    features.update(f"meal:{meal_type.value.lower()}" for meal_type in preferences.meal_type)
+    features.update(f"diet:{restriction.value.lower()}" for restriction in preferences.dietary_restrictions)
+    features.update(f"ingredient:{' '.join(ingredient.lower().split())}" for ingredient in preferences.available_ingredients
+                    if ingredient.strip())
+    return sorted(features)
+
+def minhash(features: List[str]) -> List[int]:
+    hashed = [int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little') for feature in features]
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashed) for a, b in PERMUTATIONS]
+
+def band_keys(signature: List[int]) -> List[str]:
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(','.join(map(str, rows)).encode('ascii'), digest_size=8).hexdigest()
+        keys.append(f"reuse:band:{band}:{digest}")
+    return keys
+
+def jaccard(first: List[str], second: List[str]) -> float:
+    first, second = set(first), set(second)
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+def contains_disliked(ingredients: List[str], disliked_ingredients: List[str]) -> bool:
+    """Lowercased ingredient names against lowercased dislikes, with the containment rule of recommendation scoring"""
+    return any(
+        recipe_ing in disliked_ing or disliked_ing in recipe_ing
+        for recipe_ing in ingredients
+        for disliked_ing in disliked_ingredients
+    )
+
+def _qualifies(candidate: Dict[str, Any], preferences, user_id: Optional[str], disliked_ingredients: List[str]) -> bool:
+    if user_id and candidate.get('user_id') == user_id:
+        # The user asked again; they want something new
+        return False
+    # The stored recipe is copied as it is, so these must match exactly rather than count towards similarity
+    if (
+        candidate.get('cuisine') != preferences.cuisine.value
+        or candidate.get('spice_level') != preferences.spice_level.value
+        or candidate.get('max_cooking_time') != preferences.max_cooking_time.value
+    ):
+        return False
+    requested = {restriction.value for restriction in preferences.dietary_restrictions}
+    if not requested.issubset(candidate.get('dietary_restrictions', [])):
+        return False
+    # It was prompted with another user's profile
+    return not contains_disliked(candidate.get('ingredients', []), disliked_ingredients)
+
+async def find_reusable_recipe(
+    preferences,
+    user_id: Optional[str],
+    disliked_ingredients: Optional[List[str]] = None
+) -> Optional[Dict[str, Any]]:
+    """A stored recipe generated for a near-identical request, or None to generate a new one"""
+    if not REUSE_ENABLED or not user_profile.redis_client:
+        return None
+
+    try:
+        features = preference_features(preferences)
+        keys = band_keys(minhash(features))
+        with stage_timer('redis'):
+            async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.lrange(key, 0, -1)
+                buckets = await pipe.execute()
+        candidate_ids = list(dict.fromkeys(recipe_id.decode('utf-8') for bucket in buckets for recipe_id in bucket))
+        if not candidate_ids:
+            reuse_lookups.inc(result='no_candidates')
+            return None
+
+        with stage_timer('redis'):
+            metadata = await user_profile.redis_client.mget([f"reuse:meta:{recipe_id}" for recipe_id in candidate_ids])
+        disliked = [ingredient.lower() for ingredient in disliked_ingredients or [] if ingredient.strip()]
+        best: Tuple[float, Optional[str], Optional[Dict[str, Any]]] = (0.0, None, None)
+        for recipe_id, raw in zip(candidate_ids, metadata):
+            if not raw:
+                continue
+            candidate = orjson.loads(raw)
+            if not _qualifies(candidate, preferences, user_id, disliked):
+                continue
+            similarity = jaccard(features, candidate['features'])
+            if similarity > best[0]:
+                best = (similarity, recipe_id, candidate)
+
+        similarity, recipe_id, candidate = best
+        if recipe_id is None or similarity < REUSE_SIMILARITY_THRESHOLD:
+            reuse_lookups.inc(result='below_threshold')
+            return None
+
+        cached = await get_cached_recipe(recipe_id, user_id=candidate.get('user_id'))
+        if cached is None:
+            reuse_lookups.inc(result='missing')
+            return None
+        reuse_lookups.inc(result='hit')
+        logger.info(f"Reusing recipe {recipe_id} at similarity {similarity:.2f}")
+        return orjson.loads(cached[1])
+    except Exception as e:
+        reuse_lookups.inc(result='error')
+        logger.warning(f"Recipe reuse lookup failed: {e}")
+        return None
+
+async def index_for_reuse(recipe_document: Dict[str, Any], preferences):
+    """Record a freshly generated recipe under its request's LSH bands"""
+    if not REUSE_ENABLED or not user_profile.redis_client:
+        return
+
+    try:
+        features = preference_features(preferences)
+        recipe_id = recipe_document['id']
+        meta = orjson.dumps({
+            'features': features,
+            'user_id': recipe_document.get('user_id'),
+            'cuisine': preferences.cuisine.value,
+            'spice_level': preferences.spice_level.value,
+            'max_cooking_time': preferences.max_cooking_time.value,
+            'dietary_restrictions': [restriction.value for restriction in preferences.dietary_restrictions],
+            'ingredients': [ingredient['name'].lower() for ingredient in recipe_document.get('ingredients', [])]
+        })
+        with stage_timer('redis'):
+            async with user_profile.redis_client.pipeline(transaction=False) as pipe:
+                pipe.set(f"reuse:meta:{recipe_id}", meta, ex=REUSE_TTL_SECONDS)
+                for key in band_keys(minhash(features)):
+                    pipe.lpush(key, recipe_id)
+                    pipe.ltrim(key, 0, REUSE_BUCKET_SIZE - 1)
+                    pipe.expire(key, REUSE_TTL_SECONDS)
+                await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to index recipe {recipe_document.get('id')} for reuse: {e}")
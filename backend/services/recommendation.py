@@ -1,9 +1,20 @@
 import logging
 from typing import List, Dict, Any, Optional
-from models.recipe import UserPreferences, GeneratedRecipe
+
+import numpy as np
+
+from models.recipe import UserPreferences, GeneratedRecipe, DietaryRestriction, CookingTime
+from services.metrics import stage_timer
+from services.collaborative import personalized_boosts
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever derive_recipe_fields changes, so derivations stored on base recipes are recomputed
+DERIVATION_VERSION = 1
+
+# Upper bound in minutes of each CookingTime bucket below the open-ended one
+COOKING_TIME_BUCKETS = ((15, CookingTime.QUICK_15), (30, CookingTime.QUICK_30), (45, CookingTime.MEDIUM_45))
+
 async def get_recommended_recipes(
     user_preferences: UserPreferences,
     dietary_restrictions: List[str],
@@ -14,45 +25,211 @@ async def get_recommended_recipes(
     """
     Get recipe recommendations based on user preferences and available ingredients.
     """
+    top_recipes = select_recommendations(
+        user_preferences=user_preferences,
+        dietary_restrictions=dietary_restrictions,
+        available_ingredients=available_ingredients,
+        user_profile=user_profile,
+        all_base_recipes=all_base_recipes,
+        boosts=await personalized_boosts(user_profile)
+    )
+    
+    # Convert to GeneratedRecipe objects
+    recommendations = []
+    for recipe in top_recipes:
+        try:
+            generated_recipe = convert_to_generated_recipe(recipe)
+            recommendations.append(generated_recipe)
+        except Exception as e:
+            logger.warning(f"Failed to convert recipe {recipe.get('id')}: {e}")
+            continue
+    
+    return recommendations
+
+def select_recommendations(
+    user_preferences: UserPreferences,
+    dietary_restrictions: List[str],
+    available_ingredients: List[str],
+    user_profile: Optional[Dict[str, Any]],
+    all_base_recipes: List[Dict[str, Any]],
+    boosts: Optional[Dict[str, float]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Score the catalog and return the top base recipes, best first. `boosts`
+    maps recipe ids to collaborative filtering bonuses added to recipes that
+    are not disqualified.
+    """
     try:
         logger.info("Generating recipe recommendations")
         
         # Score each base recipe
         scored_recipes = []
         
-        for recipe in all_base_recipes:
-            score = calculate_recipe_score(
-                recipe=recipe,
-                user_preferences=user_preferences,
-                dietary_restrictions=dietary_restrictions,
-                available_ingredients=available_ingredients,
-                user_profile=user_profile
-            )
+        with stage_timer('scoring'):
+            for recipe in all_base_recipes:
+                score = calculate_recipe_score(
+                    recipe=recipe,
+                    user_preferences=user_preferences,
+                    dietary_restrictions=dietary_restrictions,
+                    available_ingredients=available_ingredients,
+                    user_profile=user_profile
+                )
+                
+                if score > 0:  # Only include recipes with positive scores
+                    recipe_id = recipe.get('id')
+                    if boosts and isinstance(recipe_id, str) and recipe_id in boosts:
+                        score += boosts[recipe_id]
+                    scored_recipes.append((recipe, score))
             
-            if score > 0:  # Only include recipes with positive scores
-                scored_recipes.append((recipe, score))
-        
-        # Sort by score (highest first) and take top 3-5
-        scored_recipes.sort(key=lambda x: x[1], reverse=True)
-        top_recipes = scored_recipes[:5]
+            # Sort by score (highest first) and take top 3-5
+            scored_recipes.sort(key=lambda x: x[1], reverse=True)
+            top_recipes = [recipe for recipe, score in scored_recipes[:5]]
         
-        # Convert to GeneratedRecipe objects
-        recommendations = []
-        for recipe, score in top_recipes:
-            try:
-                generated_recipe = convert_to_generated_recipe(recipe)
-                recommendations.append(generated_recipe)
-            except Exception as e:
-                logger.warning(f"Failed to convert recipe {recipe.get('id')}: {e}")
-                continue
-        
-        logger.info(f"Generated {len(recommendations)} recommendations")
-        return recommendations
+        logger.info(f"Generated {len(top_recipes)} recommendations")
+        return top_recipes
         
     except Exception as e:
         logger.error(f"Error generating recommendations: {e}")
         return []
 
+def select_from_catalog(
+    columns,
+    user_preferences: UserPreferences,
+    dietary_restrictions: List[str],
+    available_ingredients: List[str],
+    user_profile: Optional[Dict[str, Any]],
+    limit: int = 5,
+    boosts: Optional[Dict[str, float]] = None
+) -> List[int]:
+    """
+    Columnar counterpart of select_recommendations over a CatalogColumns
+    snapshot. Returns recipe indexes, best first, in the same order
+    select_recommendations would return the recipes.
+    """
+    try:
+        with stage_timer('scoring'):
+            scores = score_catalog(columns, user_preferences, dietary_restrictions, available_ingredients, user_profile)
+            for recipe_id, boost in (boosts or {}).items():
+                index = columns.index_of(recipe_id)
+                if index is not None and scores[index] > 0:
+                    scores[index] += boost
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > limit:
+                # Keep everything tied with the limit-th best so ties resolve in catalog order
+                threshold = np.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+                candidates = candidates[scores[candidates] >= threshold]
+            ranked = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [int(index) for index in ranked[:limit]]
+    except Exception as e:
+        logger.error(f"Error generating recommendations: {e}")
+        return []
+
+def _per_recipe_any(columns, prefix: str, vocabulary_hits: np.ndarray) -> np.ndarray:
+    """Whether any of each recipe's tags/ingredients is a hit, from per-vocabulary hits"""
+    return _per_recipe_count(columns, prefix, vocabulary_hits) > 0
+
+def _per_recipe_count(columns, prefix: str, vocabulary_hits: np.ndarray) -> np.ndarray:
+    offsets = getattr(columns, f"{prefix}_offsets")
+    codes = getattr(columns, f"{prefix}_codes")
+    hits = vocabulary_hits[codes] if len(vocabulary_hits) else np.zeros(len(codes), dtype=bool)
+    running = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(hits, out=running[1:])
+    return running[offsets[1:]] - running[offsets[:-1]]
+
+def _vocabulary_lookup(vocabulary: List[str], values: List[float]) -> np.ndarray:
+    # Rows of malformed recipes carry code 0 even when a vocabulary is empty
+    return np.array(values if vocabulary else [0.0], dtype=np.float64)
+
+def score_catalog(
+    columns,
+    user_preferences: UserPreferences,
+    dietary_restrictions: List[str],
+    available_ingredients: List[str],
+    user_profile: Optional[Dict[str, Any]]
+) -> np.ndarray:
+    """
+    calculate_recipe_score for every recipe in a CatalogColumns snapshot at
+    once. Components are added in the same order as calculate_recipe_score,
+    so each score is bit-for-bit identical to the scalar result.
+    """
+    from services.catalog_store import SPICE_LEVELS, RESTRICTION_BITS, HAS_ID
+
+    # 1. Cuisine preference match
+    user_cuisine = user_preferences.cuisine.value.lower()
+    cuisine_vocab = columns.lowered_vocabulary('cuisine_vocab')
+    cuisine_points = _vocabulary_lookup(cuisine_vocab, [
+        0.3 if cuisine == user_cuisine else 0.15 if cuisine in user_cuisine or user_cuisine in cuisine else 0.0
+        for cuisine in cuisine_vocab
+    ])
+    score = 0.0 + cuisine_points[columns.cuisine]
+    
+    # 2. Meal type preference match
+    user_meal_types = [mt.value.lower() for mt in user_preferences.meal_type]
+    tag_vocab = columns.lowered_vocabulary('tag_vocab')
+    meal_hits = np.array([any(meal_type in tag for meal_type in user_meal_types) for tag in tag_vocab], dtype=bool)
+    score = score + np.where(_per_recipe_any(columns, 'tag', meal_hits), 0.1, 0.0)
+    
+    # 3. Cooking time preference match
+    user_max_time = parse_cooking_time(user_preferences.max_cooking_time.value)
+    cooking_time = columns.cooking_time
+    score = score + np.where(cooking_time <= user_max_time, 0.15, np.where(cooking_time <= user_max_time + 15, 0.075, 0.0))
+    
+    # 4. Ingredient availability match
+    ingredient_vocab = columns.lowered_vocabulary('ingredient_vocab')
+    available_ingredients_lower = [ing.lower() for ing in available_ingredients]
+    available_hits = np.array([
+        any(ing in avail_ing or avail_ing in ing for avail_ing in available_ingredients_lower)
+        for ing in ingredient_vocab
+    ], dtype=bool)
+    matching = _per_recipe_count(columns, 'ingredient', available_hits)
+    ingredient_counts = np.diff(columns.ingredient_offsets)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ingredient_points = np.where(ingredient_counts > 0, 0.25 * (matching / ingredient_counts), 0.0)
+    score = score + ingredient_points
+    
+    # 5. Dietary restrictions compliance
+    restriction_bits = 0
+    for restriction in dietary_restrictions:
+        restriction_bits |= RESTRICTION_BITS.get(restriction.lower(), 0)
+    disqualified = (columns.violates & restriction_bits) != 0
+    score = score + 0.2
+    
+    # 6. User profile preferences
+    if user_profile:
+        saved_recipes = user_profile.get('saved_recipes', [])
+        disliked_ingredients = [ing.lower() for ing in user_profile.get('disliked_ingredients', [])]
+        disliked_hits = np.array([
+            any(ing in disliked_ing or disliked_ing in ing for disliked_ing in disliked_ingredients)
+            for ing in ingredient_vocab
+        ], dtype=bool)
+        disqualified |= _per_recipe_any(columns, 'ingredient', disliked_hits)
+        
+        saved = np.zeros(len(columns), dtype=bool)
+        for recipe_id in saved_recipes:
+            index = columns.index_of(recipe_id) if isinstance(recipe_id, str) else None
+            if index is not None:
+                saved[index] = True
+        if None in saved_recipes:
+            saved |= (columns.present & HAS_ID) == 0
+        score = score + np.where(saved, 0.1, 0.0)
+    
+    # 7. Spice level preference
+    user_spice_level = user_preferences.spice_level.value.lower()
+    spice_points = np.array([
+        0.1 if level == user_spice_level else 0.05 if spice_levels_compatible(level, user_spice_level) else 0.0
+        for level in SPICE_LEVELS
+    ])
+    score = score + spice_points[columns.spice]
+    
+    # 8. Difficulty level bonus
+    difficulty_vocab = columns.lowered_vocabulary('difficulty_vocab')
+    easy_points = _vocabulary_lookup(difficulty_vocab, [0.05 if value == 'easy' else 0.0 for value in difficulty_vocab])
+    score = score + easy_points[columns.difficulty]
+    
+    disqualified |= columns.valid == 0
+    score[disqualified] = 0.0
+    return score
+
 def calculate_recipe_score(
     recipe: Dict[str, Any],
     user_preferences: UserPreferences,
@@ -93,7 +270,8 @@ def calculate_recipe_score(
             score += 0.075
         
         # 4. Ingredient availability match (weight: 0.25)
-        recipe_ingredients = [ing.lower() for ing in recipe.get('ingredients', [])]
+        derived = stored_derivation(recipe)
+        recipe_ingredients = derived['ingredients'] if derived else [ing.lower() for ing in recipe.get('ingredients', [])]
         available_ingredients_lower = [ing.lower() for ing in available_ingredients]
         
         matching_ingredients = 0
@@ -108,7 +286,8 @@ def calculate_recipe_score(
             score += 0.25 * ingredient_match_ratio
         
         # 5. Dietary restrictions compliance (weight: 0.2)
-        if not violates_dietary_restrictions(recipe, dietary_restrictions):
+        violates = recipe_violates(derived, dietary_restrictions) if derived else violates_dietary_restrictions(recipe, dietary_restrictions)
+        if not violates:
             score += 0.2
         else:
             return 0.0  # Disqualify if violates dietary restrictions
@@ -130,7 +309,7 @@ def calculate_recipe_score(
                 score += 0.1
         
         # 7. Spice level preference (weight: 0.1)
-        recipe_spice_level = extract_spice_level(recipe)
+        recipe_spice_level = derived['spice'] if derived else extract_spice_level(recipe)
         user_spice_level = user_preferences.spice_level.value.lower()
         
         if recipe_spice_level == user_spice_level:
@@ -217,6 +396,40 @@ def extract_spice_level(recipe: Dict[str, Any]) -> str:
     else:
         return 'medium'  # Default
 
+def cooking_time_bucket(cooking_time) -> str:
+    """The CookingTime value a recipe's cooking time in minutes falls into"""
+    for limit, bucket in COOKING_TIME_BUCKETS:
+        if cooking_time <= limit:
+            return bucket.value
+    return CookingTime.LONG_60_PLUS.value
+
+def derive_recipe_fields(recipe: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Everything scoring derives from a base recipe on its own, computed once at
+    ingest and stored on the document under 'derived'.
+    """
+    return {
+        'version': DERIVATION_VERSION,
+        'ingredients': [ing.lower() for ing in recipe.get('ingredients', [])],
+        'spice': extract_spice_level(recipe),
+        'violates': [
+            restriction.value.lower() for restriction in DietaryRestriction
+            if violates_dietary_restrictions(recipe, [restriction.value])
+        ],
+        'cooking_time_bucket': cooking_time_bucket(recipe.get('cooking_time', 30))
+    }
+
+def stored_derivation(recipe: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The derivation stored at ingest, or None if the recipe has none from this DERIVATION_VERSION"""
+    derived = recipe.get('derived')
+    if isinstance(derived, dict) and derived.get('version') == DERIVATION_VERSION:
+        return derived
+    return None
+
+def recipe_violates(derived: Dict[str, Any], dietary_restrictions: List[str]) -> bool:
+    """violates_dietary_restrictions answered from a stored derivation"""
+    return any(restriction.lower() in derived['violates'] for restriction in dietary_restrictions)
+
 def spice_levels_compatible(recipe_spice: str, user_spice: str) -> bool:
     """Check if spice levels are compatible"""
     spice_hierarchy = ['mild', 'medium', 'spicy', 'extra spicy']
@@ -0,0 +1,315 @@
+"""
+"Similar recipes" index over base and generated recipes.
+
+Each recipe becomes a hashed TF-IDF vector of its title words, cuisine,
+tags and ingredients, computed locally with no embedding service. Vectors
+are L2-normalized and stored as int8. An inverted-file (IVF) index groups
+them around SIMILAR_LISTS k-means centroids. A query scores the centroids
+and then only the members of the SIMILAR_NPROBE closest lists, so it
+touches a few thousand vectors even at a million recipes.
+
+Each worker builds the index in the background at startup. It inserts the
+generated recipes it stores itself immediately, and every
+SIMILAR_SYNC_SECONDS picks up recipes other workers stored. A new catalog
+version triggers a rebuild, which is swapped in when complete.
+"""
+import os
+import re
+import math
+import time
+import zlib
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from services import database
+from services.catalog import get_catalog
+from services.metrics import gauge, stage_timer
+from services.cosmos_metrics import cosmos_operation
+
+logger = logging.getLogger(__name__)
+
+# Hashed feature dimensions; vectors cost this many bytes each
+SIMILAR_DIMENSIONS = int(os.getenv('SIMILAR_DIMENSIONS', '128'))
+
+# Inverted lists; 0 picks about the square root of the recipe count
+SIMILAR_LISTS = int(os.getenv('SIMILAR_LISTS', '0'))
+
+# Lists scanned per query; more is slower and closer to exact
+SIMILAR_NPROBE = int(os.getenv('SIMILAR_NPROBE', '16'))
+
+# How often to pick up generated recipes stored by other workers
+SIMILAR_SYNC_SECONDS = int(os.getenv('SIMILAR_SYNC_SECONDS', '30'))
+
+KIND_BASE = 'base_recipe'
+KIND_GENERATED = 'generated_recipe'
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 40
+ASSIGN_CHUNK = 65536
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(['and', 'the', 'with', 'for', 'yippee', 'noodles', 'recipe'])
+
+similar_index_recipes = gauge('similar_index_recipes', 'Recipes in the similar recipes index by kind')
+
+def recipe_tokens(recipe: Dict[str, Any]) -> List[str]:
+    """Prefixed tokens so a word in a title and the same word as a tag hash apart"""
+    tokens = []
+    for word in TOKEN_RE.findall(str(recipe.get('title') or '').lower()):
+        if len(word) > 2 and word not in STOPWORDS:
+            tokens.append(f"w:{word}")
+    cuisine = recipe.get('cuisine')
+    if isinstance(cuisine, str) and cuisine:
+        tokens.append(f"c:{cuisine.lower()}")
+    for tag in recipe.get('tags') or []:
+        if isinstance(tag, str):
+            tokens.append(f"t:{tag.lower()}")
+    for ingredient in recipe.get('ingredients') or []:
+        # Generated recipes store RecipeIngredient dicts, base recipes plain names
+        name = ingredient.get('name') if isinstance(ingredient, dict) else ingredient
+        if isinstance(name, str) and name:
+            name = name.lower().strip()
+            tokens.append(f"i:{name}")
+            tokens.extend(f"iw:{word}" for word in TOKEN_RE.findall(name) if len(word) > 2)
+    return tokens
+
+def hash_tokens(tokens: List[str], dimensions: int) -> Dict[int, float]:
+    """Signed feature hashing with a sublinear term frequency"""
+    counts = {}
+    for token in tokens:
+        value = zlib.crc32(token.encode('utf-8'))
+        bucket = value % dimensions
+        sign = 1.0 if (value >> 31) & 1 else -1.0
+        counts[bucket] = counts.get(bucket, 0.0) + sign
+    return {bucket: math.copysign(1.0 + math.log(abs(count)), count) for bucket, count in counts.items() if count}
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _quantize(matrix: np.ndarray) -> np.ndarray:
+    return np.round(matrix * 127).astype(np.int8)
+
+class SimilarIndex:
+    """An IVF index over int8 hashed TF-IDF vectors, with inserts after the build"""
+
+    def __init__(self, dimensions: int, idf: np.ndarray, centroids: np.ndarray, vectors: np.ndarray,
+                 assignments: np.ndarray, ids: List[str], kinds: List[str], titles: List[str]):
+        self.dimensions = dimensions
+        self.idf = idf
+        self.centroids = centroids
+        self.vectors = vectors
+        self.count = len(ids)
+        self.ids = ids
+        self.kinds = kinds
+        self.titles = titles
+        self.row_of = {recipe_id: row for row, recipe_id in enumerate(ids)}
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]].astype(np.int64) for i in range(len(centroids))]
+        # Rows inserted after the build, per list
+        self.pending = [[] for _ in range(len(centroids))]
+        self.catalog_version = None
+        self.watermark = 0
+
+    @classmethod
+    def build(cls, recipes: List[Dict[str, Any]], dimensions: int = SIMILAR_DIMENSIONS, lists: int = SIMILAR_LISTS,
+              seed: int = 0) -> 'SimilarIndex':
+        """Vectorize every recipe, then cluster with spherical k-means on a sample"""
+        count = len(recipes)
+        hashed = [hash_tokens(recipe_tokens(recipe), dimensions) for recipe in recipes]
+        document_frequency = np.zeros(dimensions, dtype=np.float64)
+        for features in hashed:
+            for bucket in features:
+                document_frequency[bucket] += 1
+        idf = (np.log((1 + count) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        vectors = np.zeros((max(count, 1), dimensions), dtype=np.int8)
+        for start in range(0, count, ASSIGN_CHUNK):
+            chunk = np.zeros((min(ASSIGN_CHUNK, count - start), dimensions), dtype=np.float32)
+            for offset, features in enumerate(hashed[start:start + len(chunk)]):
+                for bucket, weight in features.items():
+                    chunk[offset, bucket] = weight
+            vectors[start:start + len(chunk)] = _quantize(_normalize(chunk * idf))
+
+        rng = np.random.default_rng(seed)
+        list_count = max(1, min(lists or int(math.sqrt(count)), count))
+        sample_rows = rng.choice(count, size=min(count, list_count * KMEANS_SAMPLE_PER_LIST), replace=False) if count else np.zeros(0, dtype=np.int64)
+        sample = vectors[sample_rows].astype(np.float32) / 127
+        centroids = sample[rng.choice(len(sample), size=list_count, replace=False)] if count else np.zeros((1, dimensions), dtype=np.float32)
+        for _ in range(KMEANS_ITERATIONS if count else 0):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            empty = np.flatnonzero(np.bincount(nearest, minlength=list_count) == 0)
+            # Re-seed empty lists from random sample rows
+            sums[empty] = sample[rng.choice(len(sample), size=len(empty))]
+            centroids = _normalize(sums).astype(np.float32)
+
+        assignments = np.zeros(count, dtype=np.int64)
+        for start in range(0, count, ASSIGN_CHUNK):
+            chunk = vectors[start:start + ASSIGN_CHUNK].astype(np.float32)
+            assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+
+        return cls(
+            dimensions, idf, centroids, vectors, assignments,
+            [str(recipe.get('id')) for recipe in recipes],
+            [recipe.get('type') or KIND_GENERATED for recipe in recipes],
+            [str(recipe.get('title') or '') for recipe in recipes]
+        )
+
+    def vectorize(self, recipe: Dict[str, Any]) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for bucket, weight in hash_tokens(recipe_tokens(recipe), self.dimensions).items():
+            vector[bucket] = weight
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, recipe: Dict[str, Any]) -> Optional[int]:
+        """Insert one recipe, keeping the build's IDF and centroids; ids already present are skipped"""
+        recipe_id = str(recipe.get('id'))
+        if recipe_id in self.row_of:
+            return None
+        vector = self.vectorize(recipe)
+        if self.count == len(self.vectors):
+            grown = np.zeros((max(16, len(self.vectors) * 2), self.dimensions), dtype=np.int8)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+        row = self.count
+        self.vectors[row] = _quantize(vector)
+        self.count += 1
+        self.ids.append(recipe_id)
+        self.kinds.append(recipe.get('type') or KIND_GENERATED)
+        self.titles.append(str(recipe.get('title') or ''))
+        self.row_of[recipe_id] = row
+        self.pending[int(np.argmax(self.centroids @ vector))].append(row)
+        return row
+
+    def search(self, vector: np.ndarray, limit: int, nprobe: int = SIMILAR_NPROBE, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Rows of the most similar recipes with their cosine similarity, best first"""
+        centroid_scores = self.centroids @ vector
+        nprobe = min(nprobe, len(self.centroids))
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        members = [self.lists[i] for i in probed] + [np.array(self.pending[i], dtype=np.int64) for i in probed if self.pending[i]]
+        rows = np.concatenate(members) if members else np.zeros(0, dtype=np.int64)
+        if exclude is not None:
+            rows = rows[rows != exclude]
+        if not len(rows):
+            return []
+        scores = (self.vectors[rows].astype(np.float32) @ vector) / 127
+        if len(rows) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            rows, scores = rows[top], scores[top]
+        order = np.lexsort((rows, -scores))
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def similar(self, recipe_id: str, limit: int, recipe: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """Recipes most like `recipe_id`; None when it is neither indexed nor passed in"""
+        row = self.row_of.get(recipe_id)
+        if row is not None:
+            vector = self.vectors[row].astype(np.float32) / 127
+            vector /= np.linalg.norm(vector) or 1.0
+        elif recipe is not None:
+            vector = self.vectorize(recipe)
+        else:
+            return None
+        return [
+            {'id': self.ids[match], 'title': self.titles[match], 'type': self.kinds[match], 'similarity': round(score, 4)}
+            for match, score in self.search(vector, limit, exclude=row)
+        ]
+
+    def counts(self) -> Dict[str, int]:
+        generated = sum(1 for kind in self.kinds if kind != KIND_BASE)
+        return {KIND_BASE: self.count - generated, KIND_GENERATED: generated}
+
+similar_index = None
+maintenance_task = None
+
+def _read_generated_sync(since: int) -> List[Dict[str, Any]]:
+    query = "SELECT c.id, c.title, c.cuisine, c.tags, c.ingredients, c._ts FROM c WHERE c._ts >= @since"
+    with cosmos_operation('read_generated_for_similar_index'):
+        return list(database.generated_recipes_container.query_items(
+            query, parameters=[{'name': '@since', 'value': since}], enable_cross_partition_query=True
+        ))
+
+async def _read_generated(since: int) -> List[Dict[str, Any]]:
+    if not database.generated_recipes_container:
+        return []
+    with stage_timer('cosmos_read'):
+        recipes = await asyncio.to_thread(_read_generated_sync, since)
+    for recipe in recipes:
+        recipe['type'] = KIND_GENERATED
+    return recipes
+
+def _record_size(index: SimilarIndex):
+    for kind, count in index.counts().items():
+        similar_index_recipes.set(count, kind=kind)
+
+async def build_similar_index() -> SimilarIndex:
+    catalog = await get_catalog()
+    base = [catalog.recipe(index) for index in range(len(catalog))]
+    generated = await _read_generated(0)
+    started = time.perf_counter()
+    index = await asyncio.to_thread(SimilarIndex.build, base + generated)
+    index.catalog_version = catalog.version
+    index.watermark = max((recipe.get('_ts') or 0 for recipe in generated), default=0)
+    logger.info(f"Built similar recipes index over {index.count} recipes with {len(index.centroids)} lists "
+                f"in {time.perf_counter() - started:.2f}s")
+    _record_size(index)
+    return index
+
+async def sync_similar_index(index: SimilarIndex) -> int:
+    """Insert generated recipes stored since the last sync; re-reading the boundary second is harmless"""
+    added = 0
+    for recipe in await _read_generated(index.watermark):
+        if index.add(recipe) is not None:
+            added += 1
+        index.watermark = max(index.watermark, recipe.get('_ts') or 0)
+    if added:
+        _record_size(index)
+    return added
+
+async def _maintain():
+    global similar_index
+
+    while True:
+        try:
+            if similar_index is None or similar_index.catalog_version != (await get_catalog()).version:
+                similar_index = await build_similar_index()
+            else:
+                await sync_similar_index(similar_index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Similar recipes index maintenance failed: {e}")
+        await asyncio.sleep(SIMILAR_SYNC_SECONDS)
+
+def start_similar_index():
+    """Build the index in the background and keep it current until stop_similar_index"""
+    global maintenance_task
+    if maintenance_task is None:
+        maintenance_task = asyncio.create_task(_maintain())
+
+async def stop_similar_index():
+    global maintenance_task
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+        try:
+            await maintenance_task
+        except asyncio.CancelledError:
+            pass
+        maintenance_task = None
+
+def index_generated_recipe(recipe_document: Dict[str, Any]):
+    """Make a just-stored generated recipe findable straight away in this worker"""
+    if similar_index is None:
+        return
+    try:
+        if similar_index.add({**recipe_document, 'type': KIND_GENERATED}) is not None:
+            _record_size(similar_index)
+    except Exception as e:
+        logger.warning(f"Failed to index generated recipe {recipe_document.get('id')}: {e}")
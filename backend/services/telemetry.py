@@ -0,0 +1,217 @@
+import os
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import copy
+import contextvars
+from logging.handlers import QueueHandler
+from typing import List, Optional
+
+from services.metrics import counter, register_collector
+
+logger = logging.getLogger(__name__)
+
+# Background export settings
+QUEUE_CAPACITY = int(os.getenv('TELEMETRY_QUEUE_CAPACITY', '10000'))
+BATCH_SIZE = int(os.getenv('TELEMETRY_BATCH_SIZE', '200'))
+FLUSH_INTERVAL_SECONDS = float(os.getenv('TELEMETRY_FLUSH_INTERVAL_MS', '1000')) / 1000
+DROP_POLICY = os.getenv('TELEMETRY_DROP_POLICY', 'drop_newest')  # drop_newest | drop_oldest
+
+# Sampling settings; WARNING and above are never sampled out
+LOG_SAMPLE_RATE = float(os.getenv('TELEMETRY_LOG_SAMPLE_RATE', '1.0'))
+TAIL_SAMPLING_ENABLED = os.getenv('TELEMETRY_TAIL_SAMPLING', 'false').lower() == 'true'
+TAIL_SAMPLE_RATE = float(os.getenv('TELEMETRY_TAIL_SAMPLE_RATE', '0.1'))
+TAIL_SLOW_SECONDS = float(os.getenv('TELEMETRY_TAIL_SLOW_MS', '5000')) / 1000
+TAIL_BUFFER_SIZE = int(os.getenv('TELEMETRY_TAIL_BUFFER_SIZE', '200'))
+
+telemetry_dropped = counter('telemetry_dropped_total', 'Log records not exported, by reason')
+telemetry_exported = counter('telemetry_exported_total', 'Log records handed to exporters')
+
+# Per-request buffer of low-severity records awaiting the tail sampling decision
+request_buffer = contextvars.ContextVar('telemetry_request_buffer', default=None)
+
+# Installed handler and export thread
+queue_handler = None
+export_thread = None
+
+class RequestBuffer:
+    """Records logged during one request, held until its outcome is known"""
+
+    def __init__(self):
+        self.records = []
+        self.overflowed = 0
+        self.errored = False
+        self.closed = False
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Non-blocking handler that only enqueues.
+
+    When the queue is full the configured drop policy applies instead of
+    blocking the caller.
+    """
+
+    def __init__(self, capacity: int, drop_policy: str):
+        super().__init__(queue.Queue(maxsize=capacity))
+        self.drop_policy = drop_policy
+
+    def prepare(self, record):
+        # Resolve the message now but leave traceback formatting to the export thread
+        prepared = copy.copy(record)
+        prepared.msg = record.getMessage()
+        prepared.args = None
+        return prepared
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.drop_policy == 'drop_oldest':
+                try:
+                    self.queue.get_nowait()
+                    self.queue.put_nowait(record)
+                    telemetry_dropped.inc(reason='queue_full_oldest')
+                    return
+                except (queue.Empty, queue.Full):
+                    pass
+            telemetry_dropped.inc(reason='queue_full')
+
+    def emit(self, record):
+        try:
+            if record.levelno < logging.WARNING:
+                buffer = request_buffer.get()
+                if buffer is not None and not buffer.closed:
+                    # Tail sampling decides at the end of the request
+                    if len(buffer.records) < TAIL_BUFFER_SIZE:
+                        buffer.records.append(self.prepare(record))
+                    else:
+                        buffer.overflowed += 1
+                    return
+                if LOG_SAMPLE_RATE < 1.0 and random.random() >= LOG_SAMPLE_RATE:
+                    telemetry_dropped.inc(reason='sampled')
+                    return
+            else:
+                buffer = request_buffer.get()
+                if buffer is not None and record.levelno >= logging.ERROR:
+                    buffer.errored = True
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+class ExportThread(threading.Thread):
+    """Drain the queue in batches and hand records to the real handlers"""
+
+    def __init__(self, record_queue: queue.Queue, handlers: List[logging.Handler]):
+        super().__init__(name='telemetry-export', daemon=True)
+        self.record_queue = record_queue
+        self.handlers = handlers
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set() or not self.record_queue.empty():
+            batch = self._next_batch()
+            if batch:
+                self._export(batch)
+
+    def _next_batch(self) -> List[logging.LogRecord]:
+        batch = []
+        deadline = time.monotonic() + FLUSH_INTERVAL_SECONDS
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self.stopping.is_set() and self.record_queue.empty()):
+                break
+            try:
+                batch.append(self.record_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[logging.LogRecord]):
+        for handler in self.handlers:
+            for record in batch:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        pass
+            try:
+                handler.flush()
+            except Exception:
+                pass
+        telemetry_exported.inc(len(batch))
+
+    def stop(self, timeout: float = 5.0):
+        self.stopping.set()
+        self.join(timeout)
+
+def install_background_logging(extra_handlers: Optional[List[logging.Handler]] = None):
+    """
+    Move every root handler behind a bounded queue drained by a background thread.
+
+    Request handling only pays for an in-memory enqueue; formatting, console
+    writes and exporter transmission happen on the export thread.
+    """
+    global queue_handler, export_thread
+
+    root_logger = logging.getLogger()
+    if queue_handler is not None:
+        for handler in extra_handlers or []:
+            export_thread.handlers.append(handler)
+        return
+
+    handlers = [h for h in root_logger.handlers] + list(extra_handlers or [])
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+
+    queue_handler = BoundedQueueHandler(QUEUE_CAPACITY, DROP_POLICY)
+    export_thread = ExportThread(queue_handler.queue, handlers)
+    export_thread.start()
+    root_logger.addHandler(queue_handler)
+    atexit.register(export_thread.stop)
+
+    logger.info(f"Background telemetry export enabled for {len(handlers)} handlers")
+
+def begin_request() -> Optional[contextvars.Token]:
+    """Start buffering low-severity records for the current request"""
+    if not TAIL_SAMPLING_ENABLED or queue_handler is None:
+        return None
+    return request_buffer.set(RequestBuffer())
+
+def end_request(token: Optional[contextvars.Token], duration: float, status_code: int):
+    """Keep the request's records if it was slow or errored, otherwise sample them"""
+    if token is None:
+        return
+    buffer = request_buffer.get()
+    request_buffer.reset(token)
+    if buffer is None:
+        return
+    # Background tasks spawned by the request inherit the buffer; export their records directly
+    buffer.closed = True
+    if not buffer.records:
+        return
+
+    keep = (
+        buffer.errored
+        or status_code >= 500
+        or duration >= TAIL_SLOW_SECONDS
+        or random.random() < TAIL_SAMPLE_RATE
+    )
+    if keep:
+        for record in buffer.records:
+            queue_handler.enqueue(record)
+    else:
+        telemetry_dropped.inc(len(buffer.records), reason='tail_sampled')
+    if buffer.overflowed:
+        telemetry_dropped.inc(buffer.overflowed, reason='request_buffer_full')
+
+def _collect_telemetry_metrics():
+    depth = queue_handler.queue.qsize() if queue_handler is not None else 0
+    return [
+        ('telemetry_queue_depth', 'gauge', 'Log records waiting for background export', [({}, depth)]),
+        ('telemetry_queue_capacity', 'gauge', 'Capacity of the telemetry export queue', [({}, QUEUE_CAPACITY)])
+    ]
+
+register_collector(_collect_telemetry_metrics)
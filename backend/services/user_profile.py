@@ -1,18 +1,31 @@
 import os
+import random
+import asyncio
 import logging
 import json
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional
 from datetime import datetime
 import redis.asyncio as redis
-from azure.cosmos.exceptions import CosmosHttpResponseError
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import (
+    CosmosHttpResponseError,
+    CosmosResourceNotFoundError,
+    CosmosResourceExistsError,
+    CosmosAccessConditionFailedError
+)
 
-from services.database import user_profiles_container
+from services import database, recipe_history
+from services.metrics import stage_timer
+from services.cosmos_metrics import cosmos_operation
 
 logger = logging.getLogger(__name__)
 
 # Redis client for caching
 redis_client = None
 
+# Reads and conditional writes of a profile before giving up to concurrent writers
+PROFILE_WRITE_ATTEMPTS = int(os.getenv('PROFILE_WRITE_ATTEMPTS', '5'))
+
 async def init_redis():
     """Initialize Redis connection for caching"""
     global redis_client
@@ -29,13 +42,25 @@ async def init_redis():
         logger.error(f"Failed to initialize Redis: {e}")
         redis_client = None
 
+async def close_redis():
+    """Close the Redis connection pool on shutdown"""
+    global redis_client
+    
+    if redis_client:
+        try:
+            await redis_client.close()
+        except Exception as e:
+            logger.warning(f"Error closing Redis connection: {e}")
+        redis_client = None
+
 async def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
     """Retrieve user profile from cache first, then from Cosmos DB"""
     try:
         # Try cache first
         if redis_client:
             try:
-                cached_profile = await redis_client.get(f"user_profile:{user_id}")
+                with stage_timer('redis'):
+                    cached_profile = await redis_client.get(f"user_profile:{user_id}")
                 if cached_profile:
                     profile_data = json.loads(cached_profile)
                     logger.info(f"Retrieved user profile from cache: {user_id}")
@@ -44,19 +69,21 @@ async def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
                 logger.warning(f"Cache retrieval failed: {e}")
         
         # Fallback to Cosmos DB
-        if user_profiles_container:
+        if database.user_profiles_container:
             try:
-                profile_data = user_profiles_container.read_item(user_id, user_id)
+                with stage_timer('cosmos_read'), cosmos_operation('read_user_profile'):
+                    profile_data = database.user_profiles_container.read_item(user_id, user_id)
                 logger.info(f"Retrieved user profile from Cosmos DB: {user_id}")
                 
                 # Cache the result
                 if redis_client:
                     try:
-                        await redis_client.setex(
-                            f"user_profile:{user_id}",
-                            3600,  # 1 hour cache
-                            json.dumps(profile_data)
-                        )
+                        with stage_timer('redis'):
+                            await redis_client.setex(
+                                f"user_profile:{user_id}",
+                                3600,  # 1 hour cache
+                                json.dumps(profile_data)
+                            )
                     except Exception as e:
                         logger.warning(f"Failed to cache user profile: {e}")
                 
@@ -77,8 +104,10 @@ async def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
                     "available_ingredients": []
                 },
                 "saved_recipes": [],
+                "saved_recipes_count": 0,
                 "disliked_ingredients": [],
                 "cooking_history": [],
+                "cooking_history_count": 0,
                 "created_at": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat()
             }
@@ -102,20 +131,17 @@ async def update_user_profile(user_id: str, new_data: Dict[str, Any]) -> bool:
             profile_data = existing_profile
         else:
             # Create new profile
-            profile_data = {
-                "user_id": user_id,
-                "preferences": new_data.get('preferences', {}),
-                "saved_recipes": new_data.get('saved_recipes', []),
-                "disliked_ingredients": new_data.get('disliked_ingredients', []),
-                "cooking_history": new_data.get('cooking_history', []),
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
+            profile_data = new_profile(user_id)
+            profile_data.update(new_data)
+        
+        # Profiles are point-read by id within the user's partition
+        profile_data.setdefault('id', user_id)
         
         # Update Cosmos DB
-        if user_profiles_container:
+        if database.user_profiles_container:
             try:
-                user_profiles_container.upsert_item(profile_data)
+                with stage_timer('cosmos_write'), cosmos_operation('upsert_user_profile'):
+                    database.user_profiles_container.upsert_item(profile_data)
                 logger.info(f"Updated user profile in Cosmos DB: {user_id}")
             except Exception as e:
                 logger.error(f"Failed to update user profile in Cosmos DB: {e}")
@@ -124,11 +150,12 @@ async def update_user_profile(user_id: str, new_data: Dict[str, Any]) -> bool:
         # Update cache
         if redis_client:
             try:
-                await redis_client.setex(
-                    f"user_profile:{user_id}",
-                    3600,  # 1 hour cache
-                    json.dumps(profile_data)
-                )
+                with stage_timer('redis'):
+                    await redis_client.setex(
+                        f"user_profile:{user_id}",
+                        3600,  # 1 hour cache
+                        json.dumps(profile_data)
+                    )
                 logger.info(f"Updated user profile in cache: {user_id}")
             except Exception as e:
                 logger.warning(f"Failed to update user profile in cache: {e}")
@@ -139,87 +166,173 @@ async def update_user_profile(user_id: str, new_data: Dict[str, Any]) -> bool:
         logger.error(f"Error updating user profile {user_id}: {e}")
         return False
 
-async def add_recipe_to_history(user_id: str, recipe_id: str) -> bool:
-    """Add a recipe to user's cooking history"""
+def new_profile(user_id: str) -> Dict[str, Any]:
+    """An empty profile document"""
+    now = datetime.utcnow().isoformat()
+    return {
+        "id": user_id,
+        "user_id": user_id,
+        "preferences": {},
+        "saved_recipes": [],
+        "saved_recipes_count": 0,
+        "disliked_ingredients": [],
+        "cooking_history": [],
+        "cooking_history_count": 0,
+        "cooked_base_recipes": [],
+        "created_at": now,
+        "updated_at": now
+    }
+
+def _apply_operations(profile: Dict[str, Any], operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply top-level set/incr patch operations locally, as Cosmos DB would"""
+    for operation in operations:
+        field = operation['path'].lstrip('/')
+        if operation['op'] == 'incr':
+            profile[field] = (profile.get(field) or 0) + operation['value']
+        else:
+            profile[field] = operation['value']
+    return profile
+
+def _read_stored_profile(user_id: str) -> Optional[Dict[str, Any]]:
     try:
-        profile = await get_user_profile(user_id)
-        if not profile:
-            profile = {
-                "user_id": user_id,
-                "preferences": {},
-                "saved_recipes": [],
-                "disliked_ingredients": [],
-                "cooking_history": [],
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
+        with stage_timer('cosmos_read'), cosmos_operation('read_user_profile'):
+            return database.user_profiles_container.read_item(user_id, user_id)
+    except CosmosResourceNotFoundError:
+        return None
+
+async def _write_stored_profile(
+    user_id: str,
+    build_operations: Callable[[Dict[str, Any]], List[Dict[str, Any]]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Read the profile, build the operations from it and apply them only if
+    nobody wrote the profile in between, retrying from a fresh read
+    otherwise. Returns the stored profile, or None if there was nothing to do.
+    """
+    for attempt in range(PROFILE_WRITE_ATTEMPTS):
+        if attempt:
+            # Jittered, so writers that collided do not collide again
+            await asyncio.sleep(random.uniform(0, 0.05 * attempt))
+        stored = _read_stored_profile(user_id)
+        operations = build_operations(stored or new_profile(user_id))
+        if not operations:
+            return None
+        operations = operations + [{'op': 'set', 'path': '/updated_at', 'value': datetime.utcnow().isoformat()}]
+        try:
+            if stored is None:
+                # Not an upsert, which would overwrite a profile created since the read
+                with stage_timer('cosmos_write'), cosmos_operation('create_user_profile'):
+                    return database.user_profiles_container.create_item(_apply_operations(new_profile(user_id), operations))
+            with stage_timer('cosmos_write'), cosmos_operation('patch_user_profile'):
+                return database.user_profiles_container.patch_item(
+                    user_id, user_id, operations,
+                    etag=stored['_etag'], match_condition=MatchConditions.IfNotModified
+                )
+        except (CosmosAccessConditionFailedError, CosmosResourceExistsError, CosmosResourceNotFoundError):
+            # Another writer changed, created or deleted the profile since the read
+            logger.info(f"User profile {user_id} changed during update, retrying")
+    raise RuntimeError(f"profile kept changing for {PROFILE_WRITE_ATTEMPTS} attempts")
+
+async def patch_user_profile(
+    user_id: str,
+    build_operations: Callable[[Dict[str, Any]], List[Dict[str, Any]]]
+) -> bool:
+    """
+    Apply patch operations to a profile instead of rewriting the document,
+    creating the profile if it does not exist yet, and refresh the cache
+    with the result. build_operations gets the current profile and returns
+    the operations, so a read-modify-write that races another update is
+    rebuilt from the newer profile rather than losing it.
+    """
+    try:
+        if database.user_profiles_container:
+            profile_data = await _write_stored_profile(user_id, build_operations)
+            if profile_data is None:
+                return True
+            logger.info(f"Patched user profile in Cosmos DB: {user_id}")
+        else:
+            profile_data = await get_user_profile(user_id) or new_profile(user_id)
+            operations = build_operations(profile_data)
+            if not operations:
+                return True
+            operations = operations + [{'op': 'set', 'path': '/updated_at', 'value': datetime.utcnow().isoformat()}]
+            profile_data = _apply_operations(profile_data, operations)
         
-        # Add recipe to history if not already present
-        if recipe_id not in profile.get('cooking_history', []):
-            profile['cooking_history'].insert(0, recipe_id)  # Add to beginning
-            # Keep only last 50 recipes
-            profile['cooking_history'] = profile['cooking_history'][:50]
-            profile['updated_at'] = datetime.utcnow().isoformat()
-            
-            return await update_user_profile(user_id, profile)
+        if redis_client:
+            try:
+                with stage_timer('redis'):
+                    await redis_client.setex(
+                        f"user_profile:{user_id}",
+                        3600,  # 1 hour cache
+                        json.dumps(profile_data)
+                    )
+            except Exception as e:
+                logger.warning(f"Failed to update user profile in cache: {e}")
         
         return True
         
     except Exception as e:
-        logger.error(f"Error adding recipe to history: {e}")
+        logger.error(f"Error patching user profile {user_id}: {e}")
         return False
 
-async def save_recipe(user_id: str, recipe_id: str) -> bool:
-    """Save a recipe to user's favorites"""
+async def record_recipe_history(
+    user_id: str,
+    kind: str,
+    recipe_id: str,
+    preferences: Optional[Dict[str, Any]] = None,
+    base_recipe_id: Optional[str] = None
+) -> bool:
+    """
+    Append a cooked or saved recipe to the user's history store, then patch
+    the profile's count and recent IDs (and preferences, if given).
+    base_recipe_id is the catalog recipe a generated recipe was based on.
+    """
     try:
-        profile = await get_user_profile(user_id)
-        if not profile:
-            profile = {
-                "user_id": user_id,
-                "preferences": {},
-                "saved_recipes": [],
-                "disliked_ingredients": [],
-                "cooking_history": [],
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
+        added = await recipe_history.append_history(user_id, kind, recipe_id, base_recipe_id)
+        field, count_field = recipe_history.PROFILE_FIELDS[kind]
         
-        # Add recipe to saved recipes if not already present
-        if recipe_id not in profile.get('saved_recipes', []):
-            profile['saved_recipes'].append(recipe_id)
-            profile['updated_at'] = datetime.utcnow().isoformat()
-            
-            return await update_user_profile(user_id, profile)
+        def build_operations(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+            operations = []
+            current = profile.get(field) or []
+            recent = recipe_history.recent_ids(kind, current, recipe_id)
+            if recent != current:
+                operations.append({'op': 'set', 'path': f'/{field}', 'value': recent})
+            if added:
+                operations.append({'op': 'incr', 'path': f'/{count_field}', 'value': 1})
+            if base_recipe_id:
+                current_bases = profile.get(recipe_history.BASE_RECIPES_FIELD) or []
+                recent_bases = recipe_history.recent_ids(recipe_history.COOKED, current_bases, base_recipe_id)
+                if recent_bases != current_bases:
+                    operations.append({'op': 'set', 'path': f'/{recipe_history.BASE_RECIPES_FIELD}', 'value': recent_bases})
+            if preferences is not None:
+                operations.append({'op': 'set', 'path': '/preferences', 'value': preferences})
+            return operations
         
-        return True
+        return await patch_user_profile(user_id, build_operations)
         
     except Exception as e:
-        logger.error(f"Error saving recipe: {e}")
+        logger.error(f"Error recording {kind} recipe for {user_id}: {e}")
         return False
 
+async def add_recipe_to_history(user_id: str, recipe_id: str) -> bool:
+    """Add a recipe to user's cooking history"""
+    return await record_recipe_history(user_id, recipe_history.COOKED, recipe_id)
+
+async def save_recipe(user_id: str, recipe_id: str) -> bool:
+    """Save a recipe to user's favorites"""
+    return await record_recipe_history(user_id, recipe_history.SAVED, recipe_id)
+
 async def add_disliked_ingredient(user_id: str, ingredient: str) -> bool:
     """Add an ingredient to user's disliked list"""
     try:
-        profile = await get_user_profile(user_id)
-        if not profile:
-            profile = {
-                "user_id": user_id,
-                "preferences": {},
-                "saved_recipes": [],
-                "disliked_ingredients": [],
-                "cooking_history": [],
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }
+        def build_operations(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+            disliked_ingredients = profile.get('disliked_ingredients') or []
+            # Add ingredient to disliked list if not already present
+            if ingredient.lower() in [i.lower() for i in disliked_ingredients]:
+                return []
+            return [{'op': 'set', 'path': '/disliked_ingredients', 'value': disliked_ingredients + [ingredient]}]
         
-        # Add ingredient to disliked list if not already present
-        if ingredient.lower() not in [i.lower() for i in profile.get('disliked_ingredients', [])]:
-            profile['disliked_ingredients'].append(ingredient)
-            profile['updated_at'] = datetime.utcnow().isoformat()
-            
-            return await update_user_profile(user_id, profile)
-        
-        return True
+        return await patch_user_profile(user_id, build_operations)
         
     except Exception as e:
         logger.error(f"Error adding disliked ingredient: {e}")
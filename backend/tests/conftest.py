@@ -0,0 +1,18 @@
+import asyncio
+import threading
+
+import pytest
+
+from benchmarks.loadtest.fakes import FakeRedis, LatencyModel
+
+@pytest.fixture
+def fake_redis_url():
+    """An empty Redis fake from the load test harness, served from its own thread and event loop"""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(FakeRedis(LatencyModel(0, 0))._client, '127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0"
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
@@ -0,0 +1,45 @@
+import asyncio
+import uuid
+
+from services import collaborative
+from services.collaborative import CooccurrenceCounts, history_items, personalized_boosts
+from services.recipe_history import COOKED, SAVED, history_entry
+
+def realistic_history():
+    """Entries as generation writes them: fresh recipe ids with the catalog recipe each was based on"""
+    entries = []
+    for user in range(6):
+        user_id = f"user-{user}"
+        bases = ['base-001', 'base-002'] if user % 2 == 0 else ['base-001', 'base-002', 'base-003']
+        for base in bases:
+            entries.append(history_entry(user_id, COOKED, str(uuid.uuid4()), base_recipe_id=base))
+    # Generations written before base_recipe_id existed carry no signal
+    entries.append(history_entry('user-legacy', COOKED, str(uuid.uuid4())))
+    entries.append(history_entry('user-0', SAVED, 'base-003'))
+    return entries
+
+def test_neighbor_table_from_generated_history():
+    users = history_items(realistic_history())
+    assert 'user-legacy' not in users
+    assert users['user-0'] == {'base-001', 'base-002', 'base-003'}
+
+    counts = CooccurrenceCounts()
+    for user_id, items in users.items():
+        counts.add_user(user_id, items)
+    neighbors = counts.neighbors(top_n=20, min_support=2)
+
+    assert neighbors['base-001'][0] == ('base-002', 1.0)
+    assert {neighbor for neighbor, _ in neighbors['base-003']} == {'base-001', 'base-002'}
+
+def test_boosts_from_cooked_base_recipes(monkeypatch):
+    counts = CooccurrenceCounts()
+    for user_id, items in history_items(realistic_history()).items():
+        counts.add_user(user_id, items)
+    monkeypatch.setattr(collaborative, 'neighbor_table', counts.neighbors(top_n=20, min_support=2))
+    monkeypatch.setattr(collaborative.user_profile, 'redis_client', None)
+
+    profile = {'cooking_history': [str(uuid.uuid4())], 'cooked_base_recipes': ['base-003'], 'saved_recipes': []}
+    boosts = asyncio.run(personalized_boosts(profile))
+
+    assert set(boosts) == {'base-001', 'base-002'}
+    assert all(0 < boost <= collaborative.SIMILARITY_BOOST_WEIGHT for boost in boosts.values())
@@ -0,0 +1,118 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+import redis.asyncio as redis
+from fastapi import HTTPException
+
+from services import idempotency, user_profile
+from services.idempotency import run_idempotent
+
+SCOPE = 'generate-recipe'
+PAYLOAD = {'user_id': 'user-1', 'preferences': {'cuisine': 'Indian'}}
+
+class Handler:
+    """Counts runs and, while held, blocks each run until released"""
+
+    def __init__(self, body: bytes = b'{"recipe": 1}', error: Exception = None):
+        self.body = body
+        self.error = error
+        self.runs = 0
+        self.released = asyncio.Event()
+        self.released.set()
+
+    def hold(self):
+        self.released.clear()
+
+    async def __call__(self) -> bytes:
+        self.runs += 1
+        await self.released.wait()
+        if self.error is not None:
+            raise self.error
+        return self.body
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch):
+    monkeypatch.setattr(idempotency, 'inflight_requests', {})
+    monkeypatch.setattr(idempotency, 'local_responses', OrderedDict())
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_POLL_SECONDS', 0.01)
+    monkeypatch.setattr(user_profile, 'redis_client', None)
+
+def test_duplicate_attaches_to_the_running_request():
+    async def scenario():
+        handler = Handler()
+        handler.hold()
+        first = asyncio.create_task(run_idempotent('key-1', SCOPE, PAYLOAD, handler))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(run_idempotent('key-1', SCOPE, PAYLOAD, handler))
+        await asyncio.sleep(0.01)
+        handler.released.set()
+        return handler, await first, await second
+
+    handler, first, second = asyncio.run(scenario())
+    assert handler.runs == 1
+    assert first == (handler.body, False)
+    assert second == (handler.body, True)
+
+def test_completed_response_is_replayed():
+    async def scenario():
+        handler = Handler()
+        first = await run_idempotent('key-1', SCOPE, PAYLOAD, handler)
+        replayed = await run_idempotent('key-1', SCOPE, PAYLOAD, Handler(b'{"recipe": 2}'))
+        return handler, first, replayed
+
+    handler, first, replayed = asyncio.run(scenario())
+    assert handler.runs == 1
+    assert first == (b'{"recipe": 1}', False)
+    assert replayed == (b'{"recipe": 1}', True)
+
+def test_key_reused_with_a_different_request_conflicts():
+    other_payload = {**PAYLOAD, 'user_id': 'user-2'}
+
+    async def scenario():
+        handler = Handler()
+        handler.hold()
+        running = asyncio.create_task(run_idempotent('key-1', SCOPE, PAYLOAD, handler))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as while_running:
+            await run_idempotent('key-1', SCOPE, other_payload, Handler())
+        handler.released.set()
+        await running
+        with pytest.raises(HTTPException) as once_stored:
+            await run_idempotent('key-1', SCOPE, other_payload, Handler())
+        return handler, while_running.value, once_stored.value
+
+    handler, while_running, once_stored = asyncio.run(scenario())
+    assert handler.runs == 1
+    assert while_running.status_code == 422
+    assert once_stored.status_code == 422
+
+def test_failed_request_runs_again_on_retry():
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await run_idempotent('key-1', SCOPE, PAYLOAD, Handler(error=RuntimeError("LLM down")))
+        return await run_idempotent('key-1', SCOPE, PAYLOAD, Handler())
+
+    assert asyncio.run(scenario()) == (b'{"recipe": 1}', False)
+
+def test_duplicate_on_another_worker_waits_for_the_stored_response(monkeypatch, fake_redis_url):
+    async def scenario():
+        monkeypatch.setattr(user_profile, 'redis_client', redis.from_url(fake_redis_url))
+        handler = Handler()
+        handler.hold()
+        first = asyncio.create_task(run_idempotent('key-1', SCOPE, PAYLOAD, handler))
+        await asyncio.sleep(0.05)
+        # Another worker only sees the pending marker in Redis, not this worker's task
+        monkeypatch.setattr(idempotency, 'inflight_requests', {})
+        second = asyncio.create_task(run_idempotent('key-1', SCOPE, PAYLOAD, handler))
+        await asyncio.sleep(0.05)
+        assert not second.done()
+        handler.released.set()
+        results = await first, await second
+        await user_profile.redis_client.aclose()
+        return handler, results
+
+    handler, (first, second) = asyncio.run(scenario())
+    assert handler.runs == 1
+    assert first == (handler.body, False)
+    assert second == (handler.body, True)
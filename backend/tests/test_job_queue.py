@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+import redis.asyncio as redis
+
+from services import job_queue, user_profile
+from services.job_queue import GENERATE_RECIPE, QUEUED, RUNNING, FAILED, QUEUE_KEY, PROCESSING_KEY, LEASES_KEY
+
+@pytest.fixture
+def run(monkeypatch, fake_redis_url):
+    """Run a scenario against an empty Redis fake with leases that run out at once"""
+    monkeypatch.setattr(job_queue, 'JOB_VISIBILITY_TIMEOUT_SECONDS', 0)
+    monkeypatch.setattr(job_queue, 'JOB_MAX_ATTEMPTS', 3)
+
+    def _run(scenario):
+        async def wrapper():
+            monkeypatch.setattr(user_profile, 'redis_client', redis.from_url(fake_redis_url))
+            try:
+                return await scenario(user_profile.redis_client)
+            finally:
+                await user_profile.redis_client.aclose()
+        return asyncio.run(wrapper())
+    return _run
+
+async def lists(client):
+    return (
+        [job_id.decode() for job_id in await client.lrange(QUEUE_KEY, 0, -1)],
+        [job_id.decode() for job_id in await client.lrange(PROCESSING_KEY, 0, -1)],
+        await client.zcard(LEASES_KEY)
+    )
+
+def test_retry_puts_the_job_back_on_the_queue(run):
+    async def scenario(client):
+        job_id = await job_queue.enqueue_job(GENERATE_RECIPE, {'user_id': 'user-1'})
+        job = await job_queue.claim_job()
+        assert job['status'] == RUNNING
+        await job_queue.fail_job(job_id, int(job['attempts']), "LLM down")
+        return job_id, await job_queue.get_job(job_id), await lists(client)
+
+    job_id, job, (queue, processing, leases) = run(scenario)
+    assert job['status'] == QUEUED
+    assert job['error'] == "LLM down"
+    assert (queue, processing, leases) == ([job_id], [], 0)
+
+def test_expired_lease_requeues_then_fails_after_max_attempts(run):
+    async def scenario(client):
+        job_id = await job_queue.enqueue_job(GENERATE_RECIPE, {'user_id': 'user-1'})
+        passes = []
+        for _ in range(job_queue.JOB_MAX_ATTEMPTS):
+            assert (await job_queue.claim_job())['id'] == job_id
+            await asyncio.sleep(0.01)
+            reaped = await job_queue.reap_expired_leases(set())
+            passes.append((reaped, (await job_queue.get_job(job_id))['status'], await lists(client)))
+        # Nothing left to claim or reap
+        assert await job_queue.claim_job() is None
+        assert await job_queue.reap_expired_leases(set()) == []
+        return job_id, passes, await job_queue.get_job(job_id)
+
+    job_id, passes, job = run(scenario)
+    for reaped, status, state in passes[:-1]:
+        assert reaped == [job_id]
+        assert status == QUEUED
+        assert state == ([job_id], [], 0)
+    reaped, status, state = passes[-1]
+    assert reaped == [job_id]
+    assert status == FAILED
+    assert state == ([], [], 0)
+    assert job['attempts'] == str(job_queue.JOB_MAX_ATTEMPTS)
+    assert job['error'] == "worker lease expired"
+
+def test_concurrent_reapers_requeue_a_job_once(run):
+    async def scenario(client):
+        job_id = await job_queue.enqueue_job(GENERATE_RECIPE, {'user_id': 'user-1'})
+        await job_queue.claim_job()
+        await asyncio.sleep(0.01)
+        results = await asyncio.gather(*(job_queue.reap_expired_leases(set()) for _ in range(4)))
+        return job_id, results, await lists(client)
+
+    job_id, results, state = run(scenario)
+    assert sorted(results) == [[], [], [], [job_id]]
+    assert state == ([job_id], [], 0)
+
+def test_finished_job_is_not_reaped(run):
+    async def scenario(client):
+        job_id = await job_queue.enqueue_job(GENERATE_RECIPE, {'user_id': 'user-1'})
+        await job_queue.claim_job()
+        await asyncio.sleep(0.01)
+        await job_queue.complete_job(job_id, b'{}')
+        return await job_queue.reap_expired_leases(set()), await lists(client)
+
+    reaped, state = run(scenario)
+    assert reaped == []
+    assert state == ([], [], 0)
+
+def test_unleased_job_is_requeued_on_the_second_pass(run):
+    async def scenario(client):
+        job_id = await job_queue.enqueue_job(GENERATE_RECIPE, {'user_id': 'user-1'})
+        # A worker that died between taking the job and leasing it
+        await client.lmove(QUEUE_KEY, PROCESSING_KEY, 'RIGHT', 'LEFT')
+        unleased = set()
+        first = await job_queue.reap_expired_leases(unleased)
+        second = await job_queue.reap_expired_leases(unleased)
+        return job_id, first, second, await lists(client)
+
+    job_id, first, second, state = run(scenario)
+    assert first == []
+    assert second == [job_id]
+    assert state == ([job_id], [], 0)
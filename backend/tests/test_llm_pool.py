@@ -0,0 +1,132 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import llm_pool, user_profile
+from services.llm_pool import PoolEndpoint, LLMPoolUnavailableError, choose_endpoint, create_chat_completion
+
+MESSAGES = [{'role': 'user', 'content': 'Dinner for two'}]
+
+class EndpointDown(Exception):
+    status_code = 503
+
+class BadRequest(Exception):
+    status_code = 400
+
+class FakeCompletions:
+    """Answers after delay seconds with a response naming the endpoint, or raises error"""
+
+    def __init__(self, name: str, delay: float = 0.0, error: Exception = None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(id=self.name, usage=None)
+
+def endpoint(name: str, tier: str = 'quality', **behavior) -> PoolEndpoint:
+    completions = FakeCompletions(name, **behavior)
+    return PoolEndpoint(name, f"{name}-deployment", client=SimpleNamespace(chat=SimpleNamespace(completions=completions)), tier=tier)
+
+@pytest.fixture(autouse=True)
+def isolated_pool(monkeypatch):
+    monkeypatch.setattr(llm_pool, 'pool_endpoints', [])
+    monkeypatch.setattr(llm_pool, 'FAILURE_THRESHOLD', 3)
+    monkeypatch.setattr(llm_pool, 'COOLDOWN_SECONDS', 0.05)
+    monkeypatch.setattr(user_profile, 'redis_client', None)
+
+def test_circuit_opens_half_opens_and_closes(monkeypatch):
+    flaky = endpoint('flaky', error=EndpointDown("unavailable"))
+    monkeypatch.setattr(llm_pool, 'pool_endpoints', [flaky])
+    completions = flaky.client.chat.completions
+
+    async def scenario():
+        for _ in range(llm_pool.FAILURE_THRESHOLD):
+            with pytest.raises(EndpointDown):
+                await create_chat_completion(MESSAGES)
+        assert flaky.stats()['circuit'] == 'open'
+        # Open: nothing is sent until the cooldown has passed
+        with pytest.raises(LLMPoolUnavailableError):
+            await create_chat_completion(MESSAGES)
+        assert completions.calls == llm_pool.FAILURE_THRESHOLD
+
+        # Half-open: one probe at a time, and a failed probe opens the circuit again
+        await asyncio.sleep(llm_pool.COOLDOWN_SECONDS)
+        completions.delay = 0.05
+        probe = asyncio.create_task(create_chat_completion(MESSAGES))
+        await asyncio.sleep(0.01)
+        assert choose_endpoint() is None
+        with pytest.raises(EndpointDown):
+            await probe
+        assert choose_endpoint() is None
+
+        # A successful probe closes it
+        await asyncio.sleep(llm_pool.COOLDOWN_SECONDS)
+        completions.error = None
+        response = await create_chat_completion(MESSAGES)
+        assert response.id == 'flaky'
+        assert flaky.stats()['circuit'] == 'closed'
+        assert flaky.consecutive_failures == 0
+
+    asyncio.run(scenario())
+
+def test_client_errors_do_not_open_the_circuit(monkeypatch):
+    primary = endpoint('primary', error=BadRequest("content filtered"))
+    other = endpoint('other')
+    monkeypatch.setattr(llm_pool, 'pool_endpoints', [primary, other])
+    monkeypatch.setattr(llm_pool, 'choose_endpoint', lambda exclude=None, tier=None: other if exclude else primary)
+
+    async def scenario():
+        for _ in range(llm_pool.FAILURE_THRESHOLD + 2):
+            with pytest.raises(BadRequest):
+                await create_chat_completion(MESSAGES)
+
+    asyncio.run(scenario())
+    assert primary.stats()['circuit'] == 'closed'
+    assert primary.failure_count == 0
+    # Raised as it is: no failover to the other endpoint
+    assert other.client.chat.completions.calls == 0
+
+def test_hedge_fires_after_primary_p95(monkeypatch):
+    monkeypatch.setattr(llm_pool, 'HEDGE_ENABLED', True)
+    monkeypatch.setattr(llm_pool, 'HEDGE_MIN_SAMPLES', 5)
+    primary = endpoint('primary', tier='quality', delay=1.0)
+    secondary = endpoint('secondary', tier='fast')
+    primary.latencies.extend([0.02] * 10)
+    monkeypatch.setattr(llm_pool, 'pool_endpoints', [primary, secondary])
+
+    started = time.perf_counter()
+    response = asyncio.run(create_chat_completion(MESSAGES, tier='quality'))
+    elapsed = time.perf_counter() - started
+
+    assert response.id == 'secondary'
+    assert elapsed < 0.5
+    assert primary.client.chat.completions.calls == 1
+    # The losing primary is cancelled and not held against its circuit
+    assert primary.client.chat.completions.cancelled == 1
+    assert primary.failure_count == 0
+
+def test_no_hedge_when_primary_answers_within_p95(monkeypatch):
+    monkeypatch.setattr(llm_pool, 'HEDGE_ENABLED', True)
+    monkeypatch.setattr(llm_pool, 'HEDGE_MIN_SAMPLES', 5)
+    primary = endpoint('primary', tier='quality', delay=0.01)
+    secondary = endpoint('secondary', tier='fast')
+    primary.latencies.extend([0.2] * 10)
+    monkeypatch.setattr(llm_pool, 'pool_endpoints', [primary, secondary])
+
+    response = asyncio.run(create_chat_completion(MESSAGES, tier='quality'))
+
+    assert response.id == 'primary'
+    assert secondary.client.chat.completions.calls == 0
@@ -0,0 +1 @@
+# Background worker processes for ITC Yippee Recipe Generator 
\ No newline at end of file
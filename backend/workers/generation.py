@@ -0,0 +1,138 @@
+"""
+Recipe generation worker.
+
+Runs the same pipeline as POST /api/generate-recipe for jobs queued through
+POST /api/jobs/generate-recipe, so generation capacity scales with the
+number of worker processes rather than API pods. Each process runs
+JOB_WORKER_CONCURRENCY jobs at a time and renews their leases while they
+run. On SIGTERM it stops claiming and finishes what it has; jobs of a
+process that dies are handed to another worker once their lease runs out.
+
+    python -m workers.generation
+    python -m workers.generation --concurrency 8
+"""
+import os
+import signal
+import asyncio
+import logging
+import argparse
+from typing import Dict, Any, Callable, Awaitable
+
+from fastapi import HTTPException
+
+from models.recipe import RecipeGenerationRequest
+from api.recipes import build_generation_response
+from services import job_queue, user_profile
+from services.cosmos_metrics import current_route
+from services.database import init_cosmos_db
+from services.monitoring import setup_monitoring
+from services.ai_integrations import init_ai_clients
+from services.llm_pool import close_llm_pool
+
+logger = logging.getLogger(__name__)
+
+# Jobs each worker process runs at once
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '4'))
+
+# How long an idle worker waits before checking the queue again
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '0.5'))
+
+# How long a job waits for the LLM before degrading to a catalog recipe; 0 waits for it
+JOB_LATENCY_BUDGET_SECONDS = float(os.getenv('JOB_LATENCY_BUDGET_SECONDS', '0'))
+
+async def _generate_recipe(payload: Dict[str, Any]) -> bytes:
+    # No client is waiting on the HTTP budget, so RECIPE_LATENCY_BUDGET_MS does not apply
+    return await build_generation_response(RecipeGenerationRequest(**payload), latency_budget=JOB_LATENCY_BUDGET_SECONDS or None)
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[bytes]]] = {
+    job_queue.GENERATE_RECIPE: _generate_recipe
+}
+
+async def _keep_lease(job_id: str):
+    while True:
+        await asyncio.sleep(job_queue.JOB_VISIBILITY_TIMEOUT_SECONDS / 3)
+        try:
+            await job_queue.renew_lease(job_id)
+        except Exception as e:
+            logger.warning(f"Failed to renew lease for job {job_id}: {e}")
+
+async def run_job(job: Dict[str, Any]):
+    job_id = job['id']
+    attempts = int(job['attempts'])
+    lease = asyncio.create_task(_keep_lease(job_id))
+    current_route.set(f"job:{job['kind']}")
+    try:
+        handler = JOB_HANDLERS[job['kind']]
+        result = await handler(job_queue.decode_request(job))
+    except Exception as e:
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Job {job_id} attempt {attempts} failed: {error}")
+        # Client errors, such as a spent AI token budget, would fail the same way on a retry
+        final = isinstance(e, HTTPException) and e.status_code < 500
+        await job_queue.fail_job(job_id, job_queue.JOB_MAX_ATTEMPTS if final else attempts, error)
+    else:
+        await job_queue.complete_job(job_id, result)
+        logger.info(f"Job {job_id} succeeded on attempt {attempts}")
+    finally:
+        lease.cancel()
+
+async def _wait(stop: asyncio.Event, seconds: float):
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+
+async def _work(stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            job = await job_queue.claim_job()
+        except Exception as e:
+            logger.error(f"Failed to claim a job: {e}")
+            job = None
+        if job is None:
+            await _wait(stop, JOB_POLL_SECONDS)
+            continue
+        await run_job(job)
+
+async def _reap(stop: asyncio.Event):
+    unleased = set()
+    while not stop.is_set():
+        try:
+            reaped = await job_queue.reap_expired_leases(unleased)
+            if reaped:
+                logger.info(f"Requeued {len(reaped)} jobs whose worker stopped renewing their lease")
+        except Exception as e:
+            logger.error(f"Lease reaping failed: {e}")
+        await _wait(stop, job_queue.JOB_VISIBILITY_TIMEOUT_SECONDS / 2)
+
+async def run_worker(concurrency: int):
+    setup_monitoring()
+    await init_cosmos_db()
+    init_ai_clients()
+    await user_profile.init_redis()
+    if not user_profile.redis_client:
+        raise SystemExit("Redis is not configured; the job queue needs it")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    logger.info(f"Generation worker {os.getpid()} running {concurrency} jobs at a time")
+    await asyncio.gather(_reap(stop), *(_work(stop) for _ in range(concurrency)))
+    logger.info("Generation worker stopped")
+
+    await close_llm_pool()
+    await user_profile.close_redis()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued recipe generation jobs")
+    parser.add_argument('--concurrency', type=int, default=JOB_WORKER_CONCURRENCY, help="Jobs run at once by this process")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('azure').setLevel(logging.WARNING)
+    asyncio.run(run_worker(args.concurrency))
+
+if __name__ == '__main__':
+    main()